@@ -10,7 +10,6 @@
 # Core libraries
 import builtins
 from collections import namedtuple
-from gzip import open as gzopen
 from os import makedirs
 from os.path import dirname
 import re
@@ -21,9 +20,14 @@ import khmer
 import screed
 
 # Internal modules
+from kevlar import pipeio
+from kevlar import kmercode
 from kevlar import seqio
 from kevlar import overlap
 from kevlar import sketch
+from kevlar import mmsketch
+from kevlar import zsketch
+from kevlar import maskcache
 from kevlar.mutablestring import MutableString
 from kevlar.readgraph import ReadGraph
 from kevlar.seqio import parse_augmented_fastx, print_augmented_fastx
@@ -35,11 +39,17 @@ from kevlar.timer import Timer
 from kevlar import dump
 from kevlar import novel
 from kevlar import filter
+from kevlar import banded
 from kevlar import reaugment
 from kevlar import mutate
 from kevlar import assemble
 from kevlar import count
 from kevlar import effcount
+from kevlar import union
+from kevlar import sketchinfo
+from kevlar import serve
+from kevlar import prefilter
+from kevlar import checkpoint
 from kevlar import partition
 from kevlar import localize
 from kevlar import call
@@ -63,11 +73,9 @@ def open(filename, mode):
     if filename in ['-', None]:
         filehandle = sys.stdin if mode == 'r' else sys.stdout
         return filehandle
-    openfunc = builtins.open
     if filename.endswith('.gz'):
-        openfunc = gzopen
-        mode += 't'
-    return openfunc(filename, mode)
+        return pipeio.open(filename, mode)
+    return builtins.open(filename, mode)
 
 
 def mkdirp(path, trim=False):
@@ -102,10 +110,31 @@ def to_gml(graph, outfilename, logfile=sys.stderr):
     print(message, file=logfile)
 
 
+def parse_fastx(filehandle):
+    """Parse FASTA/FASTQ records from an open file with screed's parsers."""
+    firstline = filehandle.readline()
+    if firstline.startswith('@'):
+        parser = screed.fastq.fastq_iter
+    elif firstline.startswith('>'):
+        parser = screed.fasta.fasta_iter
+    elif firstline.strip() == '':
+        return
+    else:
+        raise ValueError('unable to determine format of sequence file')
+    for record in parser(filehandle, line=firstline):
+        yield record
+
+
 def multi_file_iter_screed(filenames):
     for filename in filenames:
-        for record in screed.open(filename):
-            yield record
+        if not filename.endswith('.gz'):
+            for record in screed.open(filename):
+                yield record
+            continue
+        # Decompress gzip input on background threads.
+        with open(filename, 'r') as filehandle:
+            for record in parse_fastx(filehandle):
+                yield record
 
 
 def multi_file_iter_khmer(filenames):
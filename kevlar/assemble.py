@@ -64,7 +64,8 @@ def assemble_jca(readstream, memory, maxfpr=0.01, collapse=True,
     print(msg, file=logstream)
 
     asm = khmer.JunctionCountAssembler(countgraph)
-    for kmer in variants.kmers:
+    for kmercode in variants.kmers:
+        kmer = variants.kmer_sequence(kmercode)
         if kmer in kmers_to_ignore:
             continue
         contigs = asm.assemble(kmer)
@@ -221,8 +222,9 @@ def assemble_with_greed(graph, ccindex, debugout=None):
                   pair.overlap, pair.sameorient, file=debugout)
             kevlar.print_augmented_fastx(newrecord, debugout)
         for kmer in newrecord.ikmers:
-            kmerseq = kevlar.revcommin(kmer.sequence)
-            for readname in graph.ikmers[kmerseq]:
+            kmercode = kevlar.kmercode.canonical(kmer.sequence)
+            kmerseq = None
+            for readname in graph.ikmers[kmercode]:
                 already_merged = readname not in graph
                 current_contig = readname in [
                     pair.tail.name, pair.head.name, newname
@@ -230,6 +232,9 @@ def assemble_with_greed(graph, ccindex, debugout=None):
                 if already_merged or current_contig:
                     continue
                 otherrecord = graph.get_record(readname)
+                if kmerseq is None:
+                    kmerseq = kevlar.kmercode.decode(kmercode,
+                                                     len(kmer.sequence))
                 newpair = kevlar.overlap.calc_offset(
                     newrecord, otherrecord, kmerseq, debugout
                 )
@@ -245,7 +250,7 @@ def assemble_with_greed(graph, ccindex, debugout=None):
                                    overlap=newpair.overlap, ikmer=kmerseq,
                                    orient=newpair.sameorient, tail=tn,
                                    swapped=newpair.swapped)
-            graph.ikmers[kmerseq].add(newrecord.name)
+            graph.ikmers[kmercode].add(newrecord.name)
         graph.add_node(newrecord.name, record=newrecord)
         graph.remove_node(pair.tail.name)
         graph.remove_node(pair.head.name)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+from functools import partial
+import io
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import sys
+import kevlar
+
+
+def band_job(band, numbands, case, controls, ksize=31, memory=1e6,
+             maxfpr=0.2, casemin=5, ctrlmax=0, abundscreen=None):
+    """
+    Compute k-mer abundances and find novel reads for a single band.
+
+    Runs in a worker process. Case and control k-mer abundances for the
+    (0-based) `band` are computed in memory, without writing any sketch files,
+    and the case reads are then scanned for interesting k-mers in that band.
+
+    Returns the band, the interesting reads in augmented Fastq format, the
+    number of interesting reads, the log messages of the job, and the time
+    spent computing k-mer abundances and scanning case reads.
+    """
+    logstream = io.StringIO()
+    timer = kevlar.Timer()
+    timer.start('count')
+    controlcounts = kevlar.novel.load_samples(
+        None, controls, ksize=ksize, memory=memory, maxfpr=maxfpr,
+        numbands=numbands, band=band, logstream=logstream
+    )
+    casecounts = kevlar.novel.load_samples(
+        None, case, ksize=ksize, memory=memory, maxfpr=maxfpr,
+        numbands=numbands, band=band, logstream=logstream
+    )
+    counttime = timer.stop('count')
+
+    timer.start('novel')
+    infiles = [f for filelist in case for f in filelist]
+    readstream = kevlar.novel.novel(
+        kevlar.multi_file_iter_screed(infiles), casecounts, controlcounts,
+        ksize=ksize, abundscreen=abundscreen, casemin=casemin,
+        ctrlmax=ctrlmax, numbands=numbands, band=band, logstream=logstream
+    )
+    output = io.StringIO()
+    nreads = 0
+    for record in readstream:
+        kevlar.print_augmented_fastx(record, output)
+        nreads += 1
+    scantime = timer.stop('novel')
+    return (band, output.getvalue(), nreads, logstream.getvalue(), counttime,
+            scantime)
+
+
+def concurrent_bands(numsamples, memory, membudget=None, numjobs=1):
+    """
+    Determine how many bands can be processed concurrently.
+
+    Each band requires `memory` bytes for each of `numsamples` samples, and
+    at most `numjobs` bands are processed at once. If `membudget` is given,
+    the number of concurrent bands is further limited so that their sketches
+    fit within the budget (but at least one band is always processed).
+    """
+    if membudget:
+        numjobs = min(numjobs, int(membudget // (numsamples * memory)))
+    return max(1, numjobs)
+
+
+def band_pool(numjobs):
+    """
+    Create a pool of `numjobs` workers for processing bands.
+
+    Worker processes are forked, which is only safe if no background threads
+    are running in the parent, in particular before compressed files are
+    opened with `kevlar.open` (see `kevlar.pipeio`). On platforms that do not
+    support forking, a pool of threads is used instead.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork').Pool(numjobs)
+    else:  # pragma: no cover
+        return ThreadPool(numjobs)
+
+
+def banded(case, controls, numbands, ksize=31, memory=1e6, membudget=None,
+           numjobs=1, maxfpr=0.2, casemin=5, ctrlmax=0, abundscreen=None,
+           pool=None, logstream=sys.stderr):
+    """
+    Run the k-mer counting and novel k-mer steps for every band.
+
+    Each band is processed by a separate job (see `band_job`), and jobs are
+    distributed to a pool of worker processes, limited by `numjobs` and the
+    total memory budget `membudget` (see `concurrent_bands`). The `case` and
+    `controls` arguments are lists of FASTA/FASTQ file lists, one list per
+    sample.
+
+    Interesting reads are yielded band by band, as soon as each band is done,
+    so that they can be fed directly into `kevlar.filter.filter` without any
+    intermediate files. A read with interesting k-mers in several bands is
+    yielded once per band. The time spent on each band is reported once all
+    bands are done.
+
+    Unless a pool is provided with `pool` (see `band_pool`, sized with
+    `concurrent_bands`), worker processes are forked when the first read is
+    requested, and terminated once all bands are done. Forking is only safe
+    if no background threads are running at that point, such as those started
+    by `kevlar.open` for compressed files; create the pool beforehand
+    otherwise. A provided pool is left open for the caller to close.
+    """
+    numsamples = len(case) + len(controls)
+    njobs = concurrent_bands(numsamples, memory, membudget, numjobs)
+    message = 'processing {:d} bands, {:d} at a time'.format(numbands, njobs)
+    print('[kevlar::banded]', message, file=logstream)
+
+    job = partial(
+        band_job, numbands=numbands, case=case, controls=controls,
+        ksize=ksize, memory=memory, maxfpr=maxfpr, casemin=casemin,
+        ctrlmax=ctrlmax, abundscreen=abundscreen
+    )
+    ownpool = pool is None
+    if ownpool:
+        pool = band_pool(njobs)
+
+    timings = dict()
+    try:
+        for result in pool.imap_unordered(job, range(numbands)):
+            band, augfastq, nreads, joblog, counttime, scantime = result
+            timings[band] = (counttime, scantime)
+            print(joblog, end='', file=logstream)
+            message = 'band {:d}/{:d} done'.format(band + 1, numbands)
+            message += ': {:d} reads with interesting k-mers'.format(nreads)
+            print('[kevlar::banded]', message, file=logstream)
+            for record in kevlar.parse_augmented_fastx(io.StringIO(augfastq)):
+                yield record
+    finally:
+        if ownpool:
+            pool.terminate()
+            pool.join()
+
+    print('[kevlar::banded] Per-band timings:', file=logstream)
+    for band in sorted(timings):
+        counttime, scantime = timings[band]
+        message = '    band {:d}: '.format(band + 1)
+        message += 'counting {:.2f} sec'.format(counttime)
+        message += ', scanning {:.2f} sec'.format(scantime)
+        print(message, file=logstream)
+
+
+def main(args):
+    timer = kevlar.Timer()
+    timer.start()
+
+    # Fork the workers before any background threads are started, either to
+    # load the mask or to write compressed output.
+    numsamples = len(args.case) + len(args.control)
+    pool = band_pool(concurrent_bands(numsamples, args.memory,
+                                      args.memory_budget, args.threads))
+    try:
+        mask = kevlar.filter.load_mask(
+            args.mask, args.ksize, args.mask_memory,
+            maxfpr=args.mask_max_fpr, logstream=args.logfile
+        )
+        readstream = banded(
+            args.case, args.control, args.num_bands, ksize=args.ksize,
+            memory=args.memory, membudget=args.memory_budget,
+            numjobs=args.threads, maxfpr=args.max_fpr, casemin=args.case_min,
+            ctrlmax=args.ctrl_max, abundscreen=args.abund_screen, pool=pool,
+            logstream=args.logfile
+        )
+        filterstream = kevlar.filter.filter(
+            readstream, mask, minabund=args.case_min, ksize=args.ksize,
+            memory=args.abund_memory, maxfpr=args.abund_max_fpr,
+            logstream=args.logfile
+        )
+        outstream = kevlar.open(args.out, 'w')
+        for record in filterstream:
+            kevlar.print_augmented_fastx(record, outstream)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    total = timer.stop()
+    message = 'Total time: {:.2f} seconds'.format(total)
+    print('[kevlar::banded]', message, file=args.logfile)
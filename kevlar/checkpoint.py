@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import builtins
+import gzip
+import json
+import os
+import sys
+import pysam
+import screed
+
+
+class KevlarCheckpointError(ValueError):
+    pass
+
+
+def is_bgzf(filename):
+    """
+    Determine whether a file is BGZF-compressed (blocked gzip).
+
+    BGZF files are valid gzip files whose header contains a "BC" extra field.
+    Unlike regular gzip files, they support random access by virtual offset.
+    """
+    with builtins.open(filename, 'rb') as fh:
+        header = fh.read(16)
+    return (
+        len(header) == 16 and header[:4] == b'\x1f\x8b\x08\x04' and
+        header[12:14] == b'BC'
+    )
+
+
+def open_seekable(filename):
+    """
+    Open a FASTA/FASTQ file for reading in binary mode with `tell`/`seek`.
+
+    - BGZF files: positions are BGZF virtual offsets, and seeking is fast
+    - other gzip files: positions are offsets into the uncompressed data, and
+      seeking requires decompressing (but not parsing) all preceding data
+    - uncompressed files: positions are byte offsets, and seeking is fast
+    """
+    if filename.endswith('.gz'):
+        if is_bgzf(filename):
+            return pysam.BGZFile(filename, 'rb')
+        return gzip.open(filename, 'rb')
+    return builtins.open(filename, 'rb')
+
+
+def parse_fastx(filehandle, fileindex=0):
+    """
+    Parse FASTA/FASTQ records from a binary file handle, tracking positions.
+
+    Each record yielded has a `position` attribute: a tuple of the file index
+    and the position (as reported by `filehandle.tell()`) immediately after
+    the record, from which parsing can be resumed. FASTQ records must span 4
+    lines; FASTA records may span multiple lines.
+    """
+    def readline():
+        return filehandle.readline().rstrip(b'\r\n').decode('ascii')
+
+    line = readline()
+    if line.startswith('@'):
+        while line.startswith('@'):
+            name = line[1:]
+            sequence = readline()
+            readline()
+            quality = readline()
+            record = screed.Record(name=name, sequence=sequence,
+                                   quality=quality)
+            record.position = (fileindex, filehandle.tell())
+            yield record
+            line = readline()
+    elif line.startswith('>'):
+        while line.startswith('>'):
+            name = line[1:]
+            subseqs = list()
+            position = filehandle.tell()
+            line = readline()
+            while line != '' and not line.startswith('>'):
+                subseqs.append(line)
+                position = filehandle.tell()
+                line = readline()
+            record = screed.Record(name=name, sequence=''.join(subseqs))
+            record.position = (fileindex, position)
+            yield record
+    elif line != '':
+        message = 'unable to parse FASTA/FASTQ record: ' + line
+        raise KevlarCheckpointError(message)
+
+
+def multi_file_iter_positions(filenames, start=None):
+    """
+    Parse records from a list of FASTA/FASTQ files, tracking positions.
+
+    If `start` is provided, it is a tuple of (file index, position) as stored
+    in the `position` attribute of the records, and parsing resumes from that
+    point.
+    """
+    startindex, startpos = start if start else (0, 0)
+    for fileindex, filename in enumerate(filenames):
+        if fileindex < startindex:
+            continue
+        with open_seekable(filename) as fh:
+            if fileindex == startindex and startpos > 0:
+                fh.seek(startpos)
+            for record in parse_fastx(fh, fileindex):
+                yield record
+
+
+def load(filename):
+    """Load the state stored in a checkpoint file."""
+    with builtins.open(filename, 'r') as fh:
+        return json.load(fh)
+
+
+def check_resumable(outfiles):
+    """Ensure that output can be appended to when resuming a run."""
+    for outfile in outfiles:
+        if outfile in (None, '-'):
+            message = 'checkpointing requires output to be written to a file'
+            raise KevlarCheckpointError(message)
+        if outfile.endswith('.gz'):
+            message = 'checkpointing requires uncompressed output, cannot '
+            message += 'resume writing to ' + outfile
+            raise KevlarCheckpointError(message)
+
+
+def resume(filename, infiles, outfiles):
+    """
+    Prepare to resume a run from the specified checkpoint file.
+
+    The input and output files must match those recorded in the checkpoint.
+    Each output file is truncated to the length it had when the checkpoint was
+    written, and opened for appending. Returns the checkpoint state and a list
+    of output file handles.
+    """
+    state = load(filename)
+    if state['infiles'] != list(infiles):
+        message = 'input files do not match those of checkpoint ' + filename
+        raise KevlarCheckpointError(message)
+    if state['outfiles'] != list(outfiles):
+        message = 'output files do not match those of checkpoint ' + filename
+        raise KevlarCheckpointError(message)
+    outstreams = list()
+    for outfile, outpos in zip(outfiles, state['outpos']):
+        os.truncate(outfile, outpos)
+        outstreams.append(builtins.open(outfile, 'a'))
+    return state, outstreams
+
+
+class Checkpointer(object):
+    """
+    Periodically record the progress of a run in a checkpoint file.
+
+    The checkpointer is called with each record after it has been completely
+    processed (and any corresponding output written). Every `interval`
+    records, all output streams are flushed and the position of the input and
+    output streams is written to the checkpoint file. The checkpoint file is
+    replaced atomically, so it is always consistent even if the run crashes.
+    """
+    def __init__(self, filename, infiles, outfiles, outstreams,
+                 interval=1000000, nreads=0, logstream=sys.stderr):
+        self.filename = filename
+        self.infiles = list(infiles)
+        self.outfiles = list(outfiles)
+        self.outstreams = outstreams
+        self.interval = interval
+        self.nreads = nreads
+        self.logstream = logstream
+        self._pending = 0
+        self._position = None
+
+    def __call__(self, record):
+        self.nreads += 1
+        self._pending += 1
+        self._position = record.position
+        if self._pending >= self.interval:
+            self.save(record.position)
+
+    def finish(self):
+        """Record the final position at the end of a run."""
+        if self._pending > 0:
+            self.save(self._position)
+
+    def save(self, position):
+        fileindex, offset = position
+        outpos = list()
+        for outstream in self.outstreams:
+            outstream.flush()
+            outpos.append(outstream.tell())
+        state = {
+            'infiles': self.infiles,
+            'outfiles': self.outfiles,
+            'fileindex': fileindex,
+            'offset': offset,
+            'outpos': outpos,
+            'nreads': self.nreads,
+        }
+        tempfile = self.filename + '.tmp'
+        with builtins.open(tempfile, 'w') as fh:
+            json.dump(state, fh)
+        os.replace(tempfile, self.filename)
+        self._pending = 0
+        message = 'checkpoint saved after {:d} reads'.format(self.nreads)
+        print('[kevlar::checkpoint]', message, file=self.logstream)
@@ -14,8 +14,12 @@ import kevlar
 from . import dump
 from . import count
 from . import effcount
+from . import union
+from . import sketchinfo
+from . import serve
 from . import novel
 from . import filter
+from . import banded
 from . import reaugment
 from . import assemble
 from . import mutate
@@ -30,8 +34,12 @@ mains = {
     'dump': kevlar.dump.main,
     'count': kevlar.count.main,
     'effcount': kevlar.effcount.main,
+    'union': kevlar.union.main,
+    'sketch-info': kevlar.sketchinfo.main,
+    'serve': kevlar.serve.main,
     'novel': kevlar.novel.main,
     'filter': kevlar.filter.main,
+    'banded': kevlar.banded.main,
     'reaugment': kevlar.reaugment.main,
     'assemble': kevlar.assemble.main,
     'mutate': kevlar.mutate.main,
@@ -47,8 +55,12 @@ subparser_funcs = {
     'dump': dump.subparser,
     'count': count.subparser,
     'effcount': effcount.subparser,
+    'union': union.subparser,
+    'sketch-info': sketchinfo.subparser,
+    'serve': serve.subparser,
     'novel': novel.subparser,
     'filter': filter.subparser,
+    'banded': banded.subparser,
     'reaugment': reaugment.subparser,
     'assemble': assemble.subparser,
     'mutate': mutate.subparser,
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import argparse
+import textwrap
+from khmer import khmer_args
+
+
+def subparser(subparsers):
+    """Define the `kevlar banded` command-line interface."""
+
+    desc = """\
+    Run a banded analysis (see `kevlar count`, `kevlar novel`, and
+    `kevlar filter`) with a single command. For each of N bands, k-mer
+    abundances are computed for the case and control samples and the case
+    reads are scanned for interesting k-mers in that band. Bands are processed
+    in parallel by a pool of worker processes, as many at a time as fit in the
+    memory budget, and the interesting reads of each band are passed directly
+    to the filtering step without writing intermediate files. The time spent
+    on each band is reported."""
+    desc = textwrap.dedent(desc)
+    epilog = """\
+    Example::
+
+        kevlar banded --num-bands 8 --memory 4G --memory-budget 48G \\
+            --threads 4 --case proband.fq.gz --control father.fq.gz \\
+            --control mother.fq.gz --mask refr.fa --out novel.augfastq.gz"""
+    epilog = textwrap.dedent(epilog)
+    subparser = subparsers.add_parser(
+        'banded', description=desc, epilog=epilog, add_help=False,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    samp_args = subparser.add_argument_group('Case/control config')
+    samp_args.add_argument(
+        '--case', metavar='F', nargs='+', required=True, action='append',
+        help='one or more FASTA/FASTQ files containing reads from a case '
+        'sample; can be declared multiple times corresponding to multiple '
+        'case samples'
+    )
+    samp_args.add_argument(
+        '--control', metavar='F', nargs='+', required=True, action='append',
+        help='one or more FASTA/FASTQ files containing reads from a control '
+        'sample; can be declared multiple times corresponding to multiple '
+        'control samples'
+    )
+    samp_args.add_argument(
+        '-x', '--ctrl-max', metavar='X', type=int, default=1,
+        help='k-mers with abund > X in any control sample are uninteresting; '
+        'default is X=1'
+    )
+    samp_args.add_argument(
+        '-y', '--case-min', metavar='Y', type=int, default=5,
+        help='k-mers with abund < Y in any case sample are uninteresting; '
+        'default is Y=5'
+    )
+    samp_args.add_argument(
+        '--abund-screen', type=int, default=None, metavar='INT',
+        help='discard reads with any k-mers whose abundance is < INT'
+    )
+    samp_args.add_argument(
+        '-M', '--memory', default='1e6', type=khmer_args.memory_setting,
+        metavar='MEM', help='memory allocated to k-mer abundances for each '
+        'sample in each band; default is 1M'
+    )
+    samp_args.add_argument(
+        '--max-fpr', type=float, default=0.2, metavar='FPR',
+        help='terminate if the expected false positive rate for any sample is '
+        'higher than the specified FPR; default is 0.2'
+    )
+
+    band_args = subparser.add_argument_group('K-mer banding')
+    band_args.add_argument(
+        '--num-bands', type=int, metavar='N', required=True,
+        help='number of bands into which to divide the hashed k-mer space'
+    )
+    band_args.add_argument(
+        '--memory-budget', type=khmer_args.memory_setting, default=None,
+        metavar='MEM', help='total memory available for k-mer abundances; '
+        'limits the number of bands processed at once, since each band '
+        'requires --memory for each sample; by default, only --threads '
+        'limits the number of bands processed at once'
+    )
+    band_args.add_argument(
+        '-t', '--threads', type=int, default=1, metavar='T',
+        help='maximum number of bands to process at once, each in a separate '
+        'worker process; default is 1'
+    )
+
+    mask_args = subparser.add_argument_group('Filtering')
+    mask_args.add_argument(
+        '--mask', metavar='FA', type=str, default=None, nargs='+',
+        help='sequences to mask (reference genomes, contaminants); see '
+        '`kevlar filter --mask`'
+    )
+    mask_args.add_argument(
+        '--mask-memory', metavar='MEM', default='1e9',
+        type=khmer_args.memory_setting, help='memory to allocate for storing '
+        'the mask; default is 1G'
+    )
+    mask_args.add_argument(
+        '--mask-max-fpr', type=float, metavar='FPR', default=0.001,
+        help='terminate if the expected false positive rate of the mask is '
+        'higher than the specified FPR; default is 0.001'
+    )
+    mask_args.add_argument(
+        '--abund-memory', metavar='MEM', default='1e6',
+        type=khmer_args.memory_setting, help='memory to allocate for '
+        're-calculating abundance of interesting k-mers; default is 1M'
+    )
+    mask_args.add_argument(
+        '--abund-max-fpr', type=float, metavar='FPR', default=0.001,
+        help='terminate if the expected false positive rate of re-calculated '
+        'abundances is higher than the specified FPR; default is 0.001'
+    )
+
+    misc_args = subparser.add_argument_group('Miscellaneous settings')
+    misc_args.add_argument('-h', '--help', action='help',
+                           help='show this help message and exit')
+    misc_args.add_argument('-k', '--ksize', type=int, default=31, metavar='K',
+                           help='k-mer size; default is 31')
+    misc_args.add_argument('-o', '--out', metavar='FILE',
+                           help='output file (in augmented Fastq format); '
+                           'default is terminal (stdout)')
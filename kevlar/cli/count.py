@@ -19,6 +19,9 @@ def subparser(subparsers):
     desc = """\
     Compute k-mer abundances for the provided sample. Supports k-mer banding:
     see http://kevlar.readthedocs.io/en/latest/banding.html for more details.
+    With "--bands" or "--all-bands", the count tables for several bands are
+    computed with a single command, and with "--single-pass" with a single
+    pass over the input.
     """
     desc = textwrap.dedent(desc)
 
@@ -31,7 +34,13 @@ def subparser(subparsers):
 
         kevlar count --ksize 25 --memory 12G --max-fpr 0.01 --threads 8 \\
             proband.counttable \\
-            proband-R1.fq.gz proband-R2.fq.gz proband-unpaired.fq.gz"""
+            proband-R1.fq.gz proband-R2.fq.gz proband-unpaired.fq.gz
+
+    Example::
+
+        kevlar count --ksize 25 --memory 2G --num-bands 16 --all-bands \\
+            --single-pass --band-memory 16G \\
+            proband.band{band}.counttable proband.fq.gz"""
     epilog = textwrap.dedent(epilog)
 
     subparser = subparsers.add_parser(
@@ -48,19 +57,75 @@ def subparser(subparsers):
                            metavar='FPR', help='terminate if the estimated '
                            'false positive rate for any sample is higher than '
                            '"FPR"; default is 0.2')
+    subparser.add_argument('--auto-size', action='store_true',
+                           help='treat MEM as a memory budget: estimate the '
+                           'number of distinct k-mers with a HyperLogLog '
+                           'pre-pass over the input, and choose the table '
+                           'size and number of tables expected to achieve the '
+                           'false positive rate specified by --target-fpr '
+                           'using as little of MEM as possible')
+    subparser.add_argument('--auto-size-sample', type=int, metavar='N',
+                           default=None, help='with --auto-size, estimate '
+                           'the number of distinct k-mers from the first N '
+                           'reads of each input file and extrapolate to the '
+                           'entire input; by default, all reads are used')
+    subparser.add_argument('--target-fpr', type=float, default=0.05,
+                           metavar='FPR', help='target false positive rate '
+                           'for --auto-size; default is 0.05')
     subparser.add_argument('--num-bands', type=int, metavar='N', default=None,
                            help='number of bands into which to divide the '
                            'hashed k-mer space')
     subparser.add_argument('--band', type=int, metavar='I', default=None,
                            help='a number between 1 and N (inclusive) '
                            'indicating the band to be processed')
+    subparser.add_argument('--bands', type=int, metavar='I', nargs='+',
+                           default=None, help='count several bands (each a '
+                           'number between 1 and N, inclusive), one after the '
+                           'other; the output file name must contain a '
+                           '"{band}" placeholder, which is replaced by the '
+                           'band number')
+    subparser.add_argument('--all-bands', action='store_true',
+                           help='count all N bands, as with --bands')
+    subparser.add_argument('--single-pass', action='store_true',
+                           help='with --bands or --all-bands, count all bands '
+                           'with a single pass over the input instead of one '
+                           'pass per band; this saves reading and '
+                           'decompressing the input for every band, but '
+                           'k-mers are counted in Python rather than by '
+                           'khmer, which is much slower per k-mer and does '
+                           'not scale with --threads; use it only when '
+                           'reading the input is the bottleneck, such as '
+                           'input on slow network storage')
+    subparser.add_argument('--band-memory', type=khmer_args.memory_setting,
+                           default=None, metavar='MEM', help='with '
+                           '--single-pass (required), limit the memory used '
+                           'by the count tables of all bands (--memory for '
+                           'each band) to MEM; if not all bands fit, the '
+                           'bands are counted in groups, and each group is '
+                           'written to disk before the input is read again '
+                           'for the next group; by default, all bands are '
+                           'counted at once')
+    subparser.add_argument('--ceiling', type=int, metavar='C', default=None,
+                           help='store abundances only up to C, using a more '
+                           'compact sketch with more bins for the same '
+                           'memory: a nodetable (1 bit per bin) for C=1, or '
+                           'a smallcounttable (4 bits per bin) for C <= 15; '
+                           'useful for control samples, where C should be '
+                           'set to `kevlar novel --ctrl-max` + 1')
     subparser.add_argument('-t', '--threads', type=int, default=1, metavar='T',
-                           help='number of threads to use for file processing;'
-                           ' default is 1')
+                           help='number of threads to use for file processing,'
+                           ' shared by all of a sample\'s input files so that '
+                           'they are counted concurrently; default is 1')
     subparser.add_argument('counttable', type=str, help='name of the file to '
                            'which the output (a k-mer count table) will be '
                            'written; the suffix ".counttable" will be applied '
                            'if the provided file name does not end in ".ct" '
-                           'or ".counttable"')
+                           'or ".counttable" (or ".nodetable" or '
+                           '".smallcounttable" with --ceiling, as '
+                           'appropriate); if the file name ends in '
+                           '".mmsketch", the table is written in a format '
+                           'that can be memory-mapped and shared by several '
+                           'processes, and if it ends in ".zsketch", the '
+                           'table is compressed')
     subparser.add_argument('seqfile', type=str, nargs='+', help='input files '
                            'in Fastq/Fasta format')
@@ -70,7 +70,22 @@ def subparser(subparsers):
     subparser.add_argument('-x', '--max-abund', type=int, default=5,
                            metavar='A', help='k-mers with abundance >= A in '
                            'the first sample are ignored in all subsequent '
-                           'samples; default is 1')
+                           'samples; default is 5')
+    subparser.add_argument('--auto-size', action='store_true',
+                           help='treat MEM as a memory budget: estimate the '
+                           'number of distinct k-mers with a HyperLogLog '
+                           'pre-pass over the input, and choose the table '
+                           'size and number of tables expected to achieve the '
+                           'false positive rate specified by --target-fpr '
+                           'using as little of MEM as possible')
+    subparser.add_argument('--auto-size-sample', type=int, metavar='N',
+                           default=None, help='with --auto-size, estimate '
+                           'the number of distinct k-mers from the first N '
+                           'reads of each input file and extrapolate to the '
+                           'entire input; by default, all reads are used')
+    subparser.add_argument('--target-fpr', type=float, default=0.05,
+                           metavar='FPR', help='target false positive rate '
+                           'for --auto-size; default is 0.05')
     subparser.add_argument('--num-bands', type=int, metavar='N', default=None,
                            help='number of bands into which to divide the '
                            'hashed k-mer space')
@@ -78,8 +93,9 @@ def subparser(subparsers):
                            help='a number between 1 and N (inclusive) '
                            'indicating the band to be processed')
     subparser.add_argument('-t', '--threads', type=int, default=1, metavar='T',
-                           help='number of threads to use for file processing;'
-                           ' default is 1')
+                           help='number of threads to use for file processing,'
+                           ' shared by all of a sample\'s input files so that '
+                           'they are counted concurrently; default is 1')
     subparser.add_argument('--sample', type=str, nargs='+', metavar='FQ',
                            action='append', help='list of Fastq/Fasta input '
                            'files, declared separately for each sample')
@@ -87,4 +103,6 @@ def subparser(subparsers):
                            'file to which the output (a k-mer count table) '
                            'will be written; the suffix ".counttable" will be '
                            'applied if the provided file name does not end in '
-                           '".ct" or ".counttable"')
+                           '".ct", ".counttable", ".mmsketch" (a format '
+                           'that can be memory-mapped and shared by several '
+                           'processes), or ".zsketch" (a compressed format)')
@@ -35,7 +35,10 @@ def subparser(subparsers):
                            nargs='+', help='sequences to mask (reference '
                            'genomes, contaminants); can provide as one or more'
                            ' Fasta/Fastq files or as a single pre-computed '
-                           'nodetable file; see `--save-mask` option')
+                           'nodetable file (".nt", ".nodetable", or '
+                           '".zsketch"), or a nodetable served by `kevlar '
+                           'serve` ("serve:SOCKET:NAME"); see `--save-mask` '
+                           'option')
     mask_args.add_argument('--mask-memory', metavar='MEM', default='1e9',
                            type=khmer_args.memory_setting,
                            help='memory to allocate for storing the mask; '
@@ -47,6 +50,18 @@ def subparser(subparsers):
     mask_args.add_argument('--save-mask', type=str, metavar='FILE',
                            default=None, help='save mask nodetable to the '
                            'specified FILE to save time with future runs')
+    mask_args.add_argument('--mask-cache', type=str, metavar='DIR',
+                           default=None, help='cache masks built from '
+                           'sequence files in DIR, keyed by the checksums of '
+                           'the files, the k-mer size, and the mask memory, '
+                           'so that future runs with the same inputs and '
+                           'settings load the mask from the cache; default is '
+                           'the value of the KEVLAR_MASK_CACHE environment '
+                           'variable, if set')
+    mask_args.add_argument('--mask-cache-size', metavar='SIZE', default='20e9',
+                           type=khmer_args.memory_setting, help='evict the '
+                           'least recently used masks when the masks in the '
+                           'cache exceed SIZE bytes; default is 20G')
 
     filter_args = subparser.add_argument_group(
         'Filtering k-mers',
@@ -66,6 +81,26 @@ def subparser(subparsers):
                              default=0.001, help='terminate if the expected '
                              'false positive rate is higher than the specified'
                              ' FPR; default is 0.001')
+    filter_args.add_argument('--exact-abund', action='store_true',
+                             help='instead of re-calculating the abundance of '
+                             'all k-mers in a count table, collect the '
+                             'distinct interesting k-mers and count only '
+                             'those k-mers, exactly, in a second pass over '
+                             'the reads; --abund-memory and --abund-max-fpr '
+                             'are then ignored; requires --ksize 32 or less')
+    filter_args.add_argument('--spill-dir', metavar='DIR', default=None,
+                             help='store reads in temporary files in DIR '
+                             'rather than in memory; only read name digests, '
+                             'file offsets, and interesting k-mers are kept '
+                             'in memory')
+    filter_args.add_argument('--merge', action='store_true',
+                             help='merge input files written by `kevlar '
+                             'novel --read-index` (such as the outputs of '
+                             'different k-mer bands) by read index, combining '
+                             'the k-mers of each read on the fly, rather than '
+                             'loading all reads into memory; the input files '
+                             'are read multiple times, and --spill-dir is '
+                             'ignored')
     filter_args.add_argument('--min-abund', type=int, default=5, metavar='Y',
                              help='minimum abundance required to call a '
                              'k-mer novel; should be the same value used for '
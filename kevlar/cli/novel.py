@@ -58,7 +58,9 @@ def subparser(subparsers):
     and/or "--control-counts" settings. If "--control-counts" is declared, then
     all "--control" flags are ignored. If "--case-counts" is declared,
     FASTA/FASTQ files must still be provided with "--case" for selecting
-    "interesting" k-mers and reads."""
+    "interesting" k-mers and reads. Counttables kept in memory by
+    `kevlar serve` can be specified as "serve:SOCKET:NAME" instead of
+    being loaded from disk."""
     samp_desc = textwrap.dedent(samp_desc)
     samp_args = subparser.add_argument_group('Case/control config', samp_desc)
     samp_args.add_argument(
@@ -83,7 +85,8 @@ def subparser(subparsers):
         '--control-counts', metavar='F', nargs='+',
         help='counttable file(s) corresponding to each control sample; if not '
         'provided, k-mer abundances will be computed from FASTA/FASTQ input; '
-        'only one counttable per sample, see examples below'
+        'only one counttable per sample, see examples below; alternatively, a '
+        'single "control union" counttable computed with `kevlar union`'
     )
     samp_args.add_argument(
         '-x', '--ctrl-max', metavar='X', type=int, default=1,
@@ -102,6 +105,41 @@ def subparser(subparsers):
         'default is 1M; ignored when pre-computed k-mer abundances are '
         'supplied via counttable'
     )
+    samp_args.add_argument(
+        '--compact-controls', action='store_true', help='when computing '
+        'k-mer abundances for control samples from FASTA/FASTQ input, store '
+        'abundances only up to X+1 (see --ctrl-max) in a more compact sketch; '
+        'a nodetable (1 bit per bin) is used for X=0, or a smallcounttable '
+        '(4 bits per bin) for X <= 14, reducing the false positive rate for '
+        'the same memory; see also `kevlar count --ceiling`'
+    )
+    samp_args.add_argument(
+        '--prefilter', action='store_true', help='after loading all samples, '
+        'build a compact filter (1 bit per bin per sample) of k-mers passing '
+        'the case/control thresholds, and use it to reject reads without any '
+        'interesting k-mers before looking up abundances in each sample; '
+        'requires all samples to have identical table sizes, and therefore '
+        'cannot be combined with --compact-controls or --auto-size'
+    )
+    samp_args.add_argument(
+        '--auto-size', action='store_true', help='when computing k-mer '
+        'abundances from FASTA/FASTQ input, treat MEM as a memory budget and '
+        'choose the table size and number of tables for each sample from a '
+        'HyperLogLog estimate of its number of distinct k-mers, targeting '
+        'the false positive rate specified by --target-fpr; since table '
+        'sizes then differ between samples, this cannot be combined with '
+        '--prefilter'
+    )
+    samp_args.add_argument(
+        '--auto-size-sample', type=int, metavar='N', default=None,
+        help='with --auto-size, estimate the number of distinct k-mers from '
+        'the first N reads of each input file and extrapolate to the entire '
+        'input; by default, all reads are used'
+    )
+    samp_args.add_argument(
+        '--target-fpr', type=float, default=0.05, metavar='FPR',
+        help='target false positive rate for --auto-size; default is 0.05'
+    )
     samp_args.add_argument(
         '--max-fpr', type=float, default=0.2, metavar='FPR',
         help='terminate if the expected false positive rate for any sample is '
@@ -115,7 +153,14 @@ def subparser(subparsers):
     band at a time reduces the memory consumption to approximately 1/N of the
     total memory required. This implements a scatter/gather approach in which
     `kevlar novel` is run N times, after the results are combined using
-    `kevlar filter`."""
+    `kevlar filter`. Alternatively, the sketches for several bands (or all
+    bands, memory permitting) can be loaded at once with "--bands" or
+    "--all-bands", in which case the case reads are scanned only once and each
+    k-mer is looked up in the sketches of its own band. Counttable filenames
+    may then contain a "{band}" placeholder, which is replaced by the band
+    number. If the output filename contains a "{band}" placeholder, a separate
+    output file is written for each band; otherwise a single merged output is
+    written."""
     band_desc = textwrap.dedent(band_desc)
     band_args = subparser.add_argument_group('K-mer banding', band_desc)
     band_args.add_argument('--num-bands', type=int, metavar='N', default=None,
@@ -124,6 +169,13 @@ def subparser(subparsers):
     band_args.add_argument('--band', type=int, metavar='I', default=None,
                            help='a number between 1 and N (inclusive) '
                            'indicating the band to be processed')
+    band_args.add_argument('--bands', type=int, metavar='I', nargs='+',
+                           default=None, help='process several bands (each '
+                           'a number between 1 and N, inclusive) in a single '
+                           'pass over the case reads')
+    band_args.add_argument('--all-bands', action='store_true',
+                           help='process all N bands in a single pass over '
+                           'the case reads')
 
     misc_args = subparser.add_argument_group('Miscellaneous settings')
     misc_args.add_argument('-h', '--help', action='help',
@@ -139,9 +191,41 @@ def subparser(subparsers):
                            metavar='INT', help='discard reads with any k-mers '
                            'whose abundance is < INT')
     misc_args.add_argument('-t', '--threads', type=int, default=1, metavar='T',
-                           help='number of threads to use for file processing;'
-                           ' default is 1')
+                           help='number of threads to use for file processing,'
+                           ' and number of worker processes to use for '
+                           'scanning case reads; default is 1')
+    misc_args.add_argument('--read-cache', type=int, default=0, metavar='N',
+                           help='cache the results of scanning the N most '
+                           'recently seen distinct read sequences, so that '
+                           'duplicate reads are not scanned again; default '
+                           'is 0 (no caching)')
+    misc_args.add_argument('--exact-kmer-count', action='store_true',
+                           help='report the exact number of distinct novel '
+                           'k-mers, storing each distinct k-mer in memory; by '
+                           'default, the number is estimated with a '
+                           'HyperLogLog counter using constant memory')
+    misc_args.add_argument('--read-index', action='store_true',
+                           help='annotate each output read with its index in '
+                           'the case input, so that the outputs of several '
+                           'runs on the same case reads (such as one run per '
+                           'k-mer band) can be merged without loading them '
+                           'into memory with `kevlar filter --merge`')
     misc_args.add_argument('--skip-until', type=str, metavar='ID',
                            help='when re-running `kevlar novel`, skip all '
                            'reads in the case input until read with name `ID` '
                            'is observed')
+    misc_args.add_argument('--checkpoint', metavar='FILE', help='periodically '
+                           'record the position of the case input and the '
+                           'output in FILE, so that an interrupted run can be '
+                           'resumed with --resume; requires uncompressed '
+                           'output to a file')
+    misc_args.add_argument('--checkpoint-interval', type=int, default=1000000,
+                           metavar='N', help='number of case reads between '
+                           'checkpoints; default is 1000000')
+    misc_args.add_argument('--resume', action='store_true', help='resume an '
+                           'interrupted run from the --checkpoint file, '
+                           'seeking directly to the recorded position in the '
+                           'case input (fast for uncompressed or BGZF input; '
+                           'other gzip input must still be decompressed up to '
+                           'that position) and appending to the existing '
+                           'output')
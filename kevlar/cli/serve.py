@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import argparse
+import textwrap
+
+
+def subparser(subparsers):
+    """Define the `kevlar serve` command-line interface."""
+
+    desc = """\
+    Load one or more sketch files (k-mer count tables or presence/absence
+    tables) and keep them in memory, answering k-mer abundance queries over a
+    Unix domain socket until stopped. Other kevlar commands can then use a
+    served sketch instead of loading it from disk, by specifying it as
+    "serve:SOCKET:NAME" wherever a sketch file is expected (for example with
+    `kevlar novel --case-counts` or `kevlar filter --mask`).
+    """
+    desc = textwrap.dedent(desc)
+
+    epilog = """\
+    Example::
+
+        kevlar serve --socket /tmp/kevlar.sock proband=proband.counttable \\
+            father=father.counttable mother=mother.counttable &
+        kevlar novel --case proband.fq.gz \\
+            --case-counts serve:/tmp/kevlar.sock:proband \\
+            --control-counts serve:/tmp/kevlar.sock:father \\
+                             serve:/tmp/kevlar.sock:mother"""
+    epilog = textwrap.dedent(epilog)
+
+    subparser = subparsers.add_parser(
+        'serve', description=desc, epilog=epilog,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparser.add_argument('-s', '--socket', metavar='PATH', required=True,
+                           help='path of the Unix domain socket on which to '
+                           'serve queries')
+    subparser.add_argument('sketches', type=str, nargs='+',
+                           metavar='NAME=FILE', help='sketch files to serve, '
+                           'each with the name by which it will be queried; '
+                           'if no name is given, the file name without '
+                           'directory and extension is used')
@@ -97,6 +97,17 @@ def subparser(subparsers):
         'the mask; default is 1M; ignored when pre-computed k-mer abundances '
         'are supplied via counttable'
     )
+    filter_args.add_argument(
+        '--mask-cache', metavar='DIR', type=str, default=None,
+        help='cache masks built from sequence files in DIR so that future '
+        'runs with the same inputs and settings load the mask from the cache; '
+        'see `kevlar filter --mask-cache`'
+    )
+    filter_args.add_argument(
+        '--mask-cache-size', metavar='SIZE', default='20e9',
+        type=khmer_args.memory_setting, help='evict the least recently used '
+        'masks when the masks in the cache exceed SIZE bytes; default is 20G'
+    )
     filter_args.add_argument(
         '--filter-fpr', type=float, default=0.001, metavar='FPR',
         help='terminate if the expected false positive rate for the '
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import argparse
+import textwrap
+
+
+def subparser(subparsers):
+    """Define the `kevlar sketch-info` command-line interface."""
+
+    desc = """\
+    Describe one or more sketch files (k-mer count tables or presence/absence
+    tables) without loading them. Sketch type, k-mer size, table sizes,
+    occupancy, estimated false positive rate, banding parameters, and the
+    names, sizes, and MD5 checksums of the input files are reported from the
+    header of `.mmsketch` and `.zsketch` files, or from the metadata saved
+    alongside other sketch files by kevlar. For sketch files without metadata,
+    only the sketch type implied by the file extension is reported.
+    """
+    desc = textwrap.dedent(desc)
+
+    epilog = """\
+    Example::
+
+        kevlar sketch-info proband.mmsketch mother.mmsketch father.counttable
+
+    Example::
+
+        kevlar sketch-info --json --out sketches.json *.mmsketch"""
+    epilog = textwrap.dedent(epilog)
+
+    subparser = subparsers.add_parser(
+        'sketch-info', description=desc, epilog=epilog,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparser.add_argument('--json', action='store_true', help='report the '
+                           'description of each sketch in JSON format')
+    subparser.add_argument('-o', '--out', metavar='FILE', help='output file; '
+                           'default is terminal (stdout)')
+    subparser.add_argument('sketches', type=str, nargs='+', help='sketch '
+                           'files to describe')
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import argparse
+import textwrap
+
+
+def subparser(subparsers):
+    """Define the `kevlar union` command-line interface."""
+
+    desc = """\
+    Combine the k-mer abundances of several control samples into a single
+    "control union" counttable. Each k-mer's abundance in the union is its
+    maximum abundance across all controls, saturating at X+1 (see --ctrl-max).
+    Providing the union to `kevlar novel` via --control-counts (in place of the
+    individual control counttables) requires only one lookup per k-mer for all
+    controls. All input counttables must have the same k-mer size and table
+    sizes (i.e. must be computed with the same --ksize and --memory).
+    """
+    desc = textwrap.dedent(desc)
+
+    epilog = """\
+    Example::
+
+        kevlar union --ctrl-max 1 controls.counttable \\
+            mother.counttable father.counttable sibling.counttable"""
+    epilog = textwrap.dedent(epilog)
+
+    subparser = subparsers.add_parser(
+        'union', description=desc, epilog=epilog,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparser.add_argument('-x', '--ctrl-max', metavar='X', type=int,
+                           default=1, help='value of --ctrl-max that will be '
+                           'used with `kevlar novel`; abundances are stored '
+                           'only up to X+1; default is X=1')
+    subparser.add_argument('--max-fpr', type=float, default=0.2,
+                           metavar='FPR', help='terminate if the estimated '
+                           'false positive rate of the combined counttable '
+                           'is higher than "FPR"; default is 0.2')
+    subparser.add_argument('outfile', type=str, help='name of the file to '
+                           'which the combined counttable will be written; '
+                           'the suffix ".counttable" will be applied if the '
+                           'provided file name does not end in ".ct", '
+                           '".counttable", ".mmsketch" (a format that can '
+                           'be memory-mapped and shared by several '
+                           'processes), or ".zsketch" (a compressed format)')
+    subparser.add_argument('sketches', type=str, nargs='+', help='control '
+                           'counttables to combine')
@@ -7,66 +7,497 @@
 # licensed under the MIT license: see LICENSE.
 # -----------------------------------------------------------------------------
 
+import builtins
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import io
+import os
+import queue
 import threading
 import sys
+import time
 import khmer
+import numpy
 import kevlar
 
 
+def sample_masked_kmers(seqfiles, mask, maxabund=1, numbands=None,
+                        band=None, samplereads=100000):
+    """
+    Count the k-mers skipped because of a mask in a sample of the input.
+
+    The first `samplereads` reads of each file are examined, and a k-mer is
+    considered skipped if its abundance in the `mask` sketch is at least
+    `maxabund`. If `numbands` is provided, only k-mers in the (0-based) `band`
+    are considered. Returns the number of k-mers examined, the number of those
+    that are skipped, and whether all reads were examined.
+    """
+    nkmers, nskipped, complete = 0, 0, True
+    for seqfile in seqfiles:
+        for n, record in enumerate(khmer.ReadParser(seqfile)):
+            if n >= samplereads:
+                complete = False
+                break
+            sequence = record.cleaned_seq
+            if len(sequence) < mask.ksize():
+                continue
+            masked = numpy.array(mask.get_kmer_counts(sequence)) >= maxabund
+            if numbands:
+                hashes = numpy.array(mask.get_kmer_hashes(sequence),
+                                     dtype=numpy.uint64)
+                inband = kevlar.sketch.hash_bands(hashes, numbands) == band
+                masked &= inband
+                nkmers += int(inband.sum())
+            else:
+                nkmers += len(masked)
+            nskipped += int(masked.sum())
+    return nkmers, nskipped, complete
+
+
+def skipped_message(seqfiles, nkmers, mask, maxabund=1, numbands=None,
+                    band=None, samplereads=100000):
+    """
+    Report the number of k-mers skipped because of a mask.
+
+    khmer's masked counting functions only report the number of k-mers
+    counted, so the number of k-mers skipped is computed from a sample of the
+    input (see `sample_masked_kmers`). If the sample covers the entire input,
+    the number is exact; otherwise it is extrapolated from the fraction of
+    k-mers skipped in the sample and the number of k-mers counted (`nkmers`).
+    """
+    nsampled, nskipped, complete = sample_masked_kmers(
+        seqfiles, mask, maxabund=maxabund, numbands=numbands, band=band,
+        samplereads=samplereads
+    )
+    message = '{:d} k-mers skipped'.format(nskipped)
+    if not complete:
+        fraction = nskipped / nsampled if nsampled else 0.0
+        if fraction < 1.0:
+            nskipped = int(nkmers * fraction / (1.0 - fraction))
+            message = '~{:d} k-mers'.format(nskipped)
+            message += ' ({:.1%}) skipped'.format(fraction)
+        else:
+            message = 'all sampled k-mers skipped'
+    message += ' (abundance >= {:d} in mask'.format(maxabund)
+    if not complete:
+        message += '; estimated from the first {:d} reads'.format(samplereads)
+        message += ' of each file'
+    return message + ')'
+
+
+def consume_seqfile_multiband(bandsketches, parser, numbands,
+                              batchsize=1 << 20, stop=None):
+    """
+    Count k-mers from a sequence file into the sketches of several bands.
+
+    The `bandsketches` dictionary maps each (0-based) band to the sketch for
+    that band. Each k-mer is hashed once and counted only in the sketch of the
+    band to which it belongs (see `kevlar.sketch.hash_bands`); k-mers in bands
+    without a sketch are ignored. The hashes of about `batchsize` k-mers are
+    collected from consecutive reads and grouped by band with a single sort,
+    and then added to the sketch of each band. Counting stops early if the
+    `stop` event is set.
+
+    khmer cannot count a batch of hashes in a single call, so each k-mer is
+    still added with a separate call, holding the GIL: unlike khmer's consume
+    functions, this is CPU-bound and does not scale with more threads.
+
+    Returns the number of reads processed and the number of k-mers counted.
+    """
+    first = next(iter(bandsketches.values()))
+    bandnums = numpy.arange(numbands + 1)
+
+    def count_batch(batch):
+        hashes = numpy.concatenate(batch)
+        kmerbands = kevlar.sketch.hash_bands(hashes, numbands)
+        order = numpy.argsort(kmerbands, kind='stable')
+        bounds = numpy.searchsorted(kmerbands[order], bandnums)
+        hashes = hashes[order]
+        ncounted = 0
+        for band, sketch in bandsketches.items():
+            add = sketch.add
+            for kmerhash in hashes[bounds[band]:bounds[band + 1]].tolist():
+                add(kmerhash)
+            ncounted += int(bounds[band + 1] - bounds[band])
+        return ncounted
+
+    nreads, nkmers = 0, 0
+    batch, batchkmers = list(), 0
+    for record in parser:
+        if stop is not None and stop.is_set():
+            return nreads, nkmers
+        nreads += 1
+        sequence = record.cleaned_seq
+        if len(sequence) < first.ksize():
+            continue
+        hashes = numpy.array(first.get_kmer_hashes(sequence),
+                             dtype=numpy.uint64)
+        batch.append(hashes)
+        batchkmers += len(hashes)
+        if batchkmers >= batchsize:
+            nkmers += count_batch(batch)
+            batch, batchkmers = list(), 0
+    if batch:
+        nkmers += count_batch(batch)
+    return nreads, nkmers
+
+
+def consume_seqfiles(sketch, seqfiles, numthreads=1, mask=None,
+                     maskmaxabund=1, numbands=None, band=None, monitor=None,
+                     monitorint=10.0, masksample=100000, logfile=sys.stderr):
+    """
+    Count k-mers from several sequence files with a single pool of threads.
+
+    Each file has its own `khmer.ReadParser`, and `numthreads` worker threads
+    are spread over all files so that the files are counted concurrently.
+    khmer parsers can be shared by several threads, and a worker that finishes
+    a file moves on to help with files that are still being counted. Per-file
+    and total throughput are reported when done.
+
+    If `sketch` is a dictionary mapping (0-based) bands to sketches, the input
+    is read only once and each k-mer is counted in the sketch of its band (see
+    `consume_seqfile_multiband`).
+
+    If `mask` is provided, k-mers whose abundance in the mask is at least
+    `maskmaxabund` are not counted. The mask must be a khmer sketch. The
+    number of k-mers skipped is reported, computed from the first `masksample`
+    reads of each file (see `skipped_message`).
+
+    If `monitor` is provided, it is called every `monitorint` seconds while
+    k-mers are being counted. Any exception it raises is propagated to the
+    caller immediately, and the counting threads are told to stop: threads
+    counting k-mers in Python stop after their current read, and threads
+    counting with khmer after their current file (khmer's consume functions
+    cannot be interrupted). The sketch is left partially filled and should be
+    discarded. The counting threads are daemon threads, and do not prevent the
+    program from exiting.
+
+    Returns the total number of reads and k-mers consumed.
+    """
+    stop = threading.Event()
+    if isinstance(sketch, dict):
+        def consume(parser):
+            return consume_seqfile_multiband(sketch, parser, numbands,
+                                             stop=stop)
+    else:
+        # khmer counts a k-mer if its abundance in the mask is at most the
+        # threshold.
+        maskargs = (mask, maskmaxabund - 1) if mask else ()
+        if numbands and mask:
+            khmerconsume = sketch.consume_seqfile_banding_with_mask
+        elif numbands:
+            khmerconsume = sketch.consume_seqfile_banding
+        elif mask:
+            khmerconsume = sketch.consume_seqfile_with_mask
+        else:
+            khmerconsume = sketch.consume_seqfile
+        consumeargs = ((numbands, band) if numbands else ()) + maskargs
+
+        def consume(parser):
+            return khmerconsume(parser, *consumeargs)
+
+    parsers = [khmer.ReadParser(seqfile) for seqfile in seqfiles]
+    tasks = queue.Queue()
+    workersperfile = -(-numthreads // len(seqfiles))
+    for _ in range(workersperfile):
+        for i in range(len(seqfiles)):
+            tasks.put(i)
+    stats = [dict(reads=0, kmers=0, start=None, stop=None)
+             for _ in seqfiles]
+    errors = list()
+    lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            try:
+                i = tasks.get_nowait()
+            except queue.Empty:
+                return
+            with lock:
+                if stats[i]['start'] is None:
+                    stats[i]['start'] = time.time()
+            try:
+                nreads, nkmers = consume(parsers[i])
+            except Exception as error:
+                with lock:
+                    errors.append(error)
+                stop.set()
+                return
+            with lock:
+                stats[i]['reads'] += nreads
+                stats[i]['kmers'] += nkmers
+                stats[i]['stop'] = time.time()
+
+    starttime = time.time()
+    threads = [threading.Thread(target=worker, daemon=True)
+               for _ in range(numthreads)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=monitorint)
+                if monitor and thread.is_alive():
+                    monitor()
+    except BaseException:
+        stop.set()
+        raise
+    if errors:
+        raise errors[0]
+    elapsed = time.time() - starttime
+
+    for seqfile, filestats in zip(seqfiles, stats):
+        fileelapsed = filestats['stop'] - filestats['start']
+        message = throughput(filestats['reads'], filestats['kmers'],
+                             fileelapsed)
+        print('[kevlar::count]        ', seqfile + ':', message, file=logfile)
+    nreads = sum(filestats['reads'] for filestats in stats)
+    nkmers = sum(filestats['kmers'] for filestats in stats)
+    message = throughput(nreads, nkmers, elapsed)
+    message += ' with {:d} thread(s)'.format(numthreads)
+    print('[kevlar::count]         total:', message, file=logfile)
+    if mask:
+        message = skipped_message(
+            seqfiles, nkmers, mask, maxabund=maskmaxabund, numbands=numbands,
+            band=band, samplereads=masksample
+        )
+        print('[kevlar::count]        masked:', message, file=logfile)
+    return nreads, nkmers
+
+
+def throughput(nreads, nkmers, elapsed):
+    message = '{:d} reads, {:d} k-mers'.format(nreads, nkmers)
+    message += ' in {:.2f} seconds'.format(elapsed)
+    if elapsed > 0:
+        message += ' ({:.0f} reads/sec)'.format(nreads / elapsed)
+    return message
+
+
+def describe_inputs(seqfiles, chunksize=1 << 20, stop=None):
+    """
+    Describe the input files of a sample, for storage in sketch metadata.
+
+    Returns a list with the name, size, and MD5 checksum of each file. If the
+    `stop` event is set while the checksums are being computed, `None` is
+    returned instead.
+    """
+    inputs = list()
+    for seqfile in seqfiles:
+        md5 = hashlib.md5()
+        with builtins.open(seqfile, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(chunksize), b''):
+                if stop is not None and stop.is_set():
+                    return None
+                md5.update(chunk)
+        inputs.append({
+            'filename': seqfile,
+            'size': os.path.getsize(seqfile),
+            'md5': md5.hexdigest(),
+        })
+    return inputs
+
+
+def sample_seqfile(hll, seqfile, samplereads):
+    """
+    Feed the first `samplereads` reads of a sequence file to a HLL counter.
+
+    Returns the number of reads consumed and the fraction of the file (by
+    bytes on disk, compressed or not) from which they were read.
+    """
+    nreads = 0
+    with builtins.open(seqfile, 'rb') as rawstream:
+        stream = rawstream
+        if seqfile.endswith('.gz'):
+            stream = gzip.GzipFile(fileobj=rawstream)
+        textstream = io.TextIOWrapper(stream)
+        for record in kevlar.parse_fastx(textstream):
+            if nreads >= samplereads:
+                break
+            hll.consume_string(record.sequence)
+            nreads += 1
+        else:
+            return nreads, 1.0
+        filesize = os.path.getsize(seqfile)
+        fraction = min(rawstream.tell() / filesize, 1.0) if filesize else 1.0
+    return nreads, fraction
+
+
+def estimate_distinct_kmers(seqfiles, ksize, samplereads=None):
+    """
+    Estimate the number of distinct k-mers in a sample with a HLL counter.
+
+    By default all reads are streamed through the counter. If `samplereads` is
+    specified, only the first `samplereads` reads of each file are used, and
+    the estimate is extrapolated linearly to the size of the entire input.
+    Since the number of distinct k-mers grows less than linearly with the
+    number of reads, the extrapolated estimate is conservative.
+    """
+    hll = khmer.HLLCounter(0.01, ksize)
+    nreads = 0
+    sampledbytes, totalbytes = 0.0, 0.0
+    for seqfile in seqfiles:
+        if samplereads is None:
+            filereads, _ = hll.consume_seqfile(seqfile)
+            fraction = 1.0
+        else:
+            filereads, fraction = sample_seqfile(hll, seqfile, samplereads)
+        nreads += filereads
+        filesize = os.path.getsize(seqfile)
+        sampledbytes += fraction * filesize
+        totalbytes += filesize
+    ndistinct = hll.estimate_cardinality()
+    if sampledbytes > 0 and sampledbytes < totalbytes:
+        ndistinct = int(ndistinct * totalbytes / sampledbytes)
+    return ndistinct, nreads
+
+
+def autosize_sketch(seqfiles, ksize, memory, bucketsperbyte=1,
+                    targetfpr=0.05, samplereads=None, numbands=None,
+                    logfile=sys.stderr):
+    """
+    Choose the size of a sketch from a cardinality pre-pass over the input.
+
+    The number of distinct k-mers is estimated with a HyperLogLog counter (see
+    `estimate_distinct_kmers`), and divided by the number of bands if banding
+    is used. The table size and number of tables expected to achieve the
+    target false positive rate are then chosen within the memory budget (see
+    `kevlar.sketch.choose_size`). Returns the table size and number of tables.
+    """
+    ndistinct, nreads = estimate_distinct_kmers(
+        seqfiles, ksize, samplereads=samplereads
+    )
+    if numbands:
+        ndistinct = ndistinct // numbands
+    tablesize, numtables, fpr = kevlar.sketch.choose_size(
+        ndistinct, memory, bucketsperbyte=bucketsperbyte, targetfpr=targetfpr
+    )
+    message = 'auto-sizing: ~{:d} distinct k-mers'.format(ndistinct)
+    if numbands:
+        message += ' per band'
+    message += ' estimated from {:d} reads'.format(nreads)
+    if samplereads is not None:
+        message += ' (sampled)'
+    message += ';\n    using {:d} tables'.format(numtables)
+    message += ' of {:d} bins'.format(tablesize)
+    usedmemory = tablesize * numtables / bucketsperbyte
+    message += ' ({:.0f} of {:.0f} bytes)'.format(usedmemory, memory)
+    message += ', expected false positive rate {:1.3f}'.format(fpr)
+    if fpr > targetfpr:
+        message += ' (WARNING: memory budget too small for target false '
+        message += 'positive rate {:1.3f})'.format(targetfpr)
+    print('[kevlar::count]    ', message, file=logfile)
+    return tablesize, numtables
+
+
 def load_sample_seqfile(seqfiles, ksize, memory, maxfpr=0.2,
                         mask=None, maskmaxabund=1, numbands=None, band=None,
-                        outfile=None, numthreads=1, logfile=sys.stderr):
+                        outfile=None, numthreads=1, ceiling=None,
+                        autosize=False, samplereads=None, targetfpr=0.05,
+                        fprinterval=10.0, logfile=sys.stderr):
     """
     Compute k-mer abundances for the specified sequence input.
 
     Expected input is a list of one or more FASTA/FASTQ files corresponding
     to a single sample. A counttable is created and populated with abundances
-    of all k-mers observed in the input. If `mask` is provided, only k-mers not
-    present in the mask will be loaded.
+    of all k-mers observed in the input. If `mask` is provided, k-mers whose
+    abundance in the mask is `maskmaxabund` or more will not be loaded.
+
+    If `ceiling` is provided, abundances are only stored up to this value, in
+    the most compact sketch type that supports it: a nodetable for a ceiling of
+    1, or a smallcounttable for a ceiling of 15 or less. The sketch then has
+    2-8 times as many bins for the same amount of memory, and thus a lower
+    false positive rate.
+
+    If `autosize` is true, `memory` is treated as a budget rather than a fixed
+    allocation, and the size of the sketch is chosen for `targetfpr` from a
+    cardinality pre-pass over the input (see `kevlar.count.autosize_sketch`).
+
+    While k-mers are being loaded, the false positive rate of the sketch is
+    estimated every `fprinterval` seconds from a sample of its bins (see
+    `kevlar.sketch.running_fpr`). Since the FPR only grows as more k-mers are
+    loaded, counting is aborted as soon as the estimate exceeds `maxfpr`.
+
+    If `outfile` is provided, the sketch is saved along with metadata
+    describing the banding parameters and the input files, whose checksums are
+    computed on a background thread while k-mers are being counted. If
+    counting is aborted, the checksums are abandoned rather than waited for.
     """
     message = 'loading from ' + ','.join(seqfiles)
     print('[kevlar::count]    ', message, file=logfile)
 
-    sketch = khmer.Counttable(ksize, memory / 4, 4)
-    n, nkmers = 0, 0
-    for seqfile in seqfiles:
-        parser = khmer.ReadParser(seqfile)
-        threads = list()
-        for _ in range(numthreads):
-            if mask:
-                if numbands:
-                    thread = threading.Thread(
-                        target=sketch.consume_seqfile_banding_with_mask,
-                        args=(parser, numbands, band, mask, ),
-                    )
-                else:
-                    thread = threading.Thread(
-                        target=sketch.consume_seqfile_with_mask,
-                        args=(parser, mask, ),
-                    )
-            else:
-                if numbands:
-                    thread = threading.Thread(
-                        target=sketch.consume_seqfile_banding,
-                        args=(parser, numbands, band, ),
-                    )
-                else:
-                    thread = threading.Thread(
-                        target=sketch.consume_seqfile,
-                        args=(parser, ),
-                    )
-            threads.append(thread)
-            thread.start()
+    count, smallcount, bucketsperbyte = kevlar.sketch.compact_type(ceiling)
+    tablesize, numtables = memory * bucketsperbyte / 4, 4
+    if autosize:
+        tablesize, numtables = autosize_sketch(
+            seqfiles, ksize, memory, bucketsperbyte=bucketsperbyte,
+            targetfpr=min(targetfpr, maxfpr), samplereads=samplereads,
+            numbands=numbands, logfile=logfile
+        )
+    sketch = kevlar.sketch.allocate(
+        ksize, tablesize, numtables, count=count, smallcount=smallcount
+    )
 
-    for thread in threads:
-        thread.join()
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(1)
+    inputs = None
+    if outfile:
+        inputs = executor.submit(describe_inputs, seqfiles, stop=stop)
+    try:
+        nreads, nkmers = consume_seqfiles(
+            sketch, seqfiles, numthreads=numthreads, mask=mask,
+            maskmaxabund=maskmaxabund, numbands=numbands, band=band,
+            monitor=fpr_monitor([sketch], maxfpr), monitorint=fprinterval,
+            logfile=logfile
+        )
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        executor.shutdown(wait=False)
+    if inputs:
+        inputs = inputs.result()
 
+    finish_sketch(sketch, nreads, maxfpr, numbands=numbands, band=band,
+                  outfile=outfile, inputs=inputs, logfile=logfile)
+    return sketch
+
+
+def fpr_monitor(sketches, maxfpr):
+    """
+    Create a monitor aborting k-mer counting when the FPR is too high.
+
+    The returned function estimates the false positive rate of each sketch
+    from a sample of its bins (see `kevlar.sketch.running_fpr`), and raises
+    an exception if any estimate exceeds `maxfpr`.
+    """
+    def check_fpr():
+        for sketch in sketches:
+            fpr = kevlar.sketch.running_fpr(sketch, margin=3.0)
+            if fpr > maxfpr:
+                message = 'estimated false positive rate is at least '
+                message += '{:1.3f} before all input was loaded'.format(fpr)
+                message += ' (FPR too high, bailing out!!!)'
+                message = '[kevlar::count]     ' + message
+                raise kevlar.sketch.KevlarUnsuitableFPRError(message)
+    return check_fpr
+
+
+def finish_sketch(sketch, nreads, maxfpr, numbands=None, band=None,
+                  outfile=None, inputs=None, logfile=sys.stderr):
+    """
+    Check the false positive rate of a sketch once all input is loaded.
+
+    If `outfile` is provided, the sketch is saved along with metadata
+    describing the banding parameters and the `inputs`. Returns the name of
+    the file written, if any.
+    """
     message = 'done loading reads'
     if numbands:
         message += ' (band {:d}/{:d})'.format(band+1, numbands)
     fpr = kevlar.sketch.estimate_fpr(sketch)
-    message += ';\n    {:d} reads processed'.format(parser.num_reads)
+    message += ';\n    {:d} reads processed'.format(nreads)
     message += ', {:d} distinct k-mers stored'.format(sketch.n_unique_kmers())
     message += ';\n    estimated false positive rate is {:1.3f}'.format(fpr)
     if fpr > maxfpr:
@@ -75,28 +506,147 @@ def load_sample_seqfile(seqfiles, ksize, memory, maxfpr=0.2,
         raise kevlar.sketch.KevlarUnsuitableFPRError(message)
 
     if outfile:
-        if not outfile.endswith(('.ct', '.counttable')):
-            outfile += '.counttable'
-        sketch.save(outfile)
+        metadata = {'inputs': inputs}
+        if numbands:
+            metadata.update({'band': band + 1, 'numbands': numbands})
+        outfile = kevlar.sketch.save(sketch, outfile, fpr=fpr,
+                                     metadata=metadata)
         message += ';\n    saved to "{:s}"'.format(outfile)
     print('[kevlar::count]    ', message, file=logfile)
+    return outfile
 
-    return sketch
+
+def band_file(filename, band):
+    """Replace the `{band}` placeholder of a filename with a 1-based band."""
+    return filename.replace('{band}', str(band + 1))
+
+
+def load_sample_seqfile_multiband(seqfiles, ksize, memory, numbands, bands,
+                                  outfile, maxfpr=0.2, bandmemory=None,
+                                  numthreads=1, ceiling=None, autosize=False,
+                                  samplereads=None, targetfpr=0.05,
+                                  fprinterval=10.0, singlepass=False,
+                                  logfile=sys.stderr):
+    """
+    Compute k-mer abundances for several bands.
+
+    A sketch of `memory` bytes is allocated for each of the specified
+    (0-based) `bands`. By default, the bands are counted one after the other,
+    each with a separate pass over the input using khmer's banded counting.
+    Output filenames are derived from `outfile` by replacing its `{band}`
+    placeholder with the 1-based band number.
+
+    If `singlepass` is true, the input is instead read once, and each k-mer is
+    counted in the sketch of its band (see `consume_seqfile_multiband`). This
+    saves reading and decompressing the input for every band, but k-mers are
+    counted in Python rather than by khmer, so it is only faster when reading
+    the input dominates the cost of counting (for example, input on slow
+    network storage). If `bandmemory` is provided, no more sketches than fit
+    in `bandmemory` bytes are held in memory at once: the bands are processed
+    in groups, and the sketches of each group are written to disk and
+    released once the input has been read. The input is then read once per
+    group rather than once per band.
+
+    See `load_sample_seqfile` for a description of the other arguments.
+    Returns the names of the files written.
+    """
+    if '{band}' not in outfile:
+        message = 'output filename must contain a "{band}" placeholder when '
+        message += 'counting several bands'
+        raise ValueError(message)
+    kevlar.novel.check_band_args(numbands, bands)
+    perpass = len(bands) if singlepass else 1
+    if singlepass and bandmemory:
+        perpass = max(1, min(perpass, int(bandmemory // memory)))
+    groups = [bands[i:i + perpass] for i in range(0, len(bands), perpass)]
+    message = 'counting {:d} bands'.format(len(bands))
+    message += ' in {:d} pass(es) over '.format(len(groups))
+    message += ','.join(seqfiles)
+    print('[kevlar::count]    ', message, file=logfile)
+
+    count, smallcount, bucketsperbyte = kevlar.sketch.compact_type(ceiling)
+    tablesize, numtables = memory * bucketsperbyte / 4, 4
+    if autosize:
+        tablesize, numtables = autosize_sketch(
+            seqfiles, ksize, memory, bucketsperbyte=bucketsperbyte,
+            targetfpr=min(targetfpr, maxfpr), samplereads=samplereads,
+            numbands=numbands, logfile=logfile
+        )
+
+    outfiles = list()
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(1)
+    inputs = executor.submit(describe_inputs, seqfiles, stop=stop)
+    try:
+        for i, group in enumerate(groups):
+            message = 'pass {:d}/{:d}: bands '.format(i + 1, len(groups))
+            message += ','.join(str(band + 1) for band in group)
+            print('[kevlar::count]    ', message, file=logfile)
+            bandsketches = dict()
+            for band in group:
+                bandsketches[band] = kevlar.sketch.allocate(
+                    ksize, tablesize, numtables, count=count,
+                    smallcount=smallcount
+                )
+            monitor = fpr_monitor(bandsketches.values(), maxfpr)
+            if singlepass:
+                nreads, nkmers = consume_seqfiles(
+                    bandsketches, seqfiles, numthreads=numthreads,
+                    numbands=numbands, monitor=monitor,
+                    monitorint=fprinterval, logfile=logfile
+                )
+            else:
+                nreads, nkmers = consume_seqfiles(
+                    bandsketches[group[0]], seqfiles, numthreads=numthreads,
+                    numbands=numbands, band=group[0], monitor=monitor,
+                    monitorint=fprinterval, logfile=logfile
+                )
+            for band in group:
+                sketch = bandsketches.pop(band)
+                outfiles.append(finish_sketch(
+                    sketch, nreads, maxfpr, numbands=numbands, band=band,
+                    outfile=band_file(outfile, band), inputs=inputs.result(),
+                    logfile=logfile
+                ))
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        executor.shutdown(wait=False)
+    return outfiles
 
 
 def main(args):
-    if (args.num_bands is None) is not (args.band is None):
+    bands = kevlar.novel.selected_bands(args)
+    if bands is None and (args.num_bands is None) is not (args.band is None):
         raise ValueError('Must specify --num-bands and --band together')
     myband = args.band - 1 if args.band else None
+    if bands is None and (args.single_pass or args.band_memory):
+        message = 'Must specify --bands or --all-bands with --single-pass or '
+        message += '--band-memory'
+        raise ValueError(message)
+    if args.band_memory and not args.single_pass:
+        raise ValueError('Must specify --single-pass with --band-memory')
 
     timer = kevlar.Timer()
     timer.start()
 
-    sketch = load_sample_seqfile(
-        args.seqfile, args.ksize, args.memory, args.max_fpr,
-        numbands=args.num_bands, band=myband, numthreads=args.threads,
-        outfile=args.counttable, logfile=args.logfile
-    )
+    sizing = dict(autosize=args.auto_size, samplereads=args.auto_size_sample,
+                  targetfpr=args.target_fpr)
+    if bands is None:
+        load_sample_seqfile(
+            args.seqfile, args.ksize, args.memory, args.max_fpr,
+            numbands=args.num_bands, band=myband, numthreads=args.threads,
+            outfile=args.counttable, ceiling=args.ceiling,
+            logfile=args.logfile, **sizing
+        )
+    else:
+        load_sample_seqfile_multiband(
+            args.seqfile, args.ksize, args.memory, args.num_bands, bands,
+            args.counttable, maxfpr=args.max_fpr, bandmemory=args.band_memory,
+            numthreads=args.threads, ceiling=args.ceiling,
+            singlepass=args.single_pass, logfile=args.logfile, **sizing
+        )
 
     total = timer.stop()
     message = 'Total time: {:.2f} seconds'.format(total)
@@ -14,7 +14,8 @@ import kevlar
 
 def load_samples(samplelists, ksize, memory, memfraction=None,
                  maxfpr=0.2, maxabund=1, numbands=None, band=None,
-                 numthreads=1, logfile=sys.stderr):
+                 numthreads=1, autosize=False, samplereads=None,
+                 targetfpr=0.05, logfile=sys.stderr):
     """
     Load a set of samples using a memory-efficient strategy.
 
@@ -24,6 +25,10 @@ def load_samples(samplelists, ksize, memory, memfraction=None,
     absent from the mask (below the specified threshold `minabund`) is ignored
     in all subsequent samples. This allows one to avoid taking up space storing
     abundances for k-mers that are uninteresting.
+
+    If `autosize` is true, the size of each sketch is chosen within its memory
+    budget from a cardinality pre-pass over its input (see
+    `kevlar.count.load_sample_seqfile`).
     """
     numsamples = len(samplelists)
     assert numsamples > 1
@@ -32,7 +37,8 @@ def load_samples(samplelists, ksize, memory, memfraction=None,
 
     bigsketch = kevlar.count.load_sample_seqfile(
         samplelists[0], ksize, memory, maxfpr=maxfpr, numbands=numbands,
-        band=band, numthreads=numthreads, logfile=logfile
+        band=band, numthreads=numthreads, autosize=autosize,
+        samplereads=samplereads, targetfpr=targetfpr, logfile=logfile
     )
     yield bigsketch
 
@@ -40,7 +46,8 @@ def load_samples(samplelists, ksize, memory, memfraction=None,
         yield kevlar.count.load_sample_seqfile(
             samplefilelist, ksize, memory * memfraction, mask=bigsketch,
             maskmaxabund=maxabund, maxfpr=maxfpr, numbands=numbands, band=band,
-            numthreads=numthreads, logfile=logfile
+            numthreads=numthreads, autosize=autosize, samplereads=samplereads,
+            targetfpr=targetfpr, logfile=logfile
         )
 
 
@@ -58,10 +65,12 @@ def main(args):
     loader = load_samples(
         args.sample, args.ksize, args.memory, memfraction=args.memfrac,
         maxfpr=args.max_fpr, maxabund=args.max_abund, numbands=args.num_bands,
-        band=args.band, numthreads=args.threads, logfile=args.logfile
+        band=myband, numthreads=args.threads, autosize=args.auto_size,
+        samplereads=args.auto_size_sample, targetfpr=args.target_fpr,
+        logfile=args.logfile
     )
     for sketch, outfile in zip(loader, args.outfiles):
-        sketch.save(outfile)
+        kevlar.sketch.save(sketch, outfile)
 
     total = timer.stop()
     message = 'Total time: {:.2f} seconds'.format(total)
@@ -7,6 +7,7 @@
 # licensed under the MIT license: see LICENSE.
 # -----------------------------------------------------------------------------
 
+import os
 import re
 import sys
 
@@ -17,8 +18,15 @@ from kevlar.sketch import KevlarUnsuitableFPRError
 
 
 def load_mask(maskfiles, ksize, memory, maxfpr=0.001, savefile=None,
+              cachedir=None, cachesize=kevlar.maskcache.DEFAULT_SIZE,
               logstream=sys.stderr):
-    """Load reference genome and/or contaminant database from a file."""
+    """
+    Load reference genome and/or contaminant database from a file.
+
+    If `cachedir` is specified, a mask built from sequence files is stored in
+    that directory, and loaded from there by subsequent calls with the same
+    input files, `ksize`, and `memory` (see `kevlar.maskcache`).
+    """
     if maskfiles is None:
         return None
 
@@ -26,25 +34,51 @@ def load_mask(maskfiles, ksize, memory, maxfpr=0.001, savefile=None,
     timer.start('loadmask')
     print('[kevlar::filter] Loading mask from', maskfiles, file=logstream)
 
-    if len(maskfiles) == 1 and maskfiles[0].endswith(('.nt', '.nodetable')):
+    fpr = None
+    extensions = ('.nt', '.nodetable', kevlar.zsketch.EXTENSION)
+    if len(maskfiles) == 1 and (maskfiles[0].endswith(extensions) or
+                                kevlar.serve.is_remote(maskfiles[0])):
         mask = kevlar.sketch.load(maskfiles[0])
+        fpr = kevlar.sketch.cached_fpr(mask, maskfiles[0])
         message = '    nodetable loaded'
     else:
         buckets = memory * khmer._buckets_per_byte['nodegraph'] / 4
-        mask = khmer.Nodetable(ksize, buckets, 4)
-        nr, nk = 0, 0
-        for maskfile in maskfiles:
-            numreads, numkmers = mask.consume_seqfile(maskfile)
-            nr += numreads
-            nk += numkmers
-        message = '    {:d} sequences and {:d} k-mers consumed'.format(nr, nk)
-    fpr = kevlar.sketch.estimate_fpr(mask)
+        mask, cachekey = None, None
+        if cachedir:
+            os.makedirs(cachedir, exist_ok=True)
+            md5s = kevlar.maskcache.checksums(maskfiles, cachedir)
+            cachekey = kevlar.maskcache.cache_key(md5s, ksize, buckets)
+            mask = kevlar.maskcache.lookup(cachedir, cachekey)
+        if mask is not None:
+            fpr = kevlar.sketch.cached_fpr(
+                mask, kevlar.maskcache.entry_file(cachedir, cachekey)
+            )
+            message = '    nodetable loaded from cache ({:s})'.format(cachekey)
+        else:
+            mask = khmer.Nodetable(ksize, buckets, 4)
+            nr, nk = 0, 0
+            for maskfile in maskfiles:
+                numreads, numkmers = mask.consume_seqfile(maskfile)
+                nr += numreads
+                nk += numkmers
+            message = '    {:d} sequences and {:d} k-mers consumed'.format(
+                nr, nk
+            )
+            fpr = kevlar.sketch.estimate_fpr(mask)
+            if cachekey and fpr <= maxfpr:
+                kevlar.maskcache.store(mask, cachedir, cachekey, fpr=fpr,
+                                       maxsize=cachesize, logstream=logstream)
+                message += '; stored in cache ({:s})'.format(cachekey)
     message += '; estimated false positive rate is {:1.3f}'.format(fpr)
     print(message, file=logstream)
     if fpr > maxfpr:
         raise KevlarUnsuitableFPRError('FPR too high, bailing out!!!')
     if savefile:
-        mask.save(savefile)
+        if isinstance(mask, kevlar.mmsketch.MappedSketch):
+            kevlar.mmsketch.unmap(mask).save(savefile)
+        else:
+            mask.save(savefile)
+        kevlar.sketch.save_metadata(mask, savefile, fpr=fpr)
         message = '    nodetable saved to "{:s}"'.format(savefile)
         print(message, file=logstream)
 
@@ -55,14 +89,19 @@ def load_mask(maskfiles, ksize, memory, maxfpr=0.001, savefile=None,
 
 
 def summarize_readset(readset, logfile):
-    fpr = kevlar.sketch.estimate_fpr(readset._counts)
+    fpr = 0.0
+    if not readset.exact:
+        fpr = kevlar.sketch.estimate_fpr(readset.counts)
     message = '    {:d} instances'.format(readset.read_instances)
     message += ' of {:d} reads consumed,\n'.format(readset.distinct_reads)
     message += '    annotated with'
     message += ' {:d} instances '.format(readset.ikmer_instances)
     message += 'of {:d} distinct'.format(readset.distinct_ikmers)
     message += ' "interesting" k-mers;\n'
-    message += '    estimated false positive rate is {:1.3f}'.format(fpr)
+    if readset.exact:
+        message += '    their abundances will be counted exactly'
+    else:
+        message += '    estimated false positive rate is {:1.3f}'.format(fpr)
     if logfile is not None:
         print(message, file=logfile)
     return fpr
@@ -97,15 +136,42 @@ def summarize_validate(readset, n, logfile=sys.stderr):
 
 
 def filter(readstream, mask=None, minabund=5, ksize=31, memory=1e6,
-           maxfpr=0.001, logstream=sys.stderr):
+           maxfpr=0.001, exact=False, spilldir=None, merge=False,
+           logstream=sys.stderr):
+    """
+    Validate interesting k-mers and de-duplicate the reads annotated with them.
+
+    Interesting k-mers present in the `mask` or whose recomputed abundance is
+    less than `minabund` are discarded. Abundances are recomputed in a
+    Counttable of `memory` bytes, or exactly for the interesting k-mers only
+    if `exact` is true (see `kevlar.seqio.AnnotatedReadSet`). If `spilldir`
+    is specified, reads are stored in temporary files in that directory rather
+    than in memory (see `kevlar.seqio.SpilledAnnotatedReadSet`).
+
+    If `merge` is true, `readstream` is instead a list of augmented Fastq files
+    written by `kevlar novel --read-index`, which are merged by read index in a
+    streaming fashion without storing the reads (see
+    `kevlar.seqio.MergedAnnotatedReadSet`).
+    """
     timer = kevlar.Timer()
     timer.start('recalc')
     print('[kevlar::filter] Loading input; recalculate k-mer abundances,',
           'de-duplicate reads and merge k-mers',
           file=logstream)
-    readset = kevlar.seqio.AnnotatedReadSet(ksize, memory)
-    for record in readstream:
-        readset.add(record)
+    if merge:
+        readset = kevlar.seqio.MergedAnnotatedReadSet(
+            readstream, ksize, memory, exact=exact
+        )
+        readset.load()
+    else:
+        if spilldir is None:
+            readset = kevlar.seqio.AnnotatedReadSet(ksize, memory, exact=exact)
+        else:
+            readset = kevlar.seqio.SpilledAnnotatedReadSet(
+                ksize, memory, exact=exact, tempdir=spilldir
+            )
+        for record in readstream:
+            readset.add(record)
     fpr = summarize_readset(readset, logstream)
     if fpr > maxfpr:
         raise KevlarUnsuitableFPRError('FPR too high, bailing out!!!')
@@ -126,18 +192,34 @@ def filter(readstream, mask=None, minabund=5, ksize=31, memory=1e6,
 
 
 def main(args):
+    if args.exact_abund and args.ksize > kevlar.kmercode.MAXK:
+        message = '--exact-abund supports k-mer sizes up to {:d}'.format(
+            kevlar.kmercode.MAXK
+        )
+        message += ', not {:d}; omit --exact-abund to recompute '.format(
+            args.ksize
+        )
+        message += 'abundances with a count table instead'
+        raise ValueError(message)
+
     timer = kevlar.Timer()
     timer.start()
 
     mask = load_mask(
         args.mask, args.ksize, args.mask_memory, maxfpr=args.mask_max_fpr,
-        savefile=args.save_mask, logstream=args.logfile
+        savefile=args.save_mask,
+        cachedir=args.mask_cache or kevlar.maskcache.default_dir(),
+        cachesize=args.mask_cache_size, logstream=args.logfile
     )
-    readstream = kevlar.seqio.afxstream(args.augfastq)
+    if args.merge:
+        readstream = args.augfastq
+    else:
+        readstream = kevlar.seqio.afxstream(args.augfastq)
     outstream = kevlar.open(args.out, 'w')
     filterstream = filter(
         readstream, mask, minabund=args.min_abund, ksize=args.ksize,
         memory=args.abund_memory, maxfpr=args.abund_max_fpr,
+        exact=args.exact_abund, spilldir=args.spill_dir, merge=args.merge,
         logstream=args.logfile
     )
     for record in filterstream:
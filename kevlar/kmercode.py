@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+"""
+2-bit encoding of k-mers.
+
+Each nucleotide is encoded with 2 bits (A=0, C=1, G=2, T=3), so a k-mer is
+represented by an integer of 2k bits, which fits in 64 bits for k <= 32. The
+canonical code of a k-mer is the smaller of the codes of the k-mer and its
+reverse complement. The encoding preserves lexicographic order, so the
+canonical code of a k-mer is the code of `kevlar.revcommin(kmer)`.
+
+Canonical codes are much cheaper to compute than `kevlar.revcommin`, and make
+much smaller dictionary keys than k-mer strings, so they are used to key the
+interesting k-mers of reads throughout kevlar. Use `decode` to recover the
+(canonical) k-mer sequence when needed.
+"""
+
+import numpy
+
+
+MAXK = 32
+BASES = 'ACGT'
+
+_forward = str.maketrans('ACGTacgt', '01230123')
+_reverse = str.maketrans('ACGTacgt', '32103210')
+_lookup = numpy.full(256, 4, dtype=numpy.uint8)
+for _code, _base in enumerate(BASES):
+    _lookup[ord(_base)] = _code
+    _lookup[ord(_base.lower())] = _code
+
+
+class KevlarKmerEncodingError(ValueError):
+    pass
+
+
+def _parse(digits, kmer):
+    if not digits.isdigit():
+        raise KevlarKmerEncodingError('cannot encode k-mer "' + kmer + '"')
+    return int(digits, 4)
+
+
+def encode(kmer):
+    """Compute the 2-bit code of a k-mer."""
+    return _parse(kmer.translate(_forward), kmer)
+
+
+def canonical(kmer):
+    """Compute the canonical 2-bit code of a k-mer."""
+    code = _parse(kmer.translate(_forward), kmer)
+    rccode = int(kmer[::-1].translate(_reverse), 4)
+    return code if code < rccode else rccode
+
+
+def decode(code, ksize):
+    """Recover the sequence of a k-mer from its 2-bit code."""
+    code = int(code)
+    bases = list()
+    for _ in range(ksize):
+        bases.append(BASES[code & 3])
+        code >>= 2
+    return ''.join(reversed(bases))
+
+
+def canonical_kmers(sequence, ksize):
+    """
+    Compute the canonical 2-bit codes of all k-mers in a sequence.
+
+    The codes are computed for all k-mers at once with NumPy, and returned as
+    an array of 64-bit unsigned integers. K-mers containing characters other
+    than A, C, G, and T are omitted.
+    """
+    if ksize > MAXK:
+        message = 'cannot encode {:d}-mers in 64 bits'.format(ksize)
+        raise KevlarKmerEncodingError(message)
+    bases = _lookup[numpy.frombuffer(sequence.encode('ascii'), numpy.uint8)]
+    nkmers = len(bases) - ksize + 1
+    if nkmers < 1:
+        return numpy.zeros(0, dtype=numpy.uint64)
+
+    invalid = numpy.concatenate(([0], numpy.cumsum(bases == 4)))
+    valid = invalid[ksize:] == invalid[:-ksize]
+    bases = (bases & 3).astype(numpy.uint64)
+    two, three = numpy.uint64(2), numpy.uint64(3)
+    codes = numpy.zeros(nkmers, dtype=numpy.uint64)
+    rccodes = numpy.zeros(nkmers, dtype=numpy.uint64)
+    for i in range(ksize):
+        window = bases[i:i + nkmers]
+        codes = (codes << two) | window
+        rccodes |= (three - window) << numpy.uint64(2 * i)
+    return numpy.minimum(codes, rccodes)[valid]
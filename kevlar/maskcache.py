@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+"""
+Persistent cache of reference and contaminant masks.
+
+Building a mask from a reference genome (see `kevlar.filter.load_mask`) means
+hashing every k-mer of billions of base pairs. The mask cache stores each mask
+it builds as a `.mmsketch` file (see `kevlar.mmsketch`) in a cache directory,
+named by a key computed from the MD5 checksums of the input files, the k-mer
+size, and the table size. A subsequent run with the same inputs and settings
+maps the cached mask into memory instead of building it again.
+
+Checksums of input files are themselves cached (by file path, size, and
+modification time) so that unchanged inputs are not read again just to look up
+their mask. When the total size of the cached masks exceeds the cache size,
+the least recently used masks are evicted.
+"""
+
+import builtins
+import hashlib
+import json
+import os
+import sys
+import kevlar
+
+
+EXTENSION = kevlar.mmsketch.EXTENSION
+CHECKSUMS = 'checksums.json'
+DEFAULT_SIZE = 20e9
+
+
+def default_dir():
+    """Get the cache directory from the KEVLAR_MASK_CACHE variable, if set."""
+    return os.environ.get('KEVLAR_MASK_CACHE') or None
+
+
+def _write_json(data, filename):
+    tempfile = '{:s}.tmp{:d}'.format(filename, os.getpid())
+    with builtins.open(tempfile, 'w') as fh:
+        json.dump(data, fh)
+    os.replace(tempfile, filename)
+
+
+def checksums(filenames, cachedir):
+    """
+    Compute the MD5 checksums of the specified files.
+
+    Checksums are remembered in the cache directory, and only recomputed for
+    files whose size or modification time has changed.
+    """
+    checksumfile = os.path.join(cachedir, CHECKSUMS)
+    known = dict()
+    if os.path.exists(checksumfile):
+        with builtins.open(checksumfile, 'r') as fh:
+            known = json.load(fh)
+
+    result = list()
+    updated = False
+    for filename in filenames:
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        entry = known.get(path)
+        if entry is None or entry['size'] != stat.st_size or \
+                entry['mtime'] != stat.st_mtime_ns:
+            md5 = kevlar.count.describe_inputs([path])[0]['md5']
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                     'md5': md5}
+            known[path] = entry
+            updated = True
+        result.append(entry['md5'])
+    if updated:
+        _write_json(known, checksumfile)
+    return result
+
+
+def cache_key(md5s, ksize, buckets, ntables=4):
+    """Compute the cache key of a mask from its inputs and table size."""
+    description = {
+        'inputs': list(md5s),
+        'ksize': ksize,
+        'buckets': int(buckets),
+        'ntables': ntables,
+    }
+    data = json.dumps(description, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def entry_file(cachedir, key):
+    return os.path.join(cachedir, key + EXTENSION)
+
+
+def lookup(cachedir, key):
+    """
+    Load a cached mask, or return `None` if it is not in the cache.
+
+    Loading a mask marks it as recently used.
+    """
+    filename = entry_file(cachedir, key)
+    if not os.path.exists(filename):
+        return None
+    os.utime(filename)
+    return kevlar.mmsketch.load(filename)
+
+
+def evict(cachedir, maxsize, keep=None):
+    """
+    Evict the least recently used masks until the cache fits in `maxsize`.
+
+    The mask with key `keep` is never evicted. Returns the evicted keys.
+    """
+    entries = list()
+    for filename in os.listdir(cachedir):
+        if not filename.endswith(EXTENSION):
+            continue
+        stat = os.stat(os.path.join(cachedir, filename))
+        entries.append((stat.st_mtime, stat.st_size, filename))
+    total = sum(size for mtime, size, filename in entries)
+
+    evicted = list()
+    for mtime, size, filename in sorted(entries):
+        if total <= maxsize:
+            break
+        key = filename[:-len(EXTENSION)]
+        if key == keep:
+            continue
+        os.remove(os.path.join(cachedir, filename))
+        total -= size
+        evicted.append(key)
+    return evicted
+
+
+def store(mask, cachedir, key, fpr=None, maxsize=DEFAULT_SIZE,
+          logstream=sys.stderr):
+    """Store a mask in the cache, evicting other masks if necessary."""
+    filename = entry_file(cachedir, key)
+    tempfile = '{:s}.tmp{:d}'.format(filename, os.getpid())
+    kevlar.mmsketch.save(mask, tempfile, fpr=fpr)
+    os.replace(tempfile, filename)
+    for evictedkey in evict(cachedir, maxsize, keep=key):
+        message = '    evicted mask {:s} from cache'.format(evictedkey)
+        print(message, file=logstream)
+    return filename
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+"""
+Memory-mapped k-mer sketches.
+
+A `.mmsketch` file holds a small JSON header describing a khmer sketch,
+followed by the raw tables of the sketch, each aligned to a page boundary.
+Loading a `.mmsketch` file maps the tables into memory read-only instead of
+reading them. The operating system's page cache then holds a single copy of
+the tables, shared by every process (and every worker of a process pool)
+using the sketch, and loading does not wait for the entire file to be read.
+The header alone can be read to inspect a sketch or check its compatibility
+with other sketches (see `kevlar sketch-info`).
+"""
+
+import builtins
+import json
+import struct
+import khmer
+import numpy
+import kevlar
+
+
+MAGIC = b'KVLRMMSK'
+EXTENSION = '.mmsketch'
+PAGESIZE = 4096
+
+sketch_types = {
+    t.__name__: t for t in (
+        khmer.Counttable, khmer.SmallCounttable, khmer.Nodetable,
+        khmer.Countgraph, khmer.SmallCountgraph, khmer.Nodegraph,
+    )
+}
+
+
+class KevlarMappedSketchError(ValueError):
+    pass
+
+
+def page_align(offset):
+    return -(-offset // PAGESIZE) * PAGESIZE
+
+
+def is_mmsketch(filename):
+    """Determine whether a file is a `.mmsketch` file from its contents."""
+    try:
+        with builtins.open(filename, 'rb') as fh:
+            return fh.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def save(sketch, filename, fpr=None, metadata=None):
+    """
+    Save a khmer sketch (or a mapped sketch) in the `.mmsketch` format.
+
+    The file is self-describing: the header records the sketch type, k-mer
+    size, and table sizes, as well as the sketch's occupancy and estimated
+    false positive rate, so that they need not be recomputed when the sketch
+    is loaded. If the FPR has already been computed, it can be provided with
+    `fpr`. Any additional `metadata` (such as banding parameters or input
+    checksums) are also stored in the header.
+    """
+    tables = [numpy.frombuffer(t, dtype=numpy.uint8)
+              for t in sketch.get_raw_tables()]
+    header = kevlar.sketch.describe(sketch, fpr=fpr, metadata=metadata)
+    header.update({
+        'version': 2,
+        'tablebytes': [len(table) for table in tables],
+    })
+    headerdata = json.dumps(header).encode('utf-8')
+    with builtins.open(filename, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<Q', len(headerdata)))
+        fh.write(headerdata)
+        for table in tables:
+            offset = fh.tell()
+            fh.write(b'\0' * (page_align(offset) - offset))
+            fh.write(memoryview(table))
+
+
+def read_header(filename):
+    """
+    Read the header of a `.mmsketch` file without mapping its tables.
+
+    Returns the header and the offset at which the header ends.
+    """
+    with builtins.open(filename, 'rb') as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            message = 'not a memory-mapped sketch file: ' + filename
+            raise KevlarMappedSketchError(message)
+        headerlength, = struct.unpack('<Q', fh.read(8))
+        header = json.loads(fh.read(headerlength).decode('utf-8'))
+    return header, len(MAGIC) + 8 + headerlength
+
+
+class MappedSketch(object):
+    """
+    Read-only k-mer sketch backed by a memory-mapped `.mmsketch` file.
+
+    Supports the subset of the khmer sketch API used by kevlar for querying
+    k-mer abundances. K-mers are hashed with a tiny khmer sketch of the same
+    family (table or graph), so that hash values and table bins are identical
+    to those of the original sketch. Counttable abundances larger than 255
+    are reported as 255, since khmer does not store them in its raw tables.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        header, offset = read_header(filename)
+        if header['sketchtype'] not in sketch_types:
+            message = 'unsupported sketch type ' + header['sketchtype']
+            raise KevlarMappedSketchError(message)
+        self.sketchtype = sketch_types[header['sketchtype']]
+        self._ksize = header['ksize']
+        self._sizes = header['tablesizes']
+        self._occupied = header['occupied']
+        self._unique = header['unique']
+
+        self._data = numpy.memmap(filename, dtype=numpy.uint8, mode='r')
+        self._tables = list()
+        for nbytes in header['tablebytes']:
+            offset = page_align(offset)
+            if offset + nbytes > len(self._data):
+                message = 'truncated memory-mapped sketch file: ' + filename
+                raise KevlarMappedSketchError(message)
+            self._tables.append(self._data[offset:offset + nbytes])
+            offset += nbytes
+
+        graph = self.sketchtype in kevlar.sketch.graph_types
+        hashtype = khmer.Nodegraph if graph else khmer.Nodetable
+        self._hasher = hashtype(self._ksize, 1000, 1)
+        self._storage = kevlar.sketch.storage(self.sketchtype)
+
+    def ksize(self):
+        return self._ksize
+
+    def hashsizes(self):
+        return list(self._sizes)
+
+    def n_tables(self):
+        return len(self._sizes)
+
+    def n_occupied(self):
+        return self._occupied
+
+    def n_unique_kmers(self):
+        return self._unique
+
+    def get_raw_tables(self):
+        return [memoryview(table) for table in self._tables]
+
+    def hash(self, kmer):
+        return self._hasher.hash(kmer)
+
+    def get_kmers(self, sequence):
+        return self._hasher.get_kmers(sequence)
+
+    def get_kmer_hashes(self, sequence):
+        return self._hasher.get_kmer_hashes(sequence)
+
+    def lookup(self, hashes):
+        """Look up the abundances of many k-mer hashes, as a numpy array."""
+        hashes = numpy.asarray(hashes, dtype=numpy.uint64)
+        counts = None
+        for size, table in zip(self._sizes, self._tables):
+            bins = hashes % numpy.uint64(size)
+            values = kevlar.sketch.bin_lookup(table, bins, self._storage)
+            counts = values if counts is None else numpy.minimum(counts,
+                                                                 values)
+        return counts.astype(numpy.int64)
+
+    def get(self, kmer):
+        if not isinstance(kmer, int):
+            kmer = self.hash(kmer)
+        return int(self.lookup([kmer])[0])
+
+    def get_kmer_counts(self, sequence):
+        return self.lookup(self.get_kmer_hashes(sequence)).tolist()
+
+
+def load(filename):
+    """Map a `.mmsketch` file into memory."""
+    return MappedSketch(filename)
+
+
+def unmap(sketch):
+    """
+    Copy a mapped sketch into a new, writable khmer sketch.
+
+    Mapped sketches are read-only and cannot be saved in khmer's format, so
+    this is needed to save them as khmer sketches.
+    """
+    sizes = sketch.hashsizes()
+    copy = sketch.sketchtype(sketch.ksize(), sizes[0] + 1, len(sizes))
+    tables = [numpy.asarray(t) for t in copy.get_raw_tables()]
+    if copy.hashsizes() != sizes or \
+            [len(t) for t in tables] != [len(t) for t in sketch._tables]:
+        message = 'unable to allocate a sketch with the table sizes of '
+        message += sketch.filename
+        raise KevlarMappedSketchError(message)
+    for table, mapped in zip(tables, sketch._tables):
+        table[:] = mapped
+    return copy
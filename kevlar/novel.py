@@ -7,11 +7,17 @@
 # licensed under the MIT license: see LICENSE.
 # -----------------------------------------------------------------------------
 
+from collections import deque, OrderedDict
+from hashlib import md5
+from itertools import chain, islice
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import re
 import sys
 
 import khmer
 from khmer import khmer_args
+import numpy
 import kevlar
 
 
@@ -56,7 +62,19 @@ def kmer_is_interesting(kmer, casecounts, controlcounts, case_min=5,
 
 def load_samples(counttables=None, filelists=None, ksize=31, memory=1e6,
                  maxfpr=0.2, numbands=None, band=None, numthreads=1,
-                 logstream=sys.stderr):
+                 ceiling=None, autosize=False, samplereads=None,
+                 targetfpr=0.05, logstream=sys.stderr):
+    """
+    Load k-mer abundances for a set of samples.
+
+    Abundances are loaded from pre-computed sketches if `counttables` is
+    provided, or computed from `filelists` (a list of FASTA/FASTQ file lists,
+    one list per sample) otherwise. When computing abundances, `ceiling` can be
+    used to store abundances only up to a given value in a more compact sketch
+    (see `kevlar.count.load_sample_seqfile`), and `autosize` can be used to
+    choose the size of each sketch within the `memory` budget from a
+    cardinality pre-pass over its input.
+    """
     assert counttables or filelists
     if counttables:
         numctrls = len(counttables)
@@ -72,31 +90,199 @@ def load_samples(counttables=None, filelists=None, ksize=31, memory=1e6,
         for filelist in filelists:
             sample = kevlar.count.load_sample_seqfile(
                 filelist, ksize, memory, maxfpr=maxfpr, numbands=numbands,
-                band=band, numthreads=numthreads, logfile=logstream
+                band=band, numthreads=numthreads, ceiling=ceiling,
+                autosize=autosize, samplereads=samplereads,
+                targetfpr=targetfpr, logfile=logstream
             )
             samples.append(sample)
     return samples
 
 
-def novel(casestream, casecounts, controlcounts, ksize=31, abundscreen=None,
-          casemin=5, ctrlmax=0, numbands=None, band=None, skipuntil=None,
-          updateint=10000, logstream=sys.stderr):
-    numbands_unset = not numbands
-    band_unset = not band and band != 0
-    if numbands_unset is not band_unset:
-        raise ValueError('Must specify `numbands` and `band` together')
+def kmer_abundances(sequence, casecounts, controlcounts):
+    """
+    Look up the abundance of every k-mer in a read in every sample.
 
-    if band is not None and band < 0:
-        maxband = numbands - 1
-        message = '`band` must be a value between 0 and {:d}'.format(maxband)
-        message += ' (`numbands` - 1), inclusive'
-        raise ValueError(message)
+    Abundances are retrieved in bulk, with a single call per sample, rather
+    than one call per k-mer per sample. Returns two 2D arrays of integers, one
+    for the case samples and one for the control samples, each with one row
+    per sample and one column per k-mer.
+    """
+    numkmers = len(sequence) - casecounts[0].ksize() + 1
+    caseabunds = numpy.array(
+        [ct.get_kmer_counts(sequence) for ct in casecounts], dtype=numpy.int64
+    ).reshape(len(casecounts), numkmers)
+    ctrlabunds = numpy.array(
+        [ct.get_kmer_counts(sequence) for ct in controlcounts],
+        dtype=numpy.int64
+    ).reshape(len(controlcounts), numkmers)
+    return caseabunds, ctrlabunds
 
-    timer = kevlar.Timer()
-    timer.start()
-    nkmers = 0
-    nreads = 0
-    unique_kmers = set()
+
+def interesting_kmer_mask(caseabunds, ctrlabunds, case_min=5, ctrl_max=1,
+                          screen_thresh=None, kmermask=None):
+    """
+    Vectorized equivalent of `kmer_is_interesting` for many k-mers at once.
+
+    The `caseabunds` and `ctrlabunds` arrays are as returned by
+    `kmer_abundances`. If `kmermask` is provided, only k-mers (columns) for
+    which the mask is true are considered.
+
+    Returns 2 values:
+    - boolean array indicating which k-mers are interesting
+    - boolean indicating whether the entire read should be discarded
+    """
+    numkmers = caseabunds.shape[1]
+    casefail = caseabunds < case_min
+    anyfail = casefail.any(axis=0)
+    interesting = ~anyfail
+    if ctrlabunds.shape[0] > 0:
+        interesting &= (ctrlabunds <= ctrl_max).all(axis=0)
+    if kmermask is not None:
+        interesting &= kmermask
+        anyfail &= kmermask
+
+    discard = False
+    if screen_thresh:
+        # Like `kmer_is_interesting`, only the first case sample failing the
+        # `case_min` threshold is checked against the screening threshold.
+        firstfail = casefail.argmax(axis=0)
+        firstabund = caseabunds[firstfail, numpy.arange(numkmers)]
+        discard = bool((anyfail & (firstabund < screen_thresh)).any())
+    return interesting, discard
+
+
+def scan_read(sequence, casecounts, controlcounts, casemin=5, ctrlmax=0,
+              abundscreen=None, numbands=None, band=None, prefilter=None):
+    """
+    Find all "interesting" k-mers in a single read.
+
+    Returns a list of `KmerOfInterest` objects. The list is empty if the read
+    contains no interesting k-mers, or if the entire read should be discarded
+    due to the abundance screen. If `numbands` and `band` are specified, only
+    k-mers belonging to the specified (0-based) band are considered. If a
+    `CandidatePrefilter` is provided, reads without any candidate k-mers are
+    rejected before looking up k-mer abundances in the full sketches.
+    """
+    kmermask = None
+    if numbands:
+        hashes = casecounts[0].get_kmer_hashes(sequence)
+        kmermask = kevlar.sketch.hash_bands(hashes, numbands) == band
+    if prefilter:
+        candidates = prefilter.candidates(sequence)
+        if kmermask is not None:
+            candidates &= kmermask
+        if not candidates.any():
+            return list()
+    kmers = casecounts[0].get_kmers(sequence)
+    caseabunds, ctrlabunds = kmer_abundances(
+        sequence, casecounts, controlcounts
+    )
+    interesting, discard = interesting_kmer_mask(
+        caseabunds, ctrlabunds, case_min=casemin, ctrl_max=ctrlmax,
+        screen_thresh=abundscreen, kmermask=kmermask,
+    )
+    if discard:
+        return list()
+    return make_ikmers(kmers, numpy.flatnonzero(interesting), caseabunds,
+                       ctrlabunds)
+
+
+def band_abundances(sequence, hashes, indices, sketches):
+    """
+    Look up the abundances of the k-mers of one band in several sketches.
+
+    As in `kmer_abundances`, the abundances are retrieved in bulk, with a
+    single call per sketch: sketches that support looking up many hashes at
+    once (such as `kevlar.mmsketch.MappedSketch`) are queried with the hashes
+    of the band's k-mers only, and other sketches with the entire read. The
+    k-mers of the band are given by their `indices` in the read. Returns a 2D
+    array of integers with one row per sketch and one column per k-mer.
+    """
+    abunds = numpy.zeros((len(sketches), len(indices)), dtype=numpy.int64)
+    for row, sketch in zip(abunds, sketches):
+        if hasattr(sketch, 'lookup'):
+            row[:] = sketch.lookup(hashes[indices])
+        else:
+            row[:] = numpy.array(sketch.get_kmer_counts(sequence))[indices]
+    return abunds
+
+
+def scan_read_multiband(sequence, bandsketches, numbands, casemin=5,
+                        ctrlmax=0, abundscreen=None, prefilters=None):
+    """
+    Find all "interesting" k-mers in a single read, for several bands at once.
+
+    The `bandsketches` dictionary maps each (0-based) band to a tuple of case
+    and control sketches computed for that band. Each k-mer is hashed once and
+    looked up only in the sketches of the band to which it belongs.
+
+    Returns a dictionary mapping each band to a list of `KmerOfInterest`
+    objects, as computed by `scan_read` for that band alone. In particular, the
+    abundance screen applies to each band independently, just as it would if
+    each band were processed in a separate pass. If `prefilters` is provided,
+    it maps each band to a `CandidatePrefilter` for that band.
+    """
+    firstcase = next(iter(bandsketches.values()))[0][0]
+    kmers = firstcase.get_kmers(sequence)
+    hashes = numpy.array(firstcase.get_kmer_hashes(sequence),
+                         dtype=numpy.uint64)
+    kmerbands = kevlar.sketch.hash_bands(hashes, numbands)
+
+    result = dict()
+    for band, (casecounts, controlcounts) in bandsketches.items():
+        inband = kmerbands == band
+        if prefilters:
+            if not (prefilters[band].candidates(sequence) & inband).any():
+                continue
+        indices = numpy.flatnonzero(inband)
+        if len(indices) == 0:
+            continue
+        caseabunds = band_abundances(sequence, hashes, indices, casecounts)
+        ctrlabunds = band_abundances(sequence, hashes, indices, controlcounts)
+        interesting, discard = interesting_kmer_mask(
+            caseabunds, ctrlabunds, case_min=casemin, ctrl_max=ctrlmax,
+            screen_thresh=abundscreen,
+        )
+        if discard:
+            continue
+        columns = numpy.flatnonzero(interesting)
+        ikmers = make_ikmers(kmers, indices[interesting], caseabunds,
+                             ctrlabunds, columns=columns)
+        if len(ikmers) > 0:
+            result[band] = ikmers
+    return result
+
+
+def make_ikmers(kmers, offsets, caseabunds, ctrlabunds, columns=None):
+    """
+    Create `KmerOfInterest` objects for the k-mers at the given offsets.
+
+    By default, the abundances of the k-mer at offset `i` are taken from column
+    `i` of the `caseabunds` and `ctrlabunds` arrays. If the arrays only contain
+    a subset of the read's k-mers, `columns` gives the column corresponding to
+    each offset.
+    """
+    if columns is None:
+        columns = offsets
+    abunds = numpy.vstack((caseabunds, ctrlabunds))
+    ikmers = list()
+    for offset, column in zip(offsets, columns):
+        abund = [int(a) for a in abunds[:, column]]
+        ikmer = kevlar.KmerOfInterest(sequence=kmers[offset],
+                                      offset=int(offset), abund=abund)
+        ikmers.append(ikmer)
+    return ikmers
+
+
+def candidate_reads(casestream, ksize, skipuntil=None, timer=None,
+                    updateint=10000, logstream=sys.stderr):
+    """
+    Select case reads to be scanned for interesting k-mers.
+
+    Reads preceding `skipuntil` (if specified), reads shorter than `ksize`, and
+    reads containing non-ACGT characters are skipped. Progress is reported
+    every `updateint` reads.
+    """
     for n, record in enumerate(casestream, 1):
         if skipuntil:
             if record.name == skipuntil:
@@ -105,7 +291,7 @@ def novel(casestream, casecounts, controlcounts, ksize=31, abundscreen=None,
                 print('[kevlar::novel]', message, file=logstream)
                 skipuntil = False
             continue
-        if n > 0 and n % updateint == 0:
+        if timer and n > 0 and n % updateint == 0:
             elapsed = timer.probe()
             msg = '    processed {} reads'.format(n)
             msg += ' in {:.2f} seconds...'.format(elapsed)
@@ -116,72 +302,568 @@ def novel(casestream, casecounts, controlcounts, ksize=31, abundscreen=None,
             # This check should be temporary; hopefully khmer will handle
             # this soon.
             continue
+        yield record
 
-        discard_read = False
-        record.ikmers = list()
-        for i, kmer in enumerate(casecounts[0].get_kmers(record.sequence)):
-            if numbands:
-                khash = cases[0].hash(kmer)
-                if khash & (numbands - 1) != band - 1:
-                    continue
-            interesting, discard, caseabund, ctrlabund = kmer_is_interesting(
-                kmer, casecounts, controlcounts, case_min=casemin,
-                ctrl_max=ctrlmax, screen_thresh=abundscreen,
-            )
-            if discard:
-                discard_read = True
+
+class DistinctKmerCounter(object):
+    """
+    Count the distinct (canonical) k-mers observed in a stream of k-mers.
+
+    By default, the count is estimated with a HyperLogLog counter, which uses
+    a small, fixed amount of memory regardless of the number of k-mers. If
+    `exact` is true, the canonical 2-bit codes of all distinct k-mers are
+    stored in a set instead (see `kevlar.kmercode`).
+    """
+    def __init__(self, exact=False, error_rate=0.01):
+        self.exact = exact
+        self.error_rate = error_rate
+        self._kmers = set()
+        self._hll = None
+
+    def add(self, kmer):
+        if self.exact:
+            self._kmers.add(kevlar.kmercode.canonical(kmer))
+            return
+        if self._hll is None:
+            self._hll = khmer.HLLCounter(self.error_rate, len(kmer))
+        self._hll.add(kevlar.revcommin(kmer))
+
+    def count(self):
+        if self.exact:
+            return len(self._kmers)
+        if self._hll is None:
+            return 0
+        return self._hll.estimate_cardinality()
+
+
+class ScanCache(object):
+    """
+    Bounded LRU cache of read scanning results, keyed by read sequence.
+
+    Duplicate reads (such as PCR or optical duplicates) yield identical scan
+    results, so caching the results of recently scanned sequences lets repeated
+    sequences skip k-mer lookups entirely. Sequences are keyed by their MD5
+    digest to bound the memory used per entry.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    @staticmethod
+    def key(sequence):
+        return md5(sequence.encode('ascii')).digest()
+
+    def get(self, sequence):
+        """Return the cached result for a sequence, or `None` on a miss."""
+        key = self.key(sequence)
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._results.move_to_end(key)
+        # Give each read its own copy, since records may be modified later.
+        if isinstance(result, dict):
+            return {band: list(ikmers) for band, ikmers in result.items()}
+        return list(result)
+
+    def put(self, sequence, result):
+        key = self.key(sequence)
+        self._results[key] = result
+        self._results.move_to_end(key)
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+
+# Scanning function and arguments of a worker process, set by
+# `_init_scan_worker` when the process starts. Every worker process has its
+# own copy, so pools with different settings do not interfere.
+_worker_settings = dict()
+
+
+def _init_scan_worker(scanfunc, kwargs):
+    _worker_settings['scanfunc'] = scanfunc
+    _worker_settings['kwargs'] = kwargs
+
+
+def prefetch_counts(sequences, kwargs):
+    """
+    Query served sketches for a whole batch of reads at once.
+
+    The `kwargs` are the scanning arguments of `scan_read` or
+    `scan_read_multiband`. Each served sketch (see `kevlar.serve`) among them
+    is replaced by a `kevlar.serve.BatchCounts` object holding the abundances
+    of all k-mers in `sequences`, retrieved with a single request, so that
+    scanning the batch does not cost a round trip to the server per read and
+    per sample. Reads rejected by the candidate prefilter(s) are not queried.
+    """
+    remote = kevlar.serve.RemoteSketch
+    if 'bandsketches' in kwargs:
+        samples = list(kwargs['bandsketches'].values())
+        prefilters = list((kwargs.get('prefilters') or {}).values())
+    else:
+        samples = [(kwargs['casecounts'], kwargs['controlcounts'])]
+        prefilters = [kwargs['prefilter']] if kwargs.get('prefilter') else []
+    if not any(isinstance(sketch, remote) for casecounts, controlcounts
+               in samples for sketch in chain(casecounts, controlcounts)):
+        return kwargs
+    if prefilters:
+        sequences = [seq for seq in sequences
+                     if any(p.candidates(seq).any() for p in prefilters)]
+    if len(sequences) == 0:
+        return kwargs
+
+    def fetch(sketches):
+        return [kevlar.serve.BatchCounts(sketch, sequences)
+                if isinstance(sketch, remote) else sketch
+                for sketch in sketches]
+
+    kwargs = dict(kwargs)
+    if 'bandsketches' in kwargs:
+        kwargs['bandsketches'] = {
+            band: (fetch(casecounts), fetch(controlcounts))
+            for band, (casecounts, controlcounts)
+            in kwargs['bandsketches'].items()
+        }
+    else:
+        kwargs['casecounts'] = fetch(kwargs['casecounts'])
+        kwargs['controlcounts'] = fetch(kwargs['controlcounts'])
+    return kwargs
+
+
+def _scan_batch(sequences, scanfunc=None, kwargs=None):
+    if scanfunc is None:
+        scanfunc = _worker_settings['scanfunc']
+        kwargs = _worker_settings['kwargs']
+    kwargs = prefetch_counts(sequences, kwargs)
+    return [scanfunc(seq, **kwargs) for seq in sequences]
+
+
+class ScanPool(object):
+    """
+    Pool of workers scanning batches of reads for `scan_reads`.
+
+    Worker processes are forked, so that they inherit the loaded sketches from
+    the parent (read-only, copy-on-write) rather than having them pickled and
+    sent to each worker. The scanning function and its keyword arguments are
+    handed to each worker when it starts, without pickling. On platforms that
+    do not support forking, a pool of threads is used instead.
+
+    Forking a process while other threads are running can leave locks held by
+    those threads locked forever in the child processes. The pool must
+    therefore be created before any background threads are started, in
+    particular before compressed files are opened with `kevlar.open` (see
+    `kevlar.pipeio`).
+    """
+    def __init__(self, numworkers, scanfunc=scan_read, **kwargs):
+        self.numworkers = numworkers
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            self._pool = context.Pool(numworkers, _init_scan_worker,
+                                      (scanfunc, kwargs))
+            self._taskargs = ()
+        else:  # pragma: no cover
+            self._pool = ThreadPool(numworkers)
+            self._taskargs = (scanfunc, kwargs)
+
+    def scan(self, sequences):
+        """Submit a batch of sequences, returning an asynchronous result."""
+        return self._pool.apply_async(_scan_batch,
+                                      (sequences, ) + self._taskargs)
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+def scan_reads(records, scanfunc=scan_read, numworkers=1, batchsize=1000,
+               cache=None, pool=None, **kwargs):
+    """
+    Scan a stream of reads for interesting k-mers, possibly in parallel.
+
+    Yields a tuple of (record, result) for each input record, where `result`
+    is computed by calling `scanfunc` (`scan_read` by default) on the read
+    sequence with the given keyword arguments. Reads are grouped into batches
+    of `batchsize`, so that served sketches are queried once per batch (see
+    `prefetch_counts`), and with `numworkers > 1` the batches are distributed
+    to a `ScanPool`. Results are always yielded in input order, and only a
+    limited number of batches are held in memory at any given time.
+
+    A `ScanPool` created with the same scanning function and arguments can be
+    provided with `pool`; it is then used regardless of `numworkers`, and left
+    open for the caller to close. Otherwise, a pool is created when scanning
+    starts, which is only safe if no background threads are running (see
+    `ScanPool`).
+
+    If a `ScanCache` is provided, reads whose sequence has been scanned
+    recently are not scanned again; the cached result is used instead.
+    """
+    if pool is None and numworkers < 2:
+        while True:
+            batch = list(islice(records, batchsize))
+            if len(batch) == 0:
                 break
-            if not interesting:
-                continue
-            abund = caseabund + ctrlabund
-            ikmer = kevlar.KmerOfInterest(sequence=kmer, offset=i, abund=abund)
-            record.ikmers.append(ikmer)
-            minkmer = kevlar.revcommin(kmer)
-            unique_kmers.add(minkmer)
-
-        read_kmers = len(record.ikmers)
-        if discard_read or read_kmers == 0:
+            if cache is not None:
+                cached = [cache.get(record.sequence) for record in batch]
+            else:
+                cached = [None] * len(batch)
+            sequences = [record.sequence for record, ikmers
+                         in zip(batch, cached) if ikmers is None]
+            scanned = iter(_scan_batch(sequences, scanfunc, kwargs))
+            for record, result in zip(batch, cached):
+                if result is None:
+                    result = next(scanned)
+                    if cache is not None:
+                        cache.put(record.sequence, result)
+                yield record, result
+        return
+
+    ownpool = pool is None
+    if ownpool:
+        pool = ScanPool(numworkers, scanfunc, **kwargs)
+
+    def collect(batch, cached, result):
+        # Merge freshly scanned results with cached results, in input order.
+        scanned = iter(result.get())
+        for record, ikmers in zip(batch, cached):
+            if ikmers is None:
+                ikmers = next(scanned)
+                if cache is not None:
+                    cache.put(record.sequence, ikmers)
+            yield record, ikmers
+
+    pending = deque()
+    try:
+        while True:
+            batch = list(islice(records, batchsize))
+            if len(batch) == 0:
+                break
+            if cache is not None:
+                cached = [cache.get(record.sequence) for record in batch]
+            else:
+                cached = [None] * len(batch)
+            sequences = [record.sequence for record, ikmers
+                         in zip(batch, cached) if ikmers is None]
+            pending.append((batch, cached, pool.scan(sequences)))
+            if len(pending) > 2 * pool.numworkers:
+                for record, ikmers in collect(*pending.popleft()):
+                    yield record, ikmers
+        while len(pending) > 0:
+            for record, ikmers in collect(*pending.popleft()):
+                yield record, ikmers
+    finally:
+        if ownpool:
+            pool.close()
+
+
+def check_band_args(numbands, band):
+    numbands_unset = not numbands
+    band_unset = not band and band != 0
+    if numbands_unset is not band_unset:
+        raise ValueError('Must specify `numbands` and `band` together')
+
+    bands = band if isinstance(band, (list, tuple)) else [band]
+    for b in bands:
+        if b is not None and (b < 0 or b >= numbands):
+            maxband = numbands - 1
+            message = '`band` must be a value between 0 and '
+            message += '{:d} (`numbands` - 1), inclusive'.format(maxband)
+            raise ValueError(message)
+
+
+def _novel(casestream, ksize, scanfunc, scanargs, skipuntil=None,
+           numworkers=1, batchsize=1000, updateint=10000, checkpoint=None,
+           cachesize=0, exactcount=False, readindex=None, pool=None,
+           logstream=sys.stderr):
+    timer = kevlar.Timer()
+    timer.start()
+
+    nkmers = 0
+    nreads = 0
+    unique_kmers = DistinctKmerCounter(exact=exactcount)
+    cache = ScanCache(cachesize) if cachesize else None
+    scanner = scan_reads(
+        candidate_reads(casestream, ksize, skipuntil, timer, updateint,
+                        logstream),
+        scanfunc=scanfunc, numworkers=numworkers, batchsize=batchsize,
+        cache=cache, pool=pool, **scanargs
+    )
+    for n, (record, result) in enumerate(scanner):
+        if readindex is not None:
+            record.readindex = readindex + n
+        if isinstance(result, dict):
+            record.bandikmers = result
+            ikmers = [k for band in sorted(result) for k in result[band]]
+        else:
+            ikmers = result
+        record.ikmers = ikmers
+        if len(ikmers) == 0:
+            if checkpoint:
+                checkpoint(record)
             continue
+        for ikmer in ikmers:
+            unique_kmers.add(ikmer.sequence)
 
         nreads += 1
-        nkmers += read_kmers
+        nkmers += len(ikmers)
         yield record
+        if checkpoint:
+            # The consumer has finished writing this record's output.
+            checkpoint(record)
 
     elapsed = timer.stop()
     message = 'Found {:d} instances'.format(nkmers)
-    message += ' of {:d} unique novel kmers'.format(len(unique_kmers))
+    if exactcount:
+        message += ' of {:d}'.format(unique_kmers.count())
+    else:
+        message += ' of ~{:d}'.format(unique_kmers.count())
+    message += ' unique novel kmers'
     message += ' in {:d} reads'.format(nreads)
     message += ' in {:.2f} seconds'.format(elapsed)
+    if cache is not None:
+        message += '; read cache {:d} hits,'.format(cache.hits)
+        message += ' {:d} misses'.format(cache.misses)
     print('[kevlar::novel]', message, file=logstream)
 
 
-def main(args):
-    timer = kevlar.Timer()
-    timer.start()
-    if (not args.num_bands) is not (not args.band):
-        raise ValueError('Must specify --num-bands and --band together')
-    myband = args.band - 1 if args.band else None
+def scan_settings(casecounts, controlcounts, casemin=5, ctrlmax=0,
+                  abundscreen=None, numbands=None, band=None, prefilter=None):
+    """
+    Select the function and arguments for scanning reads with `novel`.
 
-    timer.start('loadall')
-    print('[kevlar::novel] Loading control samples', file=args.logfile)
-    timer.start('loadctrl')
+    Returns the scanning function and a dictionary of its keyword arguments,
+    as passed to `scan_reads` or used to create a `ScanPool`.
+    """
+    check_band_args(numbands, band)
+    scanargs = dict(
+        casecounts=casecounts, controlcounts=controlcounts, casemin=casemin,
+        ctrlmax=ctrlmax, abundscreen=abundscreen, numbands=numbands,
+        band=band, prefilter=prefilter,
+    )
+    return scan_read, scanargs
+
+
+def scan_settings_multiband(bandsketches, numbands, casemin=5, ctrlmax=0,
+                            abundscreen=None, prefilters=None):
+    """Like `scan_settings`, for scanning reads with `novel_multiband`."""
+    check_band_args(numbands, sorted(bandsketches))
+    scanargs = dict(
+        bandsketches=bandsketches, numbands=numbands, casemin=casemin,
+        ctrlmax=ctrlmax, abundscreen=abundscreen, prefilters=prefilters,
+    )
+    return scan_read_multiband, scanargs
+
+
+def novel(casestream, casecounts, controlcounts, ksize=31, abundscreen=None,
+          casemin=5, ctrlmax=0, numbands=None, band=None, skipuntil=None,
+          numworkers=1, batchsize=1000, updateint=10000, prefilter=None,
+          checkpoint=None, cachesize=0, exactcount=False, readindex=None,
+          logstream=sys.stderr):
+    """
+    Scan case reads for interesting k-mers.
+
+    Each read with at least one interesting k-mer is yielded, with its
+    interesting k-mers in its `ikmers` attribute. If `readindex` is specified,
+    each read is also annotated with its index among the scanned reads (offset
+    by `readindex`) in its `readindex` attribute, so that the outputs of runs
+    on the same case reads can be merged (see `kevlar filter --merge`).
+    """
+    scanfunc, scanargs = scan_settings(
+        casecounts, controlcounts, casemin=casemin, ctrlmax=ctrlmax,
+        abundscreen=abundscreen, numbands=numbands, band=band,
+        prefilter=prefilter
+    )
+    readstream = _novel(
+        casestream, ksize, scanfunc, scanargs, skipuntil=skipuntil,
+        numworkers=numworkers, batchsize=batchsize, updateint=updateint,
+        checkpoint=checkpoint, cachesize=cachesize, exactcount=exactcount,
+        readindex=readindex, logstream=logstream
+    )
+    for record in readstream:
+        yield record
+
+
+def novel_multiband(casestream, bandsketches, numbands, ksize=31,
+                    abundscreen=None, casemin=5, ctrlmax=0, skipuntil=None,
+                    numworkers=1, batchsize=1000, updateint=10000,
+                    prefilters=None, checkpoint=None, cachesize=0,
+                    exactcount=False, readindex=None, logstream=sys.stderr):
+    """
+    Scan case reads for interesting k-mers in several bands in a single pass.
+
+    The `bandsketches` dictionary maps each (0-based) band to be processed to
+    a tuple of (case sketches, control sketches) computed for that band. Each
+    k-mer is routed to the sketches of its band. Each read with at least one
+    interesting k-mer is yielded once. Its `ikmers` attribute holds the
+    interesting k-mers from all bands, and its `bandikmers` attribute is a
+    dictionary holding the interesting k-mers of each band separately.
+    Combining the per-band k-mers with `kevlar filter` gives the same result
+    as running `kevlar novel` separately for each band. Reads are annotated
+    with read indexes as described for `novel`.
+    """
+    scanfunc, scanargs = scan_settings_multiband(
+        bandsketches, numbands, casemin=casemin, ctrlmax=ctrlmax,
+        abundscreen=abundscreen, prefilters=prefilters
+    )
+    readstream = _novel(
+        casestream, ksize, scanfunc, scanargs, skipuntil=skipuntil,
+        numworkers=numworkers, batchsize=batchsize, updateint=updateint,
+        checkpoint=checkpoint, cachesize=cachesize, exactcount=exactcount,
+        readindex=readindex, logstream=logstream
+    )
+    for record in readstream:
+        yield record
+
+
+def band_counts(filenames, band):
+    """
+    Resolve the counttable filenames for the given (0-based) band.
+
+    Filenames may contain a `{band}` placeholder, which is replaced by the
+    corresponding 1-based band number (consistent with the `--band` option).
+    """
+    if filenames is None or band is None:
+        return filenames
+    return [fn.replace('{band}', str(band + 1)) for fn in filenames]
+
+
+def load_band_samples(args, band=None, timer=None):
+    """Load the case and control sketches for a single band (or no band)."""
+    bandmsg = ''
+    if band is not None:
+        bandmsg = ' for band {:d}'.format(band + 1)
+    ctrlkey, casekey = 'loadctrl' + bandmsg, 'loadcases' + bandmsg
+    ctrlcounts = band_counts(args.control_counts, band)
+    casecounts = band_counts(args.case_counts, band)
+    kevlar.sketch.check_compatible(
+        (ctrlcounts or []) + (casecounts or []), band=band,
+        numbands=args.num_bands
+    )
+
+    print('[kevlar::novel] Loading control samples', bandmsg, sep='',
+          file=args.logfile)
+    timer.start(ctrlkey)
+    ceiling = args.ctrl_max + 1 if args.compact_controls else None
+    sizing = dict(autosize=args.auto_size, samplereads=args.auto_size_sample,
+                  targetfpr=args.target_fpr)
     controls = load_samples(
-        args.control_counts, args.control, args.ksize, args.memory,
-        args.max_fpr, args.num_bands, myband, args.threads, args.logfile
+        ctrlcounts, args.control, args.ksize, args.memory, args.max_fpr,
+        args.num_bands, band, args.threads, ceiling, logstream=args.logfile,
+        **sizing
     )
-    elapsed = timer.stop('loadctrl')
+    elapsed = timer.stop(ctrlkey)
     message = 'Control samples loaded in {:.2f} sec'.format(elapsed)
     print('[kevlar::novel]', message, file=args.logfile)
 
-    print('[kevlar::novel] Loading case samples', file=args.logfile)
-    timer.start('loadcases')
+    print('[kevlar::novel] Loading case samples', bandmsg, sep='',
+          file=args.logfile)
+    timer.start(casekey)
     cases = load_samples(
-        args.case_counts, args.case, args.ksize, args.memory,
-        args.max_fpr, args.num_bands, myband, args.threads, args.logfile
+        casecounts, args.case, args.ksize, args.memory, args.max_fpr,
+        args.num_bands, band, args.threads, logstream=args.logfile, **sizing
     )
-    elapsed = timer.stop('loadcases')
+    elapsed = timer.stop(casekey)
     print('[kevlar::novel] Case samples loaded in {:.2f} sec'.format(elapsed),
           file=args.logfile)
+
+    prefilter = None
+    if args.prefilter:
+        prefilter = kevlar.prefilter.CandidatePrefilter.build(
+            cases, controls, casemin=args.case_min, ctrlmax=args.ctrl_max,
+            logstream=args.logfile
+        )
+    return cases, controls, prefilter
+
+
+def selected_bands(args):
+    """
+    Determine which (0-based) bands are to be processed in a single pass.
+
+    Returns `None` if neither `--bands` nor `--all-bands` is specified.
+    """
+    if not args.bands and not args.all_bands:
+        return None
+    if not args.num_bands:
+        message = 'Must specify --num-bands with --bands or --all-bands'
+        raise ValueError(message)
+    if args.band:
+        message = 'Cannot combine --band with --bands or --all-bands'
+        raise ValueError(message)
+    if args.all_bands:
+        return list(range(args.num_bands))
+    return sorted(set(b - 1 for b in args.bands))
+
+
+def case_streams(args, infiles, outfiles):
+    """
+    Open the case reads and output files for `kevlar novel`.
+
+    If a checkpoint file is specified, case reads are parsed with their file
+    positions so that progress can be recorded periodically. When resuming,
+    the case reads are parsed starting from the checkpoint position and output
+    is appended to the existing output files.
+
+    Returns the case read stream, the output file handles, and the
+    checkpointer (or `None` if checkpointing is disabled).
+    """
+    if not args.checkpoint:
+        if args.resume:
+            raise ValueError('Must specify --checkpoint with --resume')
+        caserecords = kevlar.multi_file_iter_screed(infiles)
+        outstreams = [kevlar.open(outfile, 'w') for outfile in outfiles]
+        return caserecords, outstreams, None
+
+    kevlar.checkpoint.check_resumable(outfiles)
+    start, nreads = None, 0
+    if args.resume:
+        state, outstreams = kevlar.checkpoint.resume(
+            args.checkpoint, infiles, outfiles
+        )
+        start = (state['fileindex'], state['offset'])
+        nreads = state['nreads']
+        message = 'Resuming from checkpoint "{:s}"'.format(args.checkpoint)
+        message += ' after {:d} reads'.format(nreads)
+        print('[kevlar::novel]', message, file=args.logfile)
+    else:
+        outstreams = [kevlar.open(outfile, 'w') for outfile in outfiles]
+    caserecords = kevlar.checkpoint.multi_file_iter_positions(infiles, start)
+    checkpoint = kevlar.checkpoint.Checkpointer(
+        args.checkpoint, infiles, outfiles, outstreams,
+        interval=args.checkpoint_interval, nreads=nreads,
+        logstream=args.logfile
+    )
+    return caserecords, outstreams, checkpoint
+
+
+def main(args):
+    timer = kevlar.Timer()
+    timer.start()
+    bands = selected_bands(args)
+    if bands is None and (not args.num_bands) is not (not args.band):
+        raise ValueError('Must specify --num-bands and --band together')
+    myband = args.band - 1 if args.band else None
+    if args.prefilter and (args.compact_controls or args.auto_size):
+        message = 'Cannot combine --prefilter with --compact-controls or '
+        message += '--auto-size, which produce tables of different sizes'
+        raise ValueError(message)
+
+    timer.start('loadall')
+    if bands is None:
+        cases, controls, prefilter = load_band_samples(args, myband, timer)
+    else:
+        bandsketches = dict()
+        prefilters = dict() if args.prefilter else None
+        for band in bands:
+            bandcases, bandctrls, prefilter = load_band_samples(args, band,
+                                                                timer)
+            bandsketches[band] = (bandcases, bandctrls)
+            if args.prefilter:
+                prefilters[band] = prefilter
     elapsed = timer.stop('loadall')
     print('[kevlar::novel] All samples loaded in {:.2f} sec'.format(elapsed),
           file=args.logfile)
@@ -190,18 +872,63 @@ def main(args):
     ncases = len(args.case)
     message = 'Iterating over reads from {:d} case sample(s)'.format(ncases)
     print('[kevlar::novel]', message, file=args.logfile)
-    outstream = kevlar.open(args.out, 'w')
     infiles = [f for filelist in args.case for f in filelist]
-    caserecords = kevlar.multi_file_iter_screed(infiles)
-    readstream = novel(
-        caserecords, cases, controls, ksize=args.ksize,
-        abundscreen=args.abund_screen, casemin=args.case_min,
-        ctrlmax=args.ctrl_max, numbands=args.num_bands, band=myband,
-        skipuntil=args.skip_until, updateint=args.upint,
-        logstream=args.logfile,
-    )
-    for augmented_read in readstream:
-        kevlar.print_augmented_fastx(augmented_read, outstream)
+    perband = bands is not None and args.out and '{band}' in args.out
+    if perband:
+        outfiles = [args.out.replace('{band}', str(b + 1)) for b in bands]
+    else:
+        outfiles = [args.out]
+    if bands is None:
+        scanfunc, scanargs = scan_settings(
+            cases, controls, casemin=args.case_min, ctrlmax=args.ctrl_max,
+            abundscreen=args.abund_screen, numbands=args.num_bands,
+            band=myband, prefilter=prefilter
+        )
+    else:
+        scanfunc, scanargs = scan_settings_multiband(
+            bandsketches, args.num_bands, casemin=args.case_min,
+            ctrlmax=args.ctrl_max, abundscreen=args.abund_screen,
+            prefilters=prefilters
+        )
+    # Fork the scanning workers before opening any files, since compressed
+    # files are read and written by background threads.
+    pool = None
+    if args.threads > 1:
+        pool = ScanPool(args.threads, scanfunc, **scanargs)
+    try:
+        caserecords, outstreams, checkpoint = case_streams(args, infiles,
+                                                           outfiles)
+        readindex = None
+        if args.read_index:
+            readindex = checkpoint.nreads if checkpoint else 0
+        readstream = _novel(
+            caserecords, args.ksize, scanfunc, scanargs,
+            skipuntil=args.skip_until, numworkers=args.threads,
+            updateint=args.upint, checkpoint=checkpoint,
+            cachesize=args.read_cache, exactcount=args.exact_kmer_count,
+            readindex=readindex, pool=pool, logstream=args.logfile,
+        )
+
+        if perband:
+            bandstreams = dict(zip(bands, outstreams))
+            for augmented_read in readstream:
+                merged = augmented_read.ikmers
+                for band, ikmers in augmented_read.bandikmers.items():
+                    augmented_read.ikmers = ikmers
+                    kevlar.print_augmented_fastx(augmented_read,
+                                                 bandstreams[band])
+                augmented_read.ikmers = merged
+        else:
+            for augmented_read in readstream:
+                kevlar.print_augmented_fastx(augmented_read, outstreams[0])
+        if checkpoint:
+            checkpoint.finish()
+        if perband or checkpoint:
+            for outstream in outstreams:
+                outstream.close()
+    finally:
+        if pool:
+            pool.close()
 
     elapsed = timer.stop('iter')
     message = 'Iterated over all case reads in {:.2f} seconds'.format(elapsed)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+"""
+Pipelined reading and writing of gzip-compressed files.
+
+Decompression and compression are done on background threads, so that they
+overlap with the (single-threaded) processing of records on the main thread.
+Data are passed between threads in large chunks through bounded queues. zlib
+releases the GIL while inflating or deflating, so the background threads run
+concurrently with the main thread. BGZF files (blocked gzip, as produced by
+`bgzip`) consist of many small independent gzip members, which are inflated in
+parallel by a pool of threads.
+"""
+
+import atexit
+import builtins
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import queue
+import struct
+import threading
+import weakref
+import zlib
+
+
+CHUNKSIZE = 1 << 20
+QUEUESIZE = 16
+_open_writers = weakref.WeakSet()
+
+
+class _Sentinel(object):
+    pass
+
+
+_EOF = _Sentinel()
+
+
+def _put(chunks, item, stop):
+    """Put an item in a bounded queue, giving up if the reader has stopped."""
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def is_bgzf(header):
+    """Check whether the header of a gzip member has a BGZF "BC" subfield."""
+    return (
+        len(header) >= 16 and header[:4] == b'\x1f\x8b\x08\x04' and
+        header[12:14] == b'BC'
+    )
+
+
+def inflate_gzip(fileobj, chunks, stop):
+    """Inflate a (possibly multi-member) gzip stream, chunk by chunk."""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    inmember = False
+    while not stop.is_set():
+        data = fileobj.read(CHUNKSIZE)
+        if not data:
+            break
+        while data:
+            inmember = True
+            inflated = decompressor.decompress(data)
+            if inflated:
+                _put(chunks, inflated, stop)
+            if not decompressor.eof:
+                break
+            data = decompressor.unused_data
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            inmember = False
+    if inmember and not stop.is_set():
+        message = 'Compressed file ended before the end-of-stream marker was '
+        message += 'reached'
+        raise EOFError(message)
+
+
+def bgzf_blocks(fileobj):
+    """Yield the raw deflate payload of each block in a BGZF file."""
+    while True:
+        header = fileobj.read(12)
+        if len(header) == 0:
+            return
+        if len(header) < 12 or header[:4] != b'\x1f\x8b\x08\x04':
+            raise OSError('invalid BGZF block header')
+        xlen, = struct.unpack('<H', header[10:12])
+        extra = fileobj.read(xlen)
+        blocksize = None
+        offset = 0
+        while offset + 4 <= len(extra):
+            subfield = extra[offset:offset+2]
+            sublen, = struct.unpack('<H', extra[offset+2:offset+4])
+            if subfield == b'BC' and sublen == 2:
+                blocksize, = struct.unpack('<H', extra[offset+4:offset+6])
+            offset += 4 + sublen
+        if blocksize is None:
+            raise OSError('BGZF block without "BC" subfield')
+        payload = fileobj.read(blocksize - xlen - 19)
+        trailer = fileobj.read(8)
+        if len(trailer) < 8:
+            raise OSError('truncated BGZF block')
+        yield payload, trailer
+
+
+def inflate_block(payload, trailer):
+    data = zlib.decompress(payload, -zlib.MAX_WBITS)
+    crc, size = struct.unpack('<II', trailer)
+    if zlib.crc32(data) != crc or len(data) != size:
+        raise OSError('BGZF block failed CRC check')
+    return data
+
+
+def inflate_bgzf(fileobj, chunks, stop, threads=4):
+    """Inflate the blocks of a BGZF file in parallel, preserving order."""
+    pending = deque()
+    with ThreadPoolExecutor(threads) as executor:
+        for payload, trailer in bgzf_blocks(fileobj):
+            if stop.is_set():
+                return
+            pending.append(executor.submit(inflate_block, payload, trailer))
+            if len(pending) >= threads * 4:
+                data = pending.popleft().result()
+                if data:
+                    _put(chunks, data, stop)
+        while pending:
+            data = pending.popleft().result()
+            if data:
+                _put(chunks, data, stop)
+
+
+class PipedReader(io.RawIOBase):
+    """
+    Raw binary stream of data decompressed on a background thread.
+
+    Any error raised while decompressing is re-raised on the reading thread.
+    """
+    def __init__(self, filename, threads=4):
+        self.name = filename
+        self._fileobj = builtins.open(filename, 'rb')
+        self._chunks = queue.Queue(QUEUESIZE)
+        self._stop = threading.Event()
+        self._buffer = memoryview(b'')
+        self._eof = False
+        header = self._fileobj.peek(16)[:16]
+        if is_bgzf(header):
+            target = inflate_bgzf
+            args = (self._fileobj, self._chunks, self._stop, threads)
+        else:
+            target = inflate_gzip
+            args = (self._fileobj, self._chunks, self._stop)
+        self._thread = threading.Thread(
+            target=self._run, args=(target, args), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, target, args):
+        try:
+            target(*args)
+        except BaseException as error:
+            _put(self._chunks, error, self._stop)
+        _put(self._chunks, _EOF, self._stop)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while len(self._buffer) == 0 and not self._eof:
+            item = self._chunks.get()
+            if item is _EOF:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            else:
+                self._buffer = memoryview(item)
+        nbytes = min(len(buf), len(self._buffer))
+        buf[:nbytes] = self._buffer[:nbytes]
+        self._buffer = self._buffer[nbytes:]
+        return nbytes
+
+    def close(self):
+        if self.closed:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._fileobj.close()
+        super(PipedReader, self).close()
+
+
+class PipedWriter(io.RawIOBase):
+    """
+    Raw binary stream of data compressed and written on a background thread.
+
+    Data are written as a single gzip member. Any error raised while writing
+    is re-raised when the stream is flushed or closed.
+    """
+    def __init__(self, filename, level=6):
+        self.name = filename
+        self._fileobj = builtins.open(filename, 'wb')
+        self._chunks = queue.Queue(QUEUESIZE)
+        self._stop = threading.Event()
+        self._error = None
+        self._compressor = zlib.compressobj(
+            level, zlib.DEFLATED, zlib.MAX_WBITS | 16
+        )
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                item = self._chunks.get()
+                if item is _EOF:
+                    self._fileobj.write(self._compressor.flush())
+                    break
+                self._fileobj.write(self._compressor.compress(item))
+        except BaseException as error:
+            self._error = error
+            self._stop.set()
+            # Keep consuming so that the writing thread never blocks.
+            while self._chunks.get() is not _EOF:
+                pass
+
+    def _check(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._check()
+        self._chunks.put(bytes(data))
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self._chunks.put(_EOF)
+        self._thread.join()
+        self._fileobj.close()
+        super(PipedWriter, self).close()
+        self._check()
+
+
+@atexit.register
+def _close_writers():
+    # Output streams that are never explicitly closed must still be completed
+    # while the background threads are alive, i.e. before interpreter shutdown.
+    for writer in list(_open_writers):
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+def default_threads():
+    return min(4, os.cpu_count() or 1)
+
+
+def open(filename, mode='rt', threads=None):
+    """
+    Open a gzip-compressed file with background (de)compression.
+
+    Supports modes `r`/`rt`/`rb` and `w`/`wt`/`wb`. For BGZF files, up to
+    `threads` blocks are inflated in parallel.
+    """
+    if threads is None:
+        threads = default_threads()
+    if mode in ('r', 'rt', 'rb'):
+        raw = PipedReader(filename, threads=threads)
+        stream = io.BufferedReader(raw, buffer_size=CHUNKSIZE)
+    elif mode in ('w', 'wt', 'wb'):
+        raw = PipedWriter(filename)
+        stream = io.BufferedWriter(raw, buffer_size=CHUNKSIZE)
+    else:
+        raise ValueError('invalid mode "{}"'.format(mode))
+    if not mode.endswith('b'):
+        stream = io.TextIOWrapper(stream)
+    if mode.startswith('w'):
+        _open_writers.add(stream)
+    return stream
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import sys
+import khmer
+import numpy
+import kevlar
+from kevlar.sketch import KevlarSketchMismatchError
+
+
+class CandidatePrefilter(object):
+    """
+    Compact filter for rejecting reads without any interesting k-mers.
+
+    The filter consists of presence/absence tables with the same dimensions as
+    the case and control sketches from which it was built. The "case" table
+    has a bin set if the corresponding bin is >= `casemin` in every case
+    sketch, and each "control" table has a bin set if the corresponding bin is
+    > `ctrlmax` in that control's sketch. Because these conditions are decided
+    bin by bin with the same hash functions, a k-mer is a candidate if and only
+    if it would pass the case/control thresholds with the full sketches: the
+    filter has neither false positives nor false negatives with respect to the
+    full abundance lookup, but needs only 1 bit per bin per control sample
+    (plus 1 bit per bin for all case samples combined).
+    """
+    def __init__(self, casefilter, ctrlfilters):
+        self.casefilter = casefilter
+        self.ctrlfilters = ctrlfilters
+
+    @classmethod
+    def build(cls, casecounts, controlcounts, casemin=5, ctrlmax=0,
+              logstream=sys.stderr):
+        """
+        Build a prefilter from case and control sketches.
+
+        All sketches must use the same hash function (all tables or all
+        graphs), k-mer size, and table sizes. This is the case whenever they
+        have been computed with the same `--ksize` and `--memory` settings.
+        """
+        sketches = list(casecounts) + list(controlcounts)
+        first = sketches[0]
+        graph = kevlar.sketch.sketch_type(first) in kevlar.sketch.graph_types
+        for sketch in sketches:
+            if sketch.ksize() != first.ksize():
+                message = 'cannot prefilter sketches with different k-mer '
+                message += 'sizes'
+                raise KevlarSketchMismatchError(message)
+            if sketch.hashsizes() != first.hashsizes():
+                message = 'cannot prefilter sketches with different table '
+                message += 'sizes'
+                raise KevlarSketchMismatchError(message)
+
+        sizes = first.hashsizes()
+        casebins = None
+        for sketch in casecounts:
+            tables = kevlar.sketch.bin_values(sketch)
+            passing = [table >= casemin for table in tables]
+            if casebins is None:
+                casebins = passing
+            else:
+                casebins = [c & p for c, p in zip(casebins, passing)]
+        casefilter = presence_filter(first.ksize(), sizes, casebins, graph)
+        ctrlfilters = list()
+        for sketch in controlcounts:
+            tables = kevlar.sketch.bin_values(sketch)
+            ctrlbins = [table > ctrlmax for table in tables]
+            ctrlfilter = presence_filter(first.ksize(), sizes, ctrlbins, graph)
+            ctrlfilters.append(ctrlfilter)
+
+        nbits = sum(sizes) * (len(ctrlfilters) + 1)
+        message = 'candidate prefilter built, '
+        message += '{:.2f} Mb'.format(nbits / 8 / 1024 / 1024)
+        print('[kevlar::prefilter]', message, file=logstream)
+        return cls(casefilter, ctrlfilters)
+
+    def candidates(self, sequence):
+        """Return a boolean array flagging candidate k-mers in a sequence."""
+        mask = numpy.array(self.casefilter.get_kmer_counts(sequence),
+                           dtype=bool)
+        for ctrlfilter in self.ctrlfilters:
+            if not mask.any():
+                break
+            present = numpy.array(ctrlfilter.get_kmer_counts(sequence),
+                                  dtype=bool)
+            mask &= ~present
+        return mask
+
+
+def presence_filter(ksize, sizes, bins, graph=False):
+    """
+    Create a presence/absence sketch with the given table sizes and bits set.
+
+    The `bins` argument is a list of boolean arrays, one per table, indicating
+    which bins of each table should be set.
+    """
+    sketchtype = khmer.Nodegraph if graph else khmer.Nodetable
+    sketch = sketchtype(ksize, sizes[0] + 1, len(sizes))
+    assert sketch.hashsizes() == sizes
+    for tablebins, rawtable in zip(bins, sketch.get_raw_tables()):
+        table = numpy.asarray(rawtable)
+        packed = numpy.packbits(tablebins, bitorder='little')
+        table[:len(packed)] = packed
+    return sketch
@@ -20,14 +20,16 @@ class ReadGraph(networkx.Graph):
         Constructor
 
         In addition to the base class, we add a dictionary to store sets of
-        reads containing each "interesting" k-mer. These k-mers are used to
-        build out the graph edges.
+        reads containing each "interesting" k-mer, keyed by canonical 2-bit
+        k-mer code (see `kevlar.kmercode`). These k-mers are used to build out
+        the graph edges.
 
         Also, we store the names of the input reads so that reads with no
         connections to other reads can be distinguished from assembled contigs.
         """
         self.ikmers = defaultdict(set)
         self.readnames = set()
+        self.ksize = None
         super(ReadGraph, self).__init__(data, **attr)
 
     def full_cc(self, cc):
@@ -35,6 +37,7 @@ class ReadGraph(networkx.Graph):
         sg = ReadGraph(data=sg)
         sg.ikmers = self.ikmers
         sg.readnames = self.readnames
+        sg.ksize = self.ksize
         return sg
 
     def get_record(self, recordname):
@@ -69,8 +72,9 @@ class ReadGraph(networkx.Graph):
             self.add_node(record.name, record=record)
             self.readnames.add(record.name)
             for kmer in record.ikmers:
-                kmerseq = kevlar.revcommin(kmer.sequence)
-                temp_ikmers[kmerseq].add(record.name)
+                self.ksize = len(kmer.sequence)
+                kmercode = kevlar.kmercode.canonical(kmer.sequence)
+                temp_ikmers[kmercode].add(record.name)
 
         if minabund is None and maxabund is None:
             self.ikmers = temp_ikmers
@@ -115,11 +119,13 @@ class ReadGraph(networkx.Graph):
                 if strict:
                     record1 = self.get_record(read1)
                     record2 = self.get_record(read2)
-                    pair = kevlar.overlap.calc_offset(record1, record2, kmer)
+                    minkmer = kevlar.kmercode.decode(kmer, self.ksize)
+                    pair = kevlar.overlap.calc_offset(record1, record2,
+                                                      minkmer)
                     if pair is kevlar.overlap.INCOMPATIBLE_PAIR:
                         # Shared k-mer but bad overlap
                         continue
-                    self.check_edge(pair, kmer)
+                    self.check_edge(pair, minkmer)
                 else:
                     self.add_edge(read1, read2)
 
@@ -7,12 +7,18 @@
 # licensed under the MIT license: see LICENSE.
 # -----------------------------------------------------------------------------
 
+from array import array
 from collections import defaultdict
-from itertools import combinations, product
+import hashlib
+import heapq
+import io
+from itertools import combinations, groupby, product
 from networkx import Graph, connected_components
 from sys import stdout, stderr, exit
 import re
+import tempfile
 import khmer
+import numpy
 import screed
 import kevlar
 
@@ -21,6 +27,10 @@ class KevlarPartitionLabelError(ValueError):
     pass
 
 
+class KevlarReadIndexError(ValueError):
+    pass
+
+
 def parse_fasta(data):
     """
     Load sequences in Fasta format.
@@ -85,6 +95,8 @@ def parse_augmented_fastx(instream):
             ikmer = kevlar.KmerOfInterest(sequence=kmer, offset=offset,
                                           abund=abundances)
             record.ikmers.append(ikmer)
+        elif line.startswith('#readindex='):
+            record.readindex = int(line.strip()[len('#readindex='):])
     if record is not None:
         yield record
 
@@ -92,6 +104,9 @@ def parse_augmented_fastx(instream):
 def print_augmented_fastx(record, outstream=stdout):
     """Write augmented records out to an .augfast[q|a] file."""
     khmer.utils.write_record(record, outstream)
+    readindex = getattr(record, 'readindex', None)
+    if readindex is not None:
+        print('#readindex={:d}'.format(readindex), file=outstream)
     for kmer in sorted(record.ikmers, key=lambda k: k.offset):
         abundstr = ' '.join([str(a) for a in kmer.abund])
         print(' ' * kmer.offset, kmer.sequence, ' ' * 10, abundstr, '#',
@@ -105,6 +120,56 @@ def afxstream(filelist):
             yield record
 
 
+def indexed_reads(instream, filename=None):
+    """Check that augmented records carry increasing read indexes."""
+    lastindex = -1
+    for record in instream:
+        readindex = getattr(record, 'readindex', None)
+        if readindex is None:
+            message = 'read "{:s}" in {:s} has no read index; '.format(
+                record.name, str(filename)
+            )
+            message += 'run `kevlar novel` with --read-index'
+            raise KevlarReadIndexError(message)
+        if readindex <= lastindex:
+            message = 'reads in {:s} not sorted by read index'.format(
+                str(filename)
+            )
+            raise KevlarReadIndexError(message)
+        lastindex = readindex
+        yield record
+
+
+def group_augmented_fastx(filelist):
+    """
+    Merge augmented files sharing a common read order.
+
+    Each invocation of `kevlar novel` with the `--read-index` flag on the same
+    case reads (for example, one for each k-mer band) writes reads in the same
+    order, each annotated with its index in the case input. This generator
+    performs a streaming k-way merge of such files, keyed by read index, and
+    yields a list of all instances of each distinct read, in read order. Only
+    one record per input file is held in memory at a time.
+    """
+    instreams = [
+        indexed_reads(parse_augmented_fastx(kevlar.open(infile, 'r')), infile)
+        for infile in filelist
+    ]
+    merged = heapq.merge(*instreams, key=lambda record: record.readindex)
+    for readindex, records in groupby(merged, lambda r: r.readindex):
+        records = list(records)
+        for record in records[1:]:
+            if record.name != records[0].name or \
+                    record.sequence != records[0].sequence:
+                message = 'reads "{:s}" and "{:s}" have the same read index '
+                message += '{:d}; were all inputs computed from the same case '
+                message += 'reads?'
+                message = message.format(records[0].name, record.name,
+                                         readindex)
+                raise KevlarReadIndexError(message)
+        yield records
+
+
 def parse_partitioned_reads(readstream):
     current_part = None
     reads = list()
@@ -136,7 +201,8 @@ def load_reads_and_kmers(instream, logstream=None):
     Load reads into lookup tables for convenient access.
 
     The first table is a dictionary of reads indexed by read name, and the
-    second table is a dictionary of read sets indexed by an interesting k-mer.
+    second table is a dictionary of read sets indexed by the canonical 2-bit
+    code of an interesting k-mer (see `kevlar.kmercode`).
     """
     reads = dict()
     kmers = defaultdict(set)
@@ -146,11 +212,50 @@ def load_reads_and_kmers(instream, logstream=None):
                   file=logstream)
         reads[record.name] = record
         for kmer in record.ikmers:
-            kmerseq = kevlar.revcommin(kmer.sequence)
-            kmers[kmerseq].add(record.name)
+            kmers[kevlar.kmercode.canonical(kmer.sequence)].add(record.name)
     return reads, kmers
 
 
+class ExactKmerCounts(object):
+    """
+    Exact abundances for a restricted set of k-mers.
+
+    Abundances are stored only for the specified k-mers, given as canonical
+    2-bit codes (see `kevlar.kmercode`), in a sorted NumPy array (12 bytes per
+    k-mer); all other k-mers have an abundance of 0. Supports the subset of
+    the khmer Counttable API used by `AnnotatedReadSet`.
+    """
+    def __init__(self, ksize, kmers):
+        self._ksize = ksize
+        codes = numpy.array(list(kmers), dtype=numpy.uint64)
+        self._codes = numpy.unique(codes)
+        self._counts = numpy.zeros(len(self._codes), dtype=numpy.uint32)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _find(self, codes):
+        codes = numpy.asarray(codes, dtype=numpy.uint64)
+        if len(self._codes) == 0:
+            return numpy.zeros(len(codes), dtype=int), \
+                numpy.zeros(len(codes), dtype=bool)
+        indices = numpy.searchsorted(self._codes, codes)
+        indices[indices == len(self._codes)] = 0
+        return indices, self._codes[indices] == codes
+
+    def consume(self, sequence):
+        codes = kevlar.kmercode.canonical_kmers(sequence, self._ksize)
+        indices, found = self._find(codes)
+        numpy.add.at(self._counts, indices[found], 1)
+        return len(codes)
+
+    def get(self, kmer):
+        if not isinstance(kmer, int):
+            kmer = kevlar.kmercode.canonical(kmer)
+        indices, found = self._find([kmer])
+        return int(self._counts[indices[0]]) if found[0] else 0
+
+
 class AnnotatedReadSet(object):
     """
     Data structure for de-duplicating reads and combining annotated k-mers.
@@ -171,11 +276,21 @@ class AnnotatedReadSet(object):
     up in multiple output files, with different "interesting" k-mers annotated
     in each. This data structure supports de-duplicating reads that appear in
     multiple augmented Fastq files and combining their annotated k-mers.
+
+    The abundances of the interesting k-mers are recomputed from the reads
+    themselves. By default, all k-mers are counted as reads are added, in a
+    Counttable occupying `abundmem` bytes. If `exact` is true, only the
+    distinct interesting k-mers are counted, exactly, in a second pass over
+    the reads when they are validated (see `ExactKmerCounts`).
     """
 
-    def __init__(self, ksize, abundmem):
+    def __init__(self, ksize, abundmem, exact=False):
+        self._ksize = ksize
         self._reads = dict()
-        self._counts = khmer.Counttable(ksize, abundmem / 4, 4)
+        self.exact = exact
+        self._counts = None
+        if not exact:
+            self._counts = khmer.Counttable(ksize, abundmem / 4, 4)
         self._readcounts = defaultdict(int)
         self._ikmercounts = defaultdict(int)
 
@@ -227,6 +342,13 @@ class AnnotatedReadSet(object):
     def ikmer_instances(self):
         return sum(self._ikmercounts.values())
 
+    @property
+    def counts(self):
+        """Recomputed k-mer abundances."""
+        if self.exact and self._counts is None:
+            self.count_exact()
+        return self._counts
+
     def add(self, newrecord):
         if newrecord.name in self._reads:
             record = self._reads[newrecord.name]
@@ -234,28 +356,259 @@ class AnnotatedReadSet(object):
             record.ikmers.extend(newrecord.ikmers)
         else:
             self._reads[newrecord.name] = newrecord
-            self._counts.consume(newrecord.sequence)
+            if not self.exact:
+                self._counts.consume(newrecord.sequence)
 
         self._readcounts[newrecord.name] += 1
         for kmer in newrecord.ikmers:
-            minkmer = kevlar.revcommin(kmer.sequence)
+            minkmer = kevlar.kmercode.canonical(kmer.sequence)
             self._ikmercounts[minkmer] += 1
 
+    def distinct_records(self):
+        """Iterate over distinct reads, with their combined k-mers."""
+        return iter(self._reads.values())
+
+    def count_exact(self):
+        """Count the distinct interesting k-mers in all distinct reads."""
+        self._counts = ExactKmerCounts(self._ksize, self._ikmercounts)
+        for record in self.distinct_records():
+            self._counts.consume(record.sequence)
+
+    def validate_record(self, record, mask=None, minabund=5):
+        validated_kmers = list()
+        for kmer in record.ikmers:
+            minkmer = kevlar.kmercode.canonical(kmer.sequence)
+            if mask and mask.get(kmer.sequence) > 0:
+                self._masked[minkmer] += 1
+                continue
+            abund = self._counts.get(kmer.sequence)
+            if abund < minabund:
+                self._lowabund[minkmer] += 1
+            else:
+                kmer.abund[0] = abund
+                validated_kmers.append(kmer)
+                self._valid[minkmer] += 1
+        record.ikmers = validated_kmers
+        if len(validated_kmers) == 0:
+            self._novalidkmers_count += 1
+
     def validate(self, mask=None, minabund=5):
-        for readid in self._reads:
-            record = self._reads[readid]
+        self.counts
+        for record in self.distinct_records():
+            self.validate_record(record, mask=mask, minabund=minabund)
+
+
+class SpilledAnnotatedReadSet(AnnotatedReadSet):
+    """
+    Out-of-core variant of `AnnotatedReadSet`.
+
+    Reads are not held in memory but appended, in augmented Fastq format, to
+    temporary spill files in `tempdir` as they are added. Only a 128-bit
+    digest of each read name and the offset of each record in its spill file
+    are kept in memory (16 and 8 bytes per record), as well as the interesting
+    k-mers and their counts. Records are distributed to `numbuckets` spill
+    files by the first byte of their digest, so that all records of a read
+    end up in the same bucket. When the reads are validated, each bucket is
+    read sequentially into memory in turn and its records are grouped by read
+    name to de-duplicate reads and combine their interesting k-mers, and k-mer
+    abundances are recomputed from the distinct reads. Memory is therefore
+    bounded by the size of the largest bucket rather than of all reads. Reads
+    with any validated k-mers are written to another spill file, which is
+    streamed when iterating over the read set.
+    """
 
-            validated_kmers = list()
-            for kmer in record.ikmers:
-                kmerseq = kevlar.revcommin(kmer.sequence)
-                if mask and mask.get(kmerseq) > 0:
-                    self._masked[kmerseq] += 1
-                elif self._counts.get(kmerseq) < minabund:
-                    self._lowabund[kmerseq] += 1
-                else:
-                    kmer.abund[0] = self._counts.get(kmerseq)
-                    validated_kmers.append(kmer)
-                    self._valid[kmerseq] += 1
-            record.ikmers = validated_kmers
-            if len(validated_kmers) == 0:
-                self._novalidkmers_count += 1
+    def __init__(self, ksize, abundmem, exact=False, tempdir=None,
+                 numbuckets=64):
+        super(SpilledAnnotatedReadSet, self).__init__(ksize, abundmem,
+                                                      exact=exact)
+        if not 1 <= numbuckets <= 256:
+            raise ValueError('numbuckets must be between 1 and 256')
+        self._tempdir = tempdir
+        self._numbuckets = numbuckets
+        self._spills = [None] * numbuckets
+        self._validated = None
+        self._digests = [array('Q') for _ in range(numbuckets)]
+        self._offsets = [array('Q') for _ in range(numbuckets)]
+        self._groups = None
+        self._consumed = False
+
+    def __len__(self):
+        return sum(len(bounds) - 1 for order, bounds in self.groups())
+
+    def __iter__(self):
+        if self._validated is None:
+            for record in self.distinct_records():
+                if len(record.ikmers) > 0:
+                    yield record
+            return
+        self._validated.seek(0)
+        stream = io.TextIOWrapper(self._validated, encoding='utf-8')
+        try:
+            for record in parse_augmented_fastx(stream):
+                yield record
+        finally:
+            stream.detach()
+
+    @property
+    def distinct_reads(self):
+        return len(self)
+
+    @property
+    def counts(self):
+        if not self.exact and not self._consumed:
+            for record in self.distinct_records():
+                self._counts.consume(record.sequence)
+            self._consumed = True
+        return super(SpilledAnnotatedReadSet, self).counts
+
+    @property
+    def read_instances(self):
+        return sum(len(offsets) for offsets in self._offsets)
+
+    def add(self, newrecord):
+        digest = hashlib.blake2b(newrecord.name.encode('utf-8'),
+                                 digest_size=16).digest()
+        bucket = digest[0] * self._numbuckets >> 8
+        if self._spills[bucket] is None:
+            self._spills[bucket] = tempfile.TemporaryFile(dir=self._tempdir)
+        spill = self._spills[bucket]
+        self._digests[bucket].frombytes(digest)
+        self._offsets[bucket].append(spill.seek(0, io.SEEK_END))
+        output = io.StringIO()
+        print_augmented_fastx(newrecord, output)
+        spill.write(output.getvalue().encode('utf-8'))
+        self._groups = None
+        for kmer in newrecord.ikmers:
+            minkmer = kevlar.kmercode.canonical(kmer.sequence)
+            self._ikmercounts[minkmer] += 1
+
+    def groups(self):
+        """
+        Group spilled records by read name.
+
+        Returns, for each bucket, the indices of its records sorted by read
+        name digest, and the boundaries of each group of records in that
+        order.
+        """
+        if self._groups is None:
+            self._groups = list()
+            for digests in self._digests:
+                digests = numpy.frombuffer(digests, dtype=numpy.uint64)
+                digests = digests.reshape(-1, 2)
+                order = numpy.lexsort((digests[:, 1], digests[:, 0]))
+                digests = digests[order]
+                change = numpy.any(digests[1:] != digests[:-1], axis=1)
+                bounds = numpy.flatnonzero(change) + 1
+                bounds = numpy.concatenate(([0], bounds, [len(order)]))
+                if len(order) == 0:
+                    bounds = numpy.array([0])
+                self._groups.append((order, bounds))
+        return self._groups
+
+    @staticmethod
+    def read_record(data, offsets, index):
+        """Parse the record at `index` of a bucket read into `data`."""
+        start = offsets[index]
+        end = len(data)
+        if index + 1 < len(offsets):
+            end = offsets[index + 1]
+        text = data[start:end].decode('utf-8')
+        return next(parse_augmented_fastx(io.StringIO(text)))
+
+    def distinct_records(self):
+        buckets = zip(self._spills, self._offsets, self.groups())
+        for spill, offsets, (order, bounds) in buckets:
+            if spill is None:
+                continue
+            spill.seek(0)
+            data = spill.read()
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                indices = sorted(order[start:stop])
+                record = self.read_record(data, offsets, indices[0])
+                for index in indices[1:]:
+                    newrecord = self.read_record(data, offsets, index)
+                    assert record.name == newrecord.name
+                    assert record.sequence == newrecord.sequence
+                    record.ikmers.extend(newrecord.ikmers)
+                yield record
+
+    def validate(self, mask=None, minabund=5):
+        self.counts
+        self._validated = tempfile.TemporaryFile(dir=self._tempdir)
+        stream = io.TextIOWrapper(self._validated, encoding='utf-8')
+        for record in self.distinct_records():
+            self.validate_record(record, mask=mask, minabund=minabund)
+            if len(record.ikmers) > 0:
+                print_augmented_fastx(record, stream)
+        stream.flush()
+        stream.detach()
+
+
+class MergedAnnotatedReadSet(AnnotatedReadSet):
+    """
+    Streaming variant of `AnnotatedReadSet` for read-indexed inputs.
+
+    Rather than storing reads, the augmented Fastq files in `filelist`, written
+    by `kevlar novel --read-index`, are merged by read index each time the
+    reads are needed (see `group_augmented_fastx`), combining the interesting
+    k-mers of each distinct read on the fly. The inputs are read once by
+    `load` to recompute k-mer abundances, once more to count the interesting
+    k-mers if `exact` is true, and once more when iterating over the validated
+    reads. Memory does not depend on the number of reads.
+    """
+
+    def __init__(self, filelist, ksize, abundmem, exact=False):
+        super(MergedAnnotatedReadSet, self).__init__(ksize, abundmem,
+                                                     exact=exact)
+        self._filelist = list(filelist)
+        self._ndistinct = 0
+        self._ninstances = 0
+        self._validation = None
+
+    def __len__(self):
+        return self._ndistinct
+
+    def __iter__(self):
+        for record in self.distinct_records():
+            if self._validation is not None:
+                self.validate_record(record, **self._validation)
+            if len(record.ikmers) > 0:
+                yield record
+
+    @property
+    def distinct_reads(self):
+        return self._ndistinct
+
+    @property
+    def read_instances(self):
+        return self._ninstances
+
+    def load(self):
+        """Recompute k-mer abundances and tally interesting k-mers."""
+        for records in group_augmented_fastx(self._filelist):
+            self._ndistinct += 1
+            self._ninstances += len(records)
+            if not self.exact:
+                self._counts.consume(records[0].sequence)
+            for record in records:
+                for kmer in record.ikmers:
+                    minkmer = kevlar.kmercode.canonical(kmer.sequence)
+                    self._ikmercounts[minkmer] += 1
+
+    def distinct_records(self):
+        for records in group_augmented_fastx(self._filelist):
+            record = records[0]
+            for newrecord in records[1:]:
+                record.ikmers.extend(newrecord.ikmers)
+            yield record
+
+    def validate(self, mask=None, minabund=5):
+        """
+        Prepare to validate interesting k-mers.
+
+        Reads are validated one at a time as they are streamed when iterating
+        over the read set, so validation statistics are only complete once
+        all reads have been iterated over.
+        """
+        self.counts
+        self._validation = dict(mask=mask, minabund=minabund)
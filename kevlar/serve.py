@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+"""
+Persistent k-mer sketch server.
+
+`kevlar serve` loads a set of named sketches once and answers abundance
+queries over a Unix domain socket, so that repeated analyses need not reload
+the same sketches from disk. The protocol is line-delimited JSON: each request
+is a JSON object on a single line, and each response is a JSON object on a
+single line. Requests may query the abundances of all k-mers in many
+sequences, or of many k-mer hashes, with a single round trip.
+
+A served sketch can be used anywhere a sketch file is expected (for example
+with `kevlar novel --case-counts` or `kevlar filter --mask`) by specifying it
+as `serve:SOCKET:NAME` (see `RemoteSketch`).
+"""
+
+import json
+import numbers
+import os
+import socket
+import socketserver
+import sys
+import threading
+import khmer
+import numpy
+import kevlar
+
+
+PREFIX = 'serve:'
+
+
+class KevlarSketchServerError(ValueError):
+    pass
+
+
+def is_remote(filename):
+    """Determine whether a sketch "filename" refers to a served sketch."""
+    return filename.startswith(PREFIX)
+
+
+def parse_remote(filename):
+    """Split a `serve:SOCKET:NAME` specification into socket and name."""
+    spec = filename[len(PREFIX):]
+    if ':' not in spec:
+        message = 'served sketches must be specified as serve:SOCKET:NAME, '
+        message += 'not ' + filename
+        raise KevlarSketchServerError(message)
+    return spec.rsplit(':', 1)
+
+
+def describe_sketch(sketch, fpr, metadata=None):
+    info = {
+        'sketchtype': kevlar.sketch.sketch_type(sketch).__name__,
+        'ksize': sketch.ksize(),
+        'tablesizes': sketch.hashsizes(),
+        'occupied': sketch.n_occupied(),
+        'unique': sketch.n_unique_kmers(),
+        'fpr': fpr,
+    }
+    if metadata and metadata.get('numbands'):
+        info['band'] = metadata['band']
+        info['numbands'] = metadata['numbands']
+    return info
+
+
+class SketchRequestHandler(socketserver.StreamRequestHandler):
+    """Answer the requests of a single client connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.respond(json.loads(line.decode()))
+            except Exception as error:
+                response = {'error': '{:s}: {}'.format(
+                    type(error).__name__, error
+                )}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class SketchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serve abundance queries for a set of named sketches over a Unix socket.
+
+    The following requests are supported.
+
+    - `{"op": "info"}`: describe all served sketches
+    - `{"op": "counts", "sketch": NAME, "sequences": [SEQ, ...]}`: abundances
+      of all k-mers in each sequence
+    - `{"op": "lookup", "sketch": NAME, "hashes": [HASH, ...]}`: abundances of
+      the given k-mer hashes
+    - `{"op": "shutdown"}`: stop the server
+
+    Each client connection is handled in a separate thread. If the `metadata`
+    of a sketch computed in banded mode are provided, its band and number of
+    bands are included in its description.
+    """
+    daemon_threads = True
+
+    def __init__(self, socketpath, sketches, fprs=None, metadata=None):
+        self.sketches = sketches
+        self.info = dict()
+        for name, sketch in sketches.items():
+            fpr = (fprs or {}).get(name)
+            if fpr is None:
+                fpr = kevlar.sketch.estimate_fpr(sketch)
+            self.info[name] = describe_sketch(sketch, fpr,
+                                              (metadata or {}).get(name))
+        super(SketchServer, self).__init__(socketpath, SketchRequestHandler)
+
+    def sketch(self, name):
+        if name not in self.sketches:
+            raise KevlarSketchServerError('no sketch named ' + str(name))
+        return self.sketches[name]
+
+    def respond(self, request):
+        op = request.get('op')
+        if op == 'info':
+            return {'sketches': self.info}
+        elif op == 'counts':
+            sketch = self.sketch(request['sketch'])
+            counts = [sketch.get_kmer_counts(seq)
+                      for seq in request['sequences']]
+            return {'counts': counts}
+        elif op == 'lookup':
+            sketch = self.sketch(request['sketch'])
+            return {'counts': [sketch.get(h) for h in request['hashes']]}
+        elif op == 'shutdown':
+            threading.Thread(target=self.shutdown).start()
+            return {'ok': True}
+        raise KevlarSketchServerError('unknown request ' + str(op))
+
+
+class RemoteSketch(object):
+    """
+    Client for a sketch served by `kevlar serve`.
+
+    Supports the subset of the khmer sketch API used by kevlar for querying
+    k-mer abundances. K-mers are hashed locally, as for memory-mapped sketches
+    (see `kevlar.mmsketch.MappedSketch`), and abundances are requested from
+    the server. Each process (and thread) using the sketch opens its own
+    connection, so remote sketches can be used by `kevlar novel` worker
+    processes.
+    """
+    def __init__(self, socketpath, name):
+        self.socketpath = socketpath
+        self.name = name
+        self._local = threading.local()
+        info = self.request({'op': 'info'})['sketches']
+        if name not in info:
+            message = 'no sketch named {:s} served at {:s}'.format(
+                name, socketpath
+            )
+            raise KevlarSketchServerError(message)
+        info = info[name]
+        self.info = info
+        self.sketchtype = kevlar.mmsketch.sketch_types[info['sketchtype']]
+        self._ksize = info['ksize']
+        self._sizes = info['tablesizes']
+        self._occupied = info['occupied']
+        self._unique = info['unique']
+        self.fpr = info['fpr']
+        graph = self.sketchtype in kevlar.sketch.graph_types
+        hashtype = khmer.Nodegraph if graph else khmer.Nodetable
+        self._hasher = hashtype(self._ksize, 1000, 1)
+
+    @classmethod
+    def connect(cls, spec):
+        """Connect to a served sketch specified as `serve:SOCKET:NAME`."""
+        socketpath, name = parse_remote(spec)
+        return cls(socketpath, name)
+
+    def _stream(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socketpath)
+            local.stream = sock.makefile('rwb')
+            local.pid = os.getpid()
+        return local.stream
+
+    def request(self, request):
+        stream = self._stream()
+        stream.write(json.dumps(request).encode() + b'\n')
+        stream.flush()
+        line = stream.readline()
+        if not line:
+            message = 'connection to {:s} closed'.format(self.socketpath)
+            raise KevlarSketchServerError(message)
+        response = json.loads(line.decode())
+        if 'error' in response:
+            raise KevlarSketchServerError(response['error'])
+        return response
+
+    def ksize(self):
+        return self._ksize
+
+    def hashsizes(self):
+        return list(self._sizes)
+
+    def n_tables(self):
+        return len(self._sizes)
+
+    def n_occupied(self):
+        return self._occupied
+
+    def n_unique_kmers(self):
+        return self._unique
+
+    def hash(self, kmer):
+        return self._hasher.hash(kmer)
+
+    def get_kmers(self, sequence):
+        return self._hasher.get_kmers(sequence)
+
+    def get_kmer_hashes(self, sequence):
+        return self._hasher.get_kmer_hashes(sequence)
+
+    def lookup(self, hashes):
+        """Look up the abundances of many k-mer hashes, as a numpy array."""
+        hashes = [int(h) for h in hashes]
+        request = {'op': 'lookup', 'sketch': self.name, 'hashes': hashes}
+        return numpy.array(self.request(request)['counts'], dtype=numpy.int64)
+
+    def query(self, sequences):
+        """Look up the abundances of all k-mers in many sequences at once."""
+        request = {'op': 'counts', 'sketch': self.name,
+                   'sequences': list(sequences)}
+        return self.request(request)['counts']
+
+    def get(self, kmer):
+        if not isinstance(kmer, numbers.Integral):
+            kmer = self.hash(kmer)
+        return int(self.lookup([kmer])[0])
+
+    def get_kmer_counts(self, sequence):
+        return self.query([sequence])[0]
+
+
+class BatchCounts(object):
+    """
+    Abundances of the k-mers of a batch of sequences in a served sketch.
+
+    Querying a `RemoteSketch` read by read costs one round trip to the server
+    per read. Instead, the abundances of all k-mers of a batch of `sequences`
+    are requested at once when the batch is created, and then served locally
+    by `get_kmer_counts`. Other sequences are queried individually. Only the
+    subset of the sketch API used for scanning reads is supported.
+    """
+    def __init__(self, sketch, sequences):
+        self.sketch = sketch
+        self._counts = dict(zip(sequences, sketch.query(sequences)))
+
+    def ksize(self):
+        return self.sketch.ksize()
+
+    def get_kmers(self, sequence):
+        return self.sketch.get_kmers(sequence)
+
+    def get_kmer_hashes(self, sequence):
+        return self.sketch.get_kmer_hashes(sequence)
+
+    def get_kmer_counts(self, sequence):
+        counts = self._counts.get(sequence)
+        if counts is None:
+            counts = self.sketch.get_kmer_counts(sequence)
+        return counts
+
+
+def parse_sketch_args(sketchargs):
+    """
+    Parse NAME=FILE sketch arguments.
+
+    If no name is given, the name of the file without directory and extension
+    is used.
+    """
+    sketchfiles = dict()
+    for arg in sketchargs:
+        if '=' in arg:
+            name, filename = arg.split('=', 1)
+        else:
+            filename = arg
+            name = os.path.basename(filename).split('.')[0]
+        if name in sketchfiles:
+            raise KevlarSketchServerError('duplicate sketch name ' + name)
+        sketchfiles[name] = filename
+    return sketchfiles
+
+
+def load_server(socketpath, sketchfiles, logstream=sys.stderr):
+    """Load the specified sketch files and bind a server to `socketpath`."""
+    sketches, fprs, metadata = dict(), dict(), dict()
+    for name, filename in sorted(sketchfiles.items()):
+        message = 'loading sketch "{:s}" from "{:s}"'.format(name, filename)
+        print('[kevlar::serve]', message, file=logstream)
+        sketches[name] = kevlar.sketch.load(filename)
+        fprs[name] = kevlar.sketch.cached_fpr(sketches[name], filename)
+        metadata[name] = kevlar.sketch.load_metadata(filename)
+    return SketchServer(socketpath, sketches, fprs=fprs, metadata=metadata)
+
+
+def main(args):
+    sketchfiles = parse_sketch_args(args.sketches)
+    server = load_server(args.socket, sketchfiles, logstream=args.logfile)
+    message = 'serving {:d} sketch(es) at {:s}'.format(
+        len(sketchfiles), args.socket
+    )
+    print('[kevlar::serve]', message, file=args.logfile)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:  # pragma: no cover
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+    print('[kevlar::serve] server stopped', file=args.logfile)
@@ -91,6 +91,8 @@ def main(args):
     )
     mask = load_mask(
         args.mask_files, args.ksize, args.mask_memory, maxfpr=args.filter_fpr,
+        cachedir=args.mask_cache or kevlar.maskcache.default_dir(),
+        cachesize=args.mask_cache_size,
         logstream=args.logfile
     )
 
@@ -7,8 +7,14 @@
 # licensed under the MIT license: see LICENSE.
 # -----------------------------------------------------------------------------
 
+import json
 import khmer
+import math
+import numpy
+import os
 import sys
+import kevlar
+from kevlar.mmsketch import MappedSketch
 
 
 sketch_loader_by_filename_extension = {
@@ -24,9 +30,24 @@ sketch_loader_by_filename_extension = {
     '.countgraph':      khmer.Countgraph.load,
     '.smallcounttable': khmer.SmallCounttable.load,
     '.smallcountgraph': khmer.SmallCountgraph.load,
+    '.mmsketch':        MappedSketch,
 }
 
 
+sketch_extensions_by_type = {
+    khmer.Nodetable: ('.nt', '.nodetable'),
+    khmer.Nodegraph: ('.ng', '.nodegraph'),
+    khmer.Counttable: ('.ct', '.counttable'),
+    khmer.Countgraph: ('.cg', '.countgraph'),
+    khmer.SmallCounttable: ('.sct', '.smallcounttable'),
+    khmer.SmallCountgraph: ('.scg', '.smallcountgraph'),
+}
+
+
+graph_types = (khmer.Countgraph, khmer.SmallCountgraph, khmer.Nodegraph)
+_1, _2, _3, _7, _15 = (numpy.uint64(n) for n in (1, 2, 3, 7, 15))
+
+
 class KevlarSketchTypeError(ValueError):
     pass
 
@@ -35,6 +56,10 @@ class KevlarUnsuitableFPRError(SystemExit):
     pass
 
 
+class KevlarSketchMismatchError(ValueError):
+    pass
+
+
 def estimate_fpr(sketch):
     """
     Get a rough estimate of the false positive rate of this sketch.
@@ -50,15 +75,167 @@ def estimate_fpr(sketch):
     return fp_all
 
 
+def running_fpr(sketch, nbins=100000, margin=0.0, seed=42):
+    """
+    Cheaply estimate the false positive rate of a sketch being populated.
+
+    Rather than counting the occupied bins of the entire sketch, occupancy is
+    estimated from a random sample of `nbins` bins of the first table, read
+    directly from its raw table. This is cheap enough to call periodically
+    while k-mers are being loaded. If `margin` is non-zero, occupancy is
+    reduced by `margin` standard errors of the sampling estimate, so that the
+    result is a lower bound on the FPR with high confidence.
+    """
+    sizes = sketch.hashsizes()
+    table = numpy.frombuffer(sketch.get_raw_tables()[0], dtype=numpy.uint8)
+    if sizes[0] <= nbins:
+        bins = numpy.arange(sizes[0], dtype=numpy.uint64)
+    else:
+        rng = numpy.random.RandomState(seed)
+        bins = rng.randint(0, sizes[0], size=nbins).astype(numpy.uint64)
+    values = bin_lookup(table, bins, storage(sketch_type(sketch)))
+    occupancy = numpy.count_nonzero(values) / len(bins)
+    if margin and len(bins) < sizes[0]:
+        stderr = math.sqrt(occupancy * (1.0 - occupancy) / len(bins))
+        occupancy = max(0.0, occupancy - margin * stderr)
+    occupancy *= sizes[0] / min(sizes)
+    return occupancy ** len(sizes)
+
+
+def expected_fpr(ndistinct, tablesize, numtables):
+    """
+    Compute the expected false positive rate of a sketch before it is loaded.
+
+    Each of `numtables` tables of `tablesize` bins is expected to have a
+    fraction `1 - exp(-n / size)` of its bins occupied after `n` distinct
+    k-mers are stored.
+    """
+    occupancy = 1.0 - math.exp(-float(ndistinct) / tablesize)
+    return occupancy ** numtables
+
+
+def choose_size(ndistinct, memory, bucketsperbyte=1, targetfpr=0.05,
+                maxtables=8, mintablesize=1000):
+    """
+    Choose the table size and number of tables for a sketch.
+
+    The smallest sketch expected to store `ndistinct` k-mers with a false
+    positive rate of at most `targetfpr` is selected. If no such sketch fits
+    in `memory` bytes, the entire memory budget is used with the number of
+    tables that minimizes the expected false positive rate.
+
+    Returns a tuple of (table size, number of tables, expected FPR).
+    """
+    budget = memory * bucketsperbyte
+    best = None
+    for numtables in range(1, maxtables + 1):
+        occupancy = targetfpr ** (1.0 / numtables)
+        tablesize = -float(ndistinct) / math.log(1.0 - occupancy)
+        tablesize = max(int(math.ceil(tablesize)), mintablesize)
+        if tablesize * numtables > budget:
+            continue
+        if best is None or tablesize * numtables < best[0] * best[1]:
+            best = (tablesize, numtables)
+    if best is None:
+        candidates = list()
+        for numtables in range(1, maxtables + 1):
+            tablesize = max(int(budget / numtables), mintablesize)
+            fpr = expected_fpr(ndistinct, tablesize, numtables)
+            candidates.append((fpr, numtables, tablesize))
+        fpr, numtables, tablesize = min(candidates)
+        best = (tablesize, numtables)
+    tablesize, numtables = best
+    return tablesize, numtables, expected_fpr(ndistinct, tablesize, numtables)
+
+
+def hash_bands(hashes, numbands):
+    """
+    Determine the k-mer band to which each of the given k-mer hashes belongs.
+
+    This mirrors the banding strategy used by khmer's
+    `consume_seqfile_banding`: the 64-bit hash space is divided into
+    `numbands` equally sized intervals, and band `i` (0-based) contains the
+    hash values in the i-th interval. Returns an array of band numbers.
+    """
+    hashes = numpy.asarray(hashes, dtype=numpy.uint64)
+    bandwidth = numpy.uint64((2 ** 64 - 1) // numbands)
+    bands = numpy.minimum(hashes // bandwidth, numpy.uint64(numbands - 1))
+    return bands.astype(numpy.int64)
+
+
+def sketch_type(sketch):
+    """
+    Return the khmer type of a sketch.
+
+    For memory-mapped sketches (see `kevlar.mmsketch`), this is the type of
+    the sketch from which the memory-mapped file was written.
+    """
+    return getattr(sketch, 'sketchtype', type(sketch))
+
+
+def storage(sketchtype):
+    """Return the storage scheme (`bit`, `nibble`, or `byte`) of a type."""
+    if sketchtype in (khmer.Nodetable, khmer.Nodegraph):
+        return 'bit'
+    if sketchtype in (khmer.SmallCounttable, khmer.SmallCountgraph):
+        return 'nibble'
+    return 'byte'
+
+
+def bin_lookup(table, bins, scheme):
+    """
+    Look up the values of the specified bins in a raw table.
+
+    The `table` is an array of bytes, `bins` is an array of (unsigned 64-bit)
+    bin numbers, and `scheme` is the storage scheme of the table (see
+    `kevlar.sketch.storage`).
+    """
+    if scheme == 'bit':
+        return table[bins >> _3] >> (bins & _7) & _1
+    elif scheme == 'nibble':
+        return table[bins >> _1] >> ((bins & _1) << _2) & _15
+    return table[bins]
+
+
+def bin_values(sketch):
+    """
+    Return the values stored in every bin of each of the sketch's tables.
+
+    The sketch's raw tables are decoded according to the sketch type (1 bit
+    per bin for Nodetables/Nodegraphs, 4 bits per bin for SmallCounttables/
+    SmallCountgraphs, and 8 bits per bin otherwise). Returns a list of arrays,
+    one per table, where item `i` of each array is the value of bin `i`.
+    """
+    values = list()
+    for size, rawtable in zip(sketch.hashsizes(), sketch.get_raw_tables()):
+        table = numpy.frombuffer(rawtable, dtype=numpy.uint8)
+        scheme = storage(sketch_type(sketch))
+        if scheme == 'bit':
+            table = numpy.unpackbits(table, bitorder='little')
+        elif scheme == 'nibble':
+            table = numpy.stack((table & 0x0F, table >> 4), axis=-1).ravel()
+        values.append(table[:size])
+    return values
+
+
 def load(filename):
     """
     Convenience function for loading a sketch from the specified file.
 
-    Unfortunately, this relies on filename extensions, which are subject to
-    human error. But until khmer stores all relevant information in the file
-    itself and enables loading directly from file contents, this is the best we
-    can do.
+    Sketches in kevlar's self-describing container formats (see
+    `kevlar.mmsketch` and `kevlar.zsketch`) are recognized from the file
+    contents, and sketches served by `kevlar serve` are specified as
+    `serve:SOCKET:NAME` (see `kevlar.serve`). Otherwise, this
+    relies on filename extensions, which are subject to human error. But until
+    khmer stores all relevant information in the file itself and enables
+    loading directly from file contents, this is the best we can do.
     """
+    if kevlar.serve.is_remote(filename):
+        return kevlar.serve.RemoteSketch.connect(filename)
+    if kevlar.mmsketch.is_mmsketch(filename):
+        return MappedSketch(filename)
+    if kevlar.zsketch.is_zsketch(filename):
+        return kevlar.zsketch.load(filename)
     extensions = tuple(sketch_loader_by_filename_extension)
     if not filename.endswith(extensions):
         message = 'unable to determine sketch type from filename ' + filename
@@ -68,9 +245,36 @@ def load(filename):
     return loadfunc(filename)
 
 
+def compact_type(ceiling):
+    """
+    Select the most compact sketch type that can store abundances up to
+    `ceiling`.
+
+    - ceiling of 1: presence/absence only, 1 bit per bin (`Nodetable`)
+    - ceiling <= 15: 4 bits per bin (`SmallCounttable`)
+    - otherwise: 8 bits per bin (`Counttable`)
+
+    Returns a tuple of (count, smallcount, buckets_per_byte), where the first
+    two values are suitable for passing to `kevlar.sketch.allocate`.
+    """
+    if ceiling is None or ceiling > 15:
+        return True, False, khmer._buckets_per_byte['countgraph']
+    if ceiling > 1:
+        return True, True, khmer._buckets_per_byte['smallcountgraph']
+    return False, False, khmer._buckets_per_byte['nodegraph']
+
+
 def allocate(ksize, target_tablesize, num_tables=4, count=False, graph=False,
-             smallcount=False):
-    """Convenience function for allocating memory for a new sketch."""
+             smallcount=False, ceiling=None):
+    """
+    Convenience function for allocating memory for a new sketch.
+
+    If `ceiling` is specified, the `count` and `smallcount` arguments are
+    ignored and the most compact sketch type that can store abundances up to
+    `ceiling` is allocated instead (see `kevlar.sketch.compact_type`).
+    """
+    if ceiling is not None:
+        count, smallcount, _ = compact_type(ceiling)
     if count and graph:
         if smallcount:
             createfunc = khmer.SmallCountgraph
@@ -91,8 +295,177 @@ def allocate(ksize, target_tablesize, num_tables=4, count=False, graph=False,
     return sketch
 
 
+def extensions(sketch):
+    """Return the filename extensions for the given sketch's type."""
+    for sketchtype, extlist in sketch_extensions_by_type.items():
+        if sketch_type(sketch) is sketchtype:
+            return extlist
+    message = 'unsupported sketch type ' + type(sketch).__name__
+    raise KevlarSketchTypeError(message)
+
+
+def save(sketch, filename, fpr=None, metadata=None):
+    """
+    Save a sketch to the specified file.
+
+    If the file name ends in `.mmsketch`, the sketch is saved in the
+    memory-mapped format (see `kevlar.mmsketch`), and if it ends in
+    `.zsketch`, in the block-compressed format (see `kevlar.zsketch`).
+    Otherwise it is saved in
+    khmer's format, and the default extension for the sketch type is appended
+    to the file name if it does not already end in one of the extensions for
+    that type. Either way, the sketch's estimated false positive rate (`fpr`,
+    computed if not provided) is stored as metadata for reuse when the sketch
+    is loaded (see `kevlar.sketch.load_metadata`), along with any additional
+    `metadata` provided. Returns the name of the file written.
+    """
+    if filename.endswith(kevlar.mmsketch.EXTENSION):
+        kevlar.mmsketch.save(sketch, filename, fpr=fpr, metadata=metadata)
+        return filename
+    if filename.endswith(kevlar.zsketch.EXTENSION):
+        kevlar.zsketch.save(sketch, filename, fpr=fpr, metadata=metadata)
+        return filename
+    exts = extensions(sketch)
+    if not filename.endswith(exts):
+        filename += exts[1]
+    sketch.save(filename)
+    save_metadata(sketch, filename, fpr=fpr, metadata=metadata)
+    return filename
+
+
+def metadata_file(filename):
+    return filename + '.meta.json'
+
+
+def describe(sketch, fpr=None, metadata=None):
+    """
+    Describe a sketch for storage in a header or metadata file.
+
+    The description includes the sketch type, k-mer size, table sizes,
+    occupancy, and estimated false positive rate (computed if `fpr` is not
+    provided), as well as any additional `metadata`.
+    """
+    if fpr is None:
+        fpr = estimate_fpr(sketch)
+    description = dict(metadata or {})
+    description.update({
+        'kevlar_version': kevlar.__version__,
+        'sketchtype': sketch_type(sketch).__name__,
+        'ksize': sketch.ksize(),
+        'tablesizes': list(sketch.hashsizes()),
+        'occupied': sketch.n_occupied(),
+        'unique': sketch.n_unique_kmers(),
+        'fpr': fpr,
+    })
+    return description
+
+
+def save_metadata(sketch, filename, fpr=None, metadata=None):
+    """
+    Record the occupancy and FPR of a sketch saved in khmer's format.
+
+    The metadata are written to a small JSON file alongside the sketch file,
+    together with the size and modification time of the sketch file so that
+    stale metadata can be detected. The same information as in the header of
+    a `.mmsketch` file is recorded, including any additional `metadata`.
+    """
+    stat = os.stat(filename)
+    metadata = describe(sketch, fpr=fpr, metadata=metadata)
+    metadata.update({
+        'filesize': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+    })
+    with open(metadata_file(filename), 'w') as fh:
+        json.dump(metadata, fh)
+
+
+def load_metadata(filename):
+    """
+    Load the metadata stored for a sketch file when it was saved.
+
+    Returns `None` if no metadata are available, or if the sketch file has
+    been modified since the metadata were written.
+    """
+    if kevlar.mmsketch.is_mmsketch(filename):
+        header, _ = kevlar.mmsketch.read_header(filename)
+        return header
+    if kevlar.zsketch.is_zsketch(filename):
+        header, _ = kevlar.zsketch.read_header(filename)
+        return header
+    try:
+        with open(metadata_file(filename), 'r') as fh:
+            metadata = json.load(fh)
+        stat = os.stat(filename)
+    except (IOError, OSError, ValueError):
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != (metadata.get('filesize'),
+                                            metadata.get('mtime')):
+        return None
+    return metadata
+
+
+def check_compatible(filenames, band=None, numbands=None):
+    """
+    Check that sketch files can be used together, without loading them.
+
+    The metadata of each sketch (see `kevlar.sketch.load_metadata`) are
+    compared: all sketches must have the same k-mer size, and if `numbands` is
+    provided, sketches computed in banded mode must match the expected
+    (0-based) `band` and number of bands. Sketches without metadata are not
+    checked. Served sketches (see `kevlar.serve`) are checked against the
+    description reported by the server.
+    """
+    first = None
+    for filename in filenames:
+        if kevlar.serve.is_remote(filename):
+            metadata = kevlar.serve.RemoteSketch.connect(filename).info
+        else:
+            metadata = load_metadata(filename)
+        if metadata is None:
+            continue
+        if first is None:
+            first = (filename, metadata)
+        elif metadata['ksize'] != first[1]['ksize']:
+            message = 'k-mer size of sketch "{:s}" ({:d}) '.format(
+                filename, metadata['ksize']
+            )
+            message += 'does not match that of "{:s}" ({:d})'.format(
+                first[0], first[1]['ksize']
+            )
+            raise KevlarSketchMismatchError(message)
+        if numbands and metadata.get('numbands'):
+            expected = (band + 1, numbands)
+            observed = (metadata['band'], metadata['numbands'])
+            if observed != expected:
+                message = 'sketch "{:s}" was computed for band '.format(
+                    filename
+                )
+                message += '{:d}/{:d}, expected band {:d}/{:d}'.format(
+                    *(observed + expected)
+                )
+                raise KevlarSketchMismatchError(message)
+
+
+def cached_fpr(sketch, filename):
+    """
+    Get the FPR of a sketch loaded from a file, computing it only if needed.
+
+    The FPR stored in the sketch's metadata is used if available and current,
+    and `kevlar.sketch.estimate_fpr` is called otherwise. Sketches served by
+    `kevlar serve` carry the FPR reported by the server, which is used as is:
+    the server's occupancy count is not reliable for every sketch (khmer does
+    not update it when loading a `.zsketch` file, for example).
+    """
+    if getattr(sketch, 'fpr', None) is not None:
+        return sketch.fpr
+    metadata = load_metadata(filename)
+    if metadata and metadata.get('fpr') is not None:
+        return metadata['fpr']
+    return estimate_fpr(sketch)
+
+
 def autoload(infile, count=True, graph=False, ksize=31, table_size=1e4,
-             num_tables=4, num_bands=None, band=None):
+             num_tables=4, num_bands=None, band=None, ceiling=None):
     """
     Use file extension to conditionally load sketch into memory.
 
@@ -107,16 +480,21 @@ def autoload(infile, count=True, graph=False, ksize=31, table_size=1e4,
     - `.cg` or `.countgraph`: `Countgraph`
     - `.scg` or `.smallcountgraph`: `SmallCountgraph`
     - `.ng` or `.nodegraph`: `Nodegraph`
+    - `.mmsketch`: memory-mapped sketch (see `kevlar.mmsketch`)
+    - `.zsketch`: block-compressed sketch (see `kevlar.zsketch`)
+    - `serve:SOCKET:NAME`: sketch served by `kevlar serve`
 
     Otherwise, a sketch will be created using the specified arguments and the
     input file will be treated as a FASTA/FASTQ file to be loaded with
-    `.consume_seqfile` or `.consume_seqfile_banding`.
+    `.consume_seqfile` or `.consume_seqfile_banding`. If `ceiling` is
+    specified, a compact sketch storing abundances only up to `ceiling` is
+    created (see `kevlar.sketch.compact_type`).
     """
     try:
         return load(infile)
     except KevlarSketchTypeError:
         sketch = allocate(ksize, table_size, num_tables, count=count,
-                          graph=graph, smallcount=False)
+                          graph=graph, smallcount=False, ceiling=ceiling)
         if num_bands:
             assert band >= 0 and band < num_bands
             sketch.consume_seqfile_banding(infile, num_bands, band)
@@ -132,7 +510,7 @@ def load_sketchfiles(sketchfiles, maxfpr=0.2, logfile=sys.stderr):
         message = 'loading sketchfile "{}"...'.format(sketchfile)
         print('[kevlar::sketch]    ', message, end='', file=logfile)
         sketch = autoload(sketchfile)
-        fpr = estimate_fpr(sketch)
+        fpr = cached_fpr(sketch, sketchfile)
         message = 'done! estimated false positive rate is {:1.3f}'.format(fpr)
         if fpr > maxfpr:
             message += ' (FPR too high, bailing out!!!)'
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import json
+import kevlar
+
+
+def sketch_info(filename):
+    """
+    Describe a sketch file without loading its tables.
+
+    The description is read from the header of `.mmsketch` and `.zsketch`
+    files, or from the
+    metadata saved alongside other sketch files by kevlar (see
+    `kevlar.sketch.load_metadata`). If no metadata are available, only the
+    sketch type implied by the file extension is reported.
+    """
+    info = {'filename': filename}
+    if kevlar.mmsketch.is_mmsketch(filename):
+        info['format'] = 'mmsketch'
+    elif kevlar.zsketch.is_zsketch(filename):
+        info['format'] = 'zsketch'
+    else:
+        info['format'] = 'khmer'
+    metadata = kevlar.sketch.load_metadata(filename)
+    if metadata is not None:
+        info.update(metadata)
+        return info
+    exttypes = kevlar.sketch.sketch_extensions_by_type
+    for sketchtype, extensions in exttypes.items():
+        if filename.endswith(extensions):
+            info['sketchtype'] = sketchtype.__name__
+    return info
+
+
+def format_info(info):
+    """Format a sketch description as human-readable text."""
+    lines = [info['filename']]
+    if info['format'] == 'mmsketch':
+        formatstr = 'kevlar memory-mapped sketch (version {:d})'.format(
+            info['version']
+        )
+    elif info['format'] == 'zsketch':
+        formatstr = 'kevlar compressed sketch (version {:d})'.format(
+            info['version']
+        )
+    else:
+        formatstr = 'khmer'
+    lines.append('    format: ' + formatstr)
+    lines.append('    sketch type: ' + info.get('sketchtype', 'unknown'))
+    if 'ksize' not in info:
+        lines.append('    no metadata available')
+        return '\n'.join(lines)
+
+    sizes = info['tablesizes']
+    lines.append('    k-mer size: {:d}'.format(info['ksize']))
+    lines.append('    tables: {:d} ({:s} bins)'.format(
+        len(sizes), ', '.join(str(size) for size in sizes)
+    ))
+    lines.append('    occupied bins: {:d}'.format(info['occupied']))
+    lines.append('    estimated false positive rate: {:1.3f}'.format(
+        info['fpr']
+    ))
+    if info.get('numbands'):
+        band = '    band: {:d}/{:d}'.format(info['band'], info['numbands'])
+        lines.append(band)
+    if info.get('kevlar_version'):
+        lines.append('    written by kevlar v' + info['kevlar_version'])
+    for inputfile in info.get('inputs') or []:
+        lines.append('    input: {:s} ({:d} bytes, md5 {:s})'.format(
+            inputfile['filename'], inputfile['size'], inputfile['md5']
+        ))
+    return '\n'.join(lines)
+
+
+def main(args):
+    infos = [sketch_info(filename) for filename in args.sketches]
+    outstream = kevlar.open(args.out, 'w')
+    if args.json:
+        json.dump(infos, outstream, indent=4)
+        print(file=outstream)
+    else:
+        for info in infos:
+            print(format_info(info), file=outstream)
+    if args.out not in (None, '-'):
+        outstream.close()
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import pytest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+
+@pytest.fixture
+def tempdir():
+    """Temporary directory, removed with its contents after the test."""
+    dirname = mkdtemp()
+    yield dirname
+    rmtree(dirname)
@@ -445,7 +445,8 @@ def test_load_reads_and_kmers():
         'read22f start=5,mutations=0', 'read35f start=25,mutations=0',
         'read37f start=9,mutations=0'
     ])
-    assert kmers['CCGGTTTTTAGAAGTCTCGACTTTAAGGA'] == testset
+    kmercode = kevlar.kmercode.canonical('CCGGTTTTTAGAAGTCTCGACTTTAAGGA')
+    assert kmers[kmercode] == testset
 
 
 def test_graph_init():
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+from io import StringIO
+import os
+import pytest
+import screed
+import kevlar
+from kevlar.tests import data_file, data_glob
+
+
+@pytest.mark.parametrize('numsamples,memory,budget,numjobs,expected', [
+    (3, 1e6, None, 4, 4),
+    (3, 1e6, 7e6, 4, 2),
+    (3, 1e6, 1e6, 4, 1),
+    (2, 1e6, 1e9, 1, 1),
+])
+def test_concurrent_bands(numsamples, memory, budget, numjobs, expected):
+    njobs = kevlar.banded.concurrent_bands(numsamples, memory, budget, numjobs)
+    assert njobs == expected
+
+
+def test_banded_matches_novel():
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    expected = set()
+    for band in range(3):
+        cases = kevlar.novel.load_samples(
+            None, [[case]], ksize=31, memory=1e6, numbands=3, band=band
+        )
+        controls = kevlar.novel.load_samples(
+            None, [[c] for c in ctrls], ksize=31, memory=1e6, numbands=3,
+            band=band
+        )
+        reads = kevlar.novel.novel(
+            screed.open(case), cases, controls, casemin=6, ctrlmax=0,
+            numbands=3, band=band
+        )
+        for read in reads:
+            kmers = tuple(k.sequence for k in read.ikmers)
+            expected.add((read.name, kmers))
+
+    log = StringIO()
+    reads = kevlar.banded.banded(
+        [[case]], [[c] for c in ctrls], 3, memory=1e6, membudget=6e6,
+        numjobs=3, casemin=6, ctrlmax=0, logstream=log
+    )
+    observed = set((r.name, tuple(k.sequence for k in r.ikmers))
+                   for r in reads)
+    assert len(observed) > 0
+    assert observed == expected
+
+    log = log.getvalue()
+    assert 'processing 3 bands, 2 at a time' in log
+    for band in (1, 2, 3):
+        assert 'band {:d}/3 done'.format(band) in log
+        assert '    band {:d}: counting'.format(band) in log
+
+
+def test_banded_cli(capsys):
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    arglist = ['banded', '--num-bands', '2', '--threads', '2',
+               '--ctrl-max', '0', '--case-min', '6', '--case', case,
+               '--control', ctrls[0], '--control', ctrls[1]]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.banded.main(args)
+    out, err = capsys.readouterr()
+    reads = list(kevlar.parse_augmented_fastx(iter(out.splitlines(True))))
+    assert len(reads) > 0
+    assert len(set(r.name for r in reads)) == len(reads)
+    assert 'Per-band timings' in err
+    assert '[kevlar::filter]' in err
+
+
+def test_banded_pool():
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    pool = kevlar.banded.band_pool(2)
+    try:
+        reads = kevlar.banded.banded(
+            [[case]], [[c] for c in ctrls], 2, numjobs=2, casemin=6,
+            ctrlmax=0, pool=pool, logstream=StringIO()
+        )
+        assert len(list(reads)) > 0
+        # The pool is left open for the caller
+        assert pool.apply(len, ([1, 2, 3], )) == 3
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def test_banded_cli_gzip(tempdir):
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    outfile = os.path.join(tempdir, 'novel.augfastq.gz')
+    arglist = ['banded', '--num-bands', '2', '--threads', '2',
+               '--ctrl-max', '0', '--case-min', '6', '--case', case,
+               '--control', ctrls[0], '--control', ctrls[1], '--out', outfile]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.banded.main(args)
+    reads = list(kevlar.parse_augmented_fastx(kevlar.open(outfile, 'r')))
+    assert len(reads) > 0
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import gzip
+import os
+import pysam
+import pytest
+from shutil import rmtree
+from tempfile import mkdtemp
+import screed
+import kevlar
+from kevlar.checkpoint import KevlarCheckpointError
+from kevlar.tests import data_file, data_glob
+
+
+def write_compressed(infile, tempdir):
+    with kevlar.open(infile, 'r') as instream:
+        data = instream.read().encode('ascii')
+    gzipfile = os.path.join(tempdir, 'reads.gzip.gz')
+    with gzip.open(gzipfile, 'wb') as outstream:
+        outstream.write(data)
+    bgzffile = os.path.join(tempdir, 'reads.bgzf.gz')
+    with pysam.BGZFile(bgzffile, 'wb') as outstream:
+        outstream.write(data)
+    return gzipfile, bgzffile
+
+
+@pytest.mark.parametrize('infile', [
+    'trio1/case1.fq',
+    'simple-genome-case-reads.fa.gz',
+    'bogus-genome/refr.fa',
+])
+def test_parse_positions(infile):
+    infile = data_file(infile)
+    expected = [(r.name, r.sequence) for r in screed.open(infile)]
+    tempdir = mkdtemp()
+    gzipfile, bgzffile = write_compressed(infile, tempdir)
+
+    for filename in (infile, gzipfile, bgzffile):
+        records = list(kevlar.checkpoint.multi_file_iter_positions([filename]))
+        assert [(r.name, r.sequence) for r in records] == expected
+        midpoint = len(records) // 2
+        start = records[midpoint - 1].position
+        resumed = kevlar.checkpoint.multi_file_iter_positions(
+            [filename], start=start
+        )
+        observed = [(r.name, r.sequence) for r in resumed]
+        assert observed == expected[midpoint:]
+    assert kevlar.checkpoint.is_bgzf(bgzffile)
+    assert not kevlar.checkpoint.is_bgzf(gzipfile)
+    rmtree(tempdir)
+
+
+def test_parse_positions_multi_file():
+    infiles = data_glob('trio1/ctrl[1,2].fq')
+    records = list(kevlar.checkpoint.multi_file_iter_positions(infiles))
+    nfirst = len(list(screed.open(infiles[0])))
+    start = records[nfirst - 1].position
+    assert start[0] == 0
+    resumed = kevlar.checkpoint.multi_file_iter_positions(infiles, start)
+    assert [r.name for r in resumed] == [r.name for r in records[nfirst:]]
+
+
+def test_novel_resume(capsys, monkeypatch):
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    tempdir = mkdtemp()
+    outfile = os.path.join(tempdir, 'novel.augfastq')
+    ckptfile = os.path.join(tempdir, 'novel.ckpt')
+    arglist = ['novel', '--ctrl-max', '0', '--case-min', '6', '--case', case,
+               '--control', ctrls[0], '--control', ctrls[1], '--out', outfile,
+               '--checkpoint', ckptfile, '--checkpoint-interval', '500']
+
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.novel.main(args)
+    with open(outfile, 'r') as fh:
+        expected = fh.read()
+    assert expected.strip() != ''
+    os.remove(ckptfile)
+
+    # Simulate a crash part way through, leaving a partially written record.
+    def crash_after(n):
+        printed = list()
+
+        def partial_print(record, outstream):
+            if len(printed) == n:
+                print('@', record.name, file=outstream)
+                raise KeyboardInterrupt()
+            printed.append(record)
+            printfunc(record, outstream)
+        return partial_print
+    printfunc = kevlar.print_augmented_fastx
+    monkeypatch.setattr(kevlar, 'print_augmented_fastx', crash_after(6))
+    args = kevlar.cli.parser().parse_args(arglist)
+    with pytest.raises(KeyboardInterrupt):
+        kevlar.novel.main(args)
+    state = kevlar.checkpoint.load(ckptfile)
+    assert state['nreads'] > 0
+    assert state['offset'] < os.path.getsize(case)
+
+    monkeypatch.setattr(kevlar, 'print_augmented_fastx', printfunc)
+    args = kevlar.cli.parser().parse_args(arglist + ['--resume'])
+    kevlar.novel.main(args)
+    out, err = capsys.readouterr()
+    assert 'Resuming from checkpoint' in err
+    with open(outfile, 'r') as fh:
+        observed = fh.read()
+    assert observed == expected
+    rmtree(tempdir)
+
+
+def test_checkpoint_requires_file_output():
+    arglist = ['novel', '--case', data_file('trio1/case1.fq'),
+               '--checkpoint', 'novel.ckpt']
+    args = kevlar.cli.parser().parse_args(arglist)
+    with pytest.raises(KevlarCheckpointError) as ce:
+        kevlar.novel.case_streams(args, args.case[0], [args.out])
+    assert 'requires output to be written to a file' in str(ce)
+
+    args = kevlar.cli.parser().parse_args(arglist + ['--out', 'novel.fq.gz'])
+    with pytest.raises(KevlarCheckpointError) as ce:
+        kevlar.novel.case_streams(args, args.case[0], [args.out])
+    assert 'requires uncompressed output' in str(ce)
@@ -8,9 +8,14 @@
 # -----------------------------------------------------------------------------
 
 import glob
+from io import StringIO
+import khmer
 import pytest
+import numpy
+import os
 import re
-from tempfile import NamedTemporaryFile
+import threading
+import time
 import screed
 import kevlar
 from kevlar.tests import data_file, data_glob
@@ -25,14 +30,16 @@ def triomask():
     return mask
 
 
-@pytest.mark.parametrize('mask,numbands,band', [
-    (None, None, None),
-    (None, 9, 2),
-    (triomask, None, None),
-    (triomask, 23, 19),
+@pytest.mark.parametrize('usemask,numbands,band', [
+    (False, None, None),
+    (False, 9, 2),
+    (True, None, None),
+    (True, 23, 19),
 ])
-def test_load_threading(mask, numbands, band):
+def test_load_threading(usemask, numbands, band, triomask):
     # Smoke test: make sure things don't explode when run in "threaded" mode.
+    # Errors raised in counting threads are now propagated to the caller.
+    mask = triomask if usemask else None
     infiles = data_glob('trio1/case1.fq')
     sketch = kevlar.count.load_sample_seqfile(
         infiles, 19, 1e7, mask=mask, numbands=numbands, band=band, numthreads=2
@@ -46,32 +53,33 @@ def test_load_threading(mask, numbands, band):
     ('case', 'case-band-2-1', 2, 1, 501),
     ('case', 'case-band-16-7', 16, 7, 68),
 ])
-def test_count_simple(infile, testout, numbands, band, kmers_stored, capsys):
+def test_count_simple(infile, testout, numbands, band, kmers_stored, capsys,
+                      tempdir):
     infile = data_file('simple-genome-{}-reads.fa.gz'.format(infile))
     testout = data_file('simple-genome-{}.ct'.format(testout))
-    with NamedTemporaryFile() as outfile:
-        arglist = ['count', '--ksize', '25', '--memory', '10K',
-                   '--num-bands', str(numbands), '--band', str(band),
-                   outfile.name, infile]
-        args = kevlar.cli.parser().parse_args(arglist)
-        kevlar.count.main(args)
-        out, err = capsys.readouterr()
+    outfile = os.path.join(tempdir, 'out')
+    arglist = ['count', '--ksize', '25', '--memory', '10K',
+               '--num-bands', str(numbands), '--band', str(band),
+               outfile, infile]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.count.main(args)
+    out, err = capsys.readouterr()
 
-        assert '600 reads processed' in str(err)
-        assert '{:d} distinct k-mers stored'.format(kmers_stored) in str(err)
+    assert '600 reads processed' in str(err)
+    assert '{:d} distinct k-mers stored'.format(kmers_stored) in str(err)
 
-        outputfilename = outfile.name + '.counttable'
-        with open(outputfilename, 'rb') as f1, open(testout, 'rb') as f2:
-            assert f1.read() == f2.read()
+    outputfilename = outfile + '.counttable'
+    with open(outputfilename, 'rb') as f1, open(testout, 'rb') as f2:
+        assert f1.read() == f2.read()
 
 
-def test_count_threading():
-    with NamedTemporaryFile(suffix='.counttable') as outfile:
-        infile = data_file('trio1/case1.fq')
-        arglist = ['count', '--ksize', '19', '--memory', '500K',
-                   '--threads', '2', outfile.name, infile]
-        args = kevlar.cli.parser().parse_args(arglist)
-        kevlar.count.main(args)
+def test_count_threading(tempdir):
+    outfile = os.path.join(tempdir, 'case1.counttable')
+    infile = data_file('trio1/case1.fq')
+    arglist = ['count', '--ksize', '19', '--memory', '500K',
+               '--threads', '2', outfile, infile]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.count.main(args)
 
     # No checks, just doing a "smoke test" to make sure things don't explode
     # when counting is done in "threaded" mode.
@@ -96,20 +104,18 @@ def test_count_problematic():
         kevlar.count.main(args)
 
 
-def test_effcount_smoketest():
-    with NamedTemporaryFile(suffix='.ct') as o1, \
-            NamedTemporaryFile(suffix='.ct') as o2, \
-            NamedTemporaryFile(suffix='.ct') as o3:
-
-        arglist = [
-            'effcount', '--sample', data_file('trio1/ctrl1.fq'),
-            '--sample', data_file('trio1/ctrl2.fq'),
-            '--sample', data_file('trio1/case2.fq'),
-            '--ksize', '21', '--memory', '200K', '--memfrac', '0.005',
-            '--max-fpr', '0.1', '--threads', '2', o1.name, o2.name, o3.name
-        ]
-        args = kevlar.cli.parser().parse_args(arglist)
-        kevlar.effcount.main(args)
+def test_effcount_smoketest(tempdir):
+    outfiles = [os.path.join(tempdir, name + '.ct')
+                for name in ('ctrl1', 'ctrl2', 'case2')]
+    arglist = [
+        'effcount', '--sample', data_file('trio1/ctrl1.fq'),
+        '--sample', data_file('trio1/ctrl2.fq'),
+        '--sample', data_file('trio1/case2.fq'),
+        '--ksize', '21', '--memory', '200K', '--memfrac', '0.005',
+        '--max-abund', '1', '--max-fpr', '0.1', '--threads', '2',
+    ] + outfiles
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.effcount.main(args)
 
 
 def test_effcount_problematic():
@@ -140,3 +146,293 @@ def test_effcount_problematic():
     with pytest.raises(ValueError) as ve:
         kevlar.effcount.main(args)
     assert 'Must specify --num-bands and --band together' in str(ve)
+
+
+@pytest.mark.parametrize('ceiling,extension', [
+    ('1', '.nodetable'),
+    ('2', '.smallcounttable'),
+    ('50', '.counttable'),
+])
+def test_count_ceiling(ceiling, extension, tempdir):
+    infile = data_file('simple-genome-ctrl1-reads.fa.gz')
+    outfile = os.path.join(tempdir, 'ctrl1')
+    arglist = ['count', '--ksize', '25', '--memory', '10K', '--ceiling',
+               ceiling, outfile, infile]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.count.main(args)
+    outputs = ['ctrl1' + extension, 'ctrl1' + extension + '.meta.json']
+    assert sorted(os.listdir(tempdir)) == outputs
+    sketch = kevlar.sketch.load(outfile + extension)
+    assert sketch.get('ACTAACATGTTGTCGGCATTCCCAT') > 0
+
+
+@pytest.mark.parametrize('numthreads', [1, 2, 5])
+def test_count_multi_file(numthreads):
+    infiles = data_glob('trio1/ctrl[1,2].fq') + data_glob('trio1/case1.fq')
+    log = StringIO()
+    sketch = kevlar.count.load_sample_seqfile(
+        infiles, 19, 1e6, numthreads=numthreads, logfile=log
+    )
+    serial = khmer.Counttable(19, 1e6 / 4, 4)
+    nreads = 0
+    for infile in infiles:
+        reads, kmers = serial.consume_seqfile(infile)
+        nreads += reads
+    for record in screed.open(infiles[0]):
+        for kmer in sketch.get_kmers(record.sequence):
+            assert sketch.get(kmer) == serial.get(kmer)
+
+    # Per-file and total throughput is reported, and all files are counted.
+    log = log.getvalue()
+    for infile in infiles:
+        assert infile + ': ' in log
+    total = re.search(r'total: (\d+) reads', log)
+    assert int(total.group(1)) == nreads
+    assert '{:d} reads processed'.format(nreads) in log
+    assert 'with {:d} thread(s)'.format(numthreads) in log
+
+
+@pytest.mark.parametrize('samplereads', [None, 100])
+def test_count_auto_size(samplereads):
+    infiles = data_glob('trio1/ctrl[1,2].fq')
+    exact = set()
+    for record in kevlar.multi_file_iter_screed(infiles):
+        for kmer in kevlar.clean_subseqs(record.sequence, 19):
+            for i in range(len(kmer) - 19 + 1):
+                exact.add(kevlar.revcommin(kmer[i:i+19]))
+    ndistinct, nreads = kevlar.count.estimate_distinct_kmers(
+        infiles, 19, samplereads=samplereads
+    )
+    if samplereads is None:
+        assert abs(ndistinct - len(exact)) / len(exact) < 0.05
+    else:
+        assert nreads == 200
+        assert ndistinct > 0.9 * len(exact)
+
+    log = StringIO()
+    sketch = kevlar.count.load_sample_seqfile(
+        infiles, 19, 1e7, autosize=True, samplereads=samplereads,
+        targetfpr=0.01, logfile=log
+    )
+    assert 'auto-sizing' in log.getvalue()
+    assert 'WARNING' not in log.getvalue()
+    assert kevlar.sketch.estimate_fpr(sketch) <= 0.02
+    assert sum(sketch.hashsizes()) < 1e7
+
+
+def test_count_auto_size_cli(capsys, tempdir):
+    infile = data_file('simple-genome-case-reads.fa.gz')
+    outfile = os.path.join(tempdir, 'case.ct')
+    arglist = ['count', '--ksize', '25', '--memory', '10K', '--auto-size',
+               '--auto-size-sample', '50', '--target-fpr', '0.1',
+               outfile, infile]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.count.main(args)
+    out, err = capsys.readouterr()
+    assert 'auto-sizing' in err
+    assert 'estimated from 50 reads (sampled)' in err
+
+
+def test_count_abort_early():
+    infiles = data_glob('trio1/case1.fq') * 4
+    log = StringIO()
+    with pytest.raises(kevlar.sketch.KevlarUnsuitableFPRError) as e:
+        kevlar.count.load_sample_seqfile(
+            infiles, 21, 1000, maxfpr=0.01, fprinterval=0.001, logfile=log
+        )
+    assert 'before all input was loaded' in str(e)
+    assert 'total:' not in log.getvalue()
+
+
+def test_count_abort_abandons_checksums(monkeypatch, tempdir):
+    stopped = list()
+
+    def describe_inputs(seqfiles, stop=None):
+        stopped.append(stop.wait(timeout=60))
+
+    monkeypatch.setattr(kevlar.count, 'describe_inputs', describe_inputs)
+    infiles = data_glob('trio1/case1.fq') * 4
+    outfile = os.path.join(tempdir, 'case.counttable')
+    starttime = time.time()
+    with pytest.raises(kevlar.sketch.KevlarUnsuitableFPRError):
+        kevlar.count.load_sample_seqfile(
+            infiles, 21, 1000, maxfpr=0.01, fprinterval=0.001,
+            outfile=outfile, logfile=StringIO()
+        )
+    assert time.time() - starttime < 30
+    for _ in range(100):
+        if stopped:
+            break
+        time.sleep(0.05)
+    assert stopped == [True]
+
+    stop = threading.Event()
+    stop.set()
+    assert kevlar.count.describe_inputs(infiles, stop=stop) is None
+
+
+def test_count_abort_stops_threads():
+    def monitor():
+        raise kevlar.sketch.KevlarUnsuitableFPRError('bail')
+
+    infiles = data_glob('trio1/case1.fq') * 8
+    bandsketches = {band: khmer.Counttable(21, 1e5, 4) for band in range(2)}
+    before = threading.active_count()
+    with pytest.raises(kevlar.sketch.KevlarUnsuitableFPRError):
+        kevlar.count.consume_seqfiles(
+            bandsketches, infiles, numthreads=2, numbands=2, monitor=monitor,
+            monitorint=0.001, logfile=StringIO()
+        )
+    for _ in range(100):
+        if threading.active_count() == before:
+            break
+        time.sleep(0.05)
+    assert threading.active_count() == before
+
+
+@pytest.mark.parametrize('maxabund,numbands,band', [
+    (1, None, None),
+    (3, None, None),
+    (3, 4, 1),
+])
+def test_count_mask_max_abund(maxabund, numbands, band):
+    infiles = data_glob('trio1/ctrl1.fq')
+    mask = kevlar.count.load_sample_seqfile(infiles, 21, 1e6)
+    log = StringIO()
+    sketch = kevlar.count.load_sample_seqfile(
+        data_glob('trio1/case1.fq'), 21, 1e6, mask=mask, maskmaxabund=maxabund,
+        numbands=numbands, band=band, numthreads=2, logfile=log
+    )
+
+    nskipped = 0
+    for record in screed.open(data_file('trio1/case1.fq')):
+        hashes = sketch.get_kmer_hashes(record.sequence)
+        bands = kevlar.sketch.hash_bands(hashes, numbands or 1)
+        for kmerhash, kmerband in zip(hashes, bands):
+            if numbands and kmerband != band:
+                assert sketch.get(kmerhash) == 0
+            elif mask.get(kmerhash) >= maxabund:
+                nskipped += 1
+                assert sketch.get(kmerhash) == 0
+            else:
+                assert sketch.get(kmerhash) > 0
+    assert nskipped > 0
+    message = '{:d} k-mers skipped (abundance >= {:d} in mask)'.format(
+        nskipped, maxabund
+    )
+    assert message in log.getvalue()
+
+
+def test_count_mask_skipped_estimate():
+    mask = kevlar.count.load_sample_seqfile(data_glob('trio1/ctrl1.fq'), 21,
+                                            1e6)
+    infiles = data_glob('trio1/case1.fq')
+    sketch = kevlar.sketch.allocate(21, 1e6 / 4, count=True)
+    log = StringIO()
+    nreads, nkmers = kevlar.count.consume_seqfiles(
+        sketch, infiles, mask=mask, maskmaxabund=2, masksample=100,
+        logfile=log
+    )
+    nsampled, nskipped, complete = kevlar.count.sample_masked_kmers(
+        infiles, mask, maxabund=2, samplereads=100
+    )
+    assert not complete
+    assert 0 < nskipped < nsampled
+    fraction = nskipped / nsampled
+    message = '~{:d} k-mers ({:.1%}) skipped'.format(
+        int(nkmers * fraction / (1.0 - fraction)), fraction
+    )
+    assert message in log.getvalue()
+    assert 'estimated from the first 100 reads of each file' in log.getvalue()
+
+
+@pytest.mark.parametrize('singlepass,bandmemory,numpasses', [
+    (False, None, 3),
+    (True, None, 1),
+    (True, 2e5, 2),
+])
+def test_count_multiband(singlepass, bandmemory, numpasses, tempdir):
+    infiles = data_glob('trio1/ctrl[1,2].fq')
+    outfile = os.path.join(tempdir, 'ctrl.band{band}.counttable')
+    log = StringIO()
+    outfiles = kevlar.count.load_sample_seqfile_multiband(
+        infiles, 21, 1e5, 4, [0, 2, 3], outfile, bandmemory=bandmemory,
+        numthreads=2, singlepass=singlepass, logfile=log
+    )
+    assert outfiles == [
+        os.path.join(tempdir, 'ctrl.band{:d}.counttable'.format(band))
+        for band in (1, 3, 4)
+    ]
+    assert 'in {:d} pass(es)'.format(numpasses) in log.getvalue()
+
+    for band, filename in zip([0, 2, 3], outfiles):
+        observed = kevlar.sketch.load(filename)
+        expected = kevlar.count.load_sample_seqfile(
+            infiles, 21, 1e5, numbands=4, band=band, logfile=StringIO()
+        )
+        for obstable, exptable in zip(observed.get_raw_tables(),
+                                      expected.get_raw_tables()):
+            assert numpy.array_equal(numpy.asarray(obstable),
+                                     numpy.asarray(exptable))
+        metadata = kevlar.sketch.load_metadata(filename)
+        assert (metadata['band'], metadata['numbands']) == (band + 1, 4)
+
+
+def test_consume_multiband_batches():
+    infiles = data_glob('trio1/ctrl1.fq')
+    expected = {band: khmer.Counttable(21, 1e5, 4) for band in (1, 2)}
+    expkmers = 0
+    for band, sketch in expected.items():
+        expreads, bandkmers = sketch.consume_seqfile_banding(infiles[0], 3,
+                                                             band)
+        expkmers += bandkmers
+    observed = {band: khmer.Counttable(21, 1e5, 4) for band in (1, 2)}
+    parser = khmer.ReadParser(infiles[0])
+    nreads, nkmers = kevlar.count.consume_seqfile_multiband(
+        observed, parser, 3, batchsize=1000
+    )
+    assert (nreads, nkmers) == (expreads, expkmers)
+    for band in (1, 2):
+        for obstable, exptable in zip(observed[band].get_raw_tables(),
+                                      expected[band].get_raw_tables()):
+            assert numpy.array_equal(numpy.asarray(obstable),
+                                     numpy.asarray(exptable))
+
+
+def test_count_multiband_cli(tempdir, capsys):
+    outfile = os.path.join(tempdir, 'case.band{band}.ct')
+    arglist = ['count', '--ksize', '25', '--memory', '10K', '--num-bands',
+               '3', '--all-bands', '--single-pass', '--band-memory', '10K',
+               outfile,
+               data_file('simple-genome-case-reads.fa.gz')]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.count.main(args)
+    out, err = capsys.readouterr()
+    assert 'counting 3 bands in 3 pass(es)' in err
+    for band in (1, 2, 3):
+        assert os.path.exists(outfile.replace('{band}', str(band)))
+
+    args.counttable = os.path.join(tempdir, 'case.ct')
+    with pytest.raises(ValueError) as ve:
+        kevlar.count.main(args)
+    assert 'must contain a "{band}" placeholder' in str(ve)
+
+
+@pytest.mark.parametrize('options,message', [
+    (['--single-pass'], 'Must specify --bands or --all-bands'),
+    (['--band-memory', '10K'], 'Must specify --bands or --all-bands'),
+    (['--num-bands', '3', '--band', '1', '--single-pass'],
+     'Must specify --bands or --all-bands'),
+    (['--num-bands', '3', '--all-bands', '--band-memory', '10K'],
+     'Must specify --single-pass with --band-memory'),
+])
+def test_count_multiband_options(options, message, tempdir):
+    outfile = os.path.join(tempdir, 'case.band{band}.ct')
+    arglist = ['count', '--ksize', '25', '--memory', '10K'] + options + [
+        outfile, data_file('simple-genome-case-reads.fa.gz')
+    ]
+    args = kevlar.cli.parser().parse_args(arglist)
+    with pytest.raises(ValueError) as ve:
+        kevlar.count.main(args)
+    assert message in str(ve)
+    assert os.listdir(tempdir) == []
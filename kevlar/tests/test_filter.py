@@ -8,12 +8,16 @@
 # -----------------------------------------------------------------------------
 
 import glob
+from io import StringIO
+import os
 import pytest
+from shutil import rmtree
 import sys
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
 import khmer
 import kevlar
 from kevlar.seqio import AnnotatedReadSet as ReadSet
+from kevlar.seqio import SpilledAnnotatedReadSet as SpilledReadSet
 
 
 @pytest.fixture
@@ -156,6 +160,74 @@ def test_validate_with_mask():
             assert kevlar.revcom(ikmer.sequence) != kmer
 
 
+def test_validate_exact():
+    filelist = kevlar.tests.data_glob('collect.beta.?.txt')
+    readset = ReadSet(19, 5e3, exact=True)
+    for record in kevlar.seqio.afxstream(filelist):
+        readset.add(record)
+    assert readset._counts is None
+    readset.validate()
+    assert readset.valid == (4, 32)
+    assert len(readset._counts) == 4
+    for kmer in ['AGGGGCGTGACTTAATAAG', 'CCTTATTAAGTCACGCCCC']:
+        assert readset._counts.get(kmer) == 8
+    assert readset._counts.get('AAAAAAAAAAAAAAAAAAA') == 0
+
+    readset = ReadSet(19, 5e3, exact=True)
+    for record in kevlar.seqio.afxstream(filelist):
+        readset.add(record)
+    readset.validate(minabund=9)
+    assert readset.valid == (0, 0)
+
+
+@pytest.mark.parametrize('exact', [False, True])
+@pytest.mark.parametrize('numbuckets', [1, 4, 256])
+def test_validate_spilled(exact, numbuckets):
+    filelist = kevlar.tests.data_glob('collect.beta.?.txt')
+    readset = SpilledReadSet(19, 5e3, exact=exact, numbuckets=numbuckets)
+    for record in kevlar.seqio.afxstream(filelist):
+        readset.add(record)
+    assert len(readset) == 8
+    assert readset.read_instances == 16
+    assert readset.distinct_ikmers == 4
+    readset.validate()
+    assert readset.valid == (4, 32)
+    assert readset.counts.get('AGGGGCGTGACTTAATAAG') == 8
+
+    records = list(readset)
+    assert len(records) == 8
+    for record in records:
+        assert len(record.ikmers) == 4
+        for kmer in record.ikmers:
+            assert kmer.abund[0] == 8
+
+
+@pytest.mark.parametrize('numbuckets', [0, 257])
+def test_spilled_numbuckets(numbuckets):
+    with pytest.raises(ValueError) as ve:
+        SpilledReadSet(19, 5e3, numbuckets=numbuckets)
+    assert 'numbuckets must be between 1 and 256' in str(ve)
+
+
+def test_validate_spilled_mask():
+    kmer = 'AGGGGCGTGACTTAATAAG'
+    mask = khmer.Nodetable(19, 1e3, 2)
+    mask.add(kmer)
+
+    filelist = kevlar.tests.data_glob('collect.alpha.txt')
+    readset = SpilledReadSet(19, 5e3)
+    for record in kevlar.seqio.afxstream(filelist):
+        readset.add(record)
+    readset.validate(mask=mask)
+    assert readset.valid == (3, 24)
+    assert readset.masked == (1, 8)
+    assert len(readset) == 9
+    assert readset.discarded == 1
+    for record in readset:
+        for ikmer in record.ikmers:
+            assert kevlar.revcommin(ikmer.sequence) != kmer
+
+
 def test_ctrl3(ctrl3):
     readset = ctrl3
     readset.validate(minabund=6)
@@ -193,3 +265,83 @@ def test_filter_main(capsys):
 
     out, err = capsys.readouterr()
     assert '171 instances of 13 distinct k-mers validated as novel' in err
+
+
+def test_filter_main_exact(capsys):
+    arglist = [
+        'filter', '--exact-abund', '--min-abund', '6', '--ksize', '13',
+        kevlar.tests.data_file('trio1/novel_3_1,2.txt'),
+    ]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.filter.main(args)
+
+    out, err = capsys.readouterr()
+    assert 'their abundances will be counted exactly' in err
+    assert '5782 instances of 424 distinct k-mers validated as novel' in err
+
+
+def test_filter_main_exact_large_ksize():
+    arglist = [
+        'filter', '--exact-abund', '--ksize', '33',
+        kevlar.tests.data_file('trio1/novel_3_1,2.txt'),
+    ]
+    args = kevlar.cli.parser().parse_args(arglist)
+    with pytest.raises(ValueError) as ve:
+        kevlar.filter.main(args)
+    assert '--exact-abund supports k-mer sizes up to 32, not 33' in str(ve)
+
+
+def test_filter_main_spilled(capsys):
+    tempdir = mkdtemp()
+    arglist = [
+        'filter', '--spill-dir', tempdir, '--abund-memory', '10M',
+        '--min-abund', '6', '--ksize', '13',
+        kevlar.tests.data_file('trio1/novel_3_1,2.txt'),
+    ]
+    args = kevlar.cli.parser().parse_args(arglist)
+    try:
+        kevlar.filter.main(args)
+        assert os.listdir(tempdir) == []
+    finally:
+        rmtree(tempdir)
+
+    out, err = capsys.readouterr()
+    assert '5782 instances of 424 distinct k-mers validated as novel' in err
+    assert out.startswith('@')
+
+
+def test_filter_merge(capsys):
+    case = kevlar.tests.data_file('trio1/case1.fq')
+    ctrls = kevlar.tests.data_glob('trio1/ctrl[1,2].fq')
+    tempdir = mkdtemp()
+    bandfiles = list()
+    for band in range(1, 4):
+        bandfile = os.path.join(tempdir, 'band{:d}.augfastq'.format(band))
+        arglist = [
+            'novel', '--ctrl-max', '0', '--case-min', '6', '--num-bands', '3',
+            '--band', str(band), '--read-index', '--case', case,
+            '--control', ctrls[0], '--control', ctrls[1], '--out', bandfile,
+        ]
+        args = kevlar.cli.parser().parse_args(arglist)
+        kevlar.novel.main(args)
+        bandfiles.append(bandfile)
+    capsys.readouterr()
+
+    try:
+        outputs = list()
+        for merge in ([], ['--merge']):
+            arglist = ['filter', '--min-abund', '6'] + merge + bandfiles
+            args = kevlar.cli.parser().parse_args(arglist)
+            kevlar.filter.main(args)
+            out, err = capsys.readouterr()
+            reads = kevlar.parse_augmented_fastx(StringIO(out))
+            reads = {r.name: sorted(k.sequence for k in r.ikmers)
+                     for r in reads}
+            validated = [line for line in err.split('\n')
+                         if 'as novel' in line]
+            outputs.append((reads, validated))
+    finally:
+        rmtree(tempdir)
+
+    assert len(outputs[0][0]) > 0
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import random
+import pytest
+import kevlar
+from kevlar.kmercode import (encode, canonical, decode, canonical_kmers,
+                             KevlarKmerEncodingError)
+
+
+def test_encode_decode():
+    assert encode('A') == 0
+    assert encode('T') == 3
+    assert encode('ACGT') == 0b00011011
+    assert encode('acgt') == encode('ACGT')
+    assert decode(0b00011011, 4) == 'ACGT'
+    assert decode(0, 5) == 'AAAAA'
+
+    kmer = 'GATTACAGATTACAGATTACAGATTACAGATT'
+    assert len(kmer) == 32
+    assert encode(kmer) < 2 ** 64
+    assert decode(encode(kmer), 32) == kmer
+
+
+def test_canonical():
+    assert canonical('TTTTT') == encode('AAAAA')
+    assert canonical('AAAAA') == encode('AAAAA')
+    assert canonical('TTTTA') == encode('TAAAA')
+
+    random.seed(1234)
+    for _ in range(100):
+        kmer = ''.join(random.choice('ACGT') for _ in range(31))
+        code = canonical(kmer)
+        assert code == canonical(kevlar.revcom(kmer))
+        assert decode(code, 31) == kevlar.revcommin(kmer)
+
+
+def test_encode_bogus():
+    with pytest.raises(KevlarKmerEncodingError) as kee:
+        canonical('ACGNT')
+    assert 'cannot encode k-mer "ACGNT"' in str(kee)
+    with pytest.raises(KevlarKmerEncodingError):
+        encode('AC GT')
+
+
+def test_canonical_kmers():
+    sequence = 'TTAACTCTAGATTAGGGGCGTGACTTAATAAGGTGTGGGCCTAAGCGTCT'
+    codes = canonical_kmers(sequence, 19)
+    expected = [canonical(sequence[i:i + 19])
+                for i in range(len(sequence) - 19 + 1)]
+    assert codes.tolist() == expected
+
+    sequence = 'ACGTACGTNACGTACGTA'
+    codes = canonical_kmers(sequence, 8)
+    expected = ['ACGTACGT', 'ACGTACGT', 'CGTACGTA']
+    assert codes.tolist() == [canonical(kmer) for kmer in expected]
+
+    assert len(canonical_kmers('ACGT', 5)) == 0
+    with pytest.raises(KevlarKmerEncodingError) as kee:
+        canonical_kmers('A' * 40, 33)
+    assert 'cannot encode 33-mers in 64 bits' in str(kee)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+from io import StringIO
+import os
+import pytest
+from shutil import copyfile
+import time
+import khmer
+import kevlar
+from kevlar.maskcache import cache_key, checksums, evict, lookup, store
+
+
+@pytest.fixture
+def cachedir(tempdir):
+    return tempdir
+
+
+def test_cache_key():
+    key = cache_key(['abc', 'def'], 31, 1e6)
+    assert len(key) == 64
+    assert key == cache_key(['abc', 'def'], 31, 1e6)
+    assert key != cache_key(['def', 'abc'], 31, 1e6)
+    assert key != cache_key(['abc', 'def'], 25, 1e6)
+    assert key != cache_key(['abc', 'def'], 31, 1e7)
+
+
+def test_checksums(cachedir):
+    seqfile = os.path.join(cachedir, 'refr.fa')
+    copyfile(kevlar.tests.data_file('bogus-genome/refr.fa'), seqfile)
+    md5s = checksums([seqfile], cachedir)
+    assert md5s == [kevlar.count.describe_inputs([seqfile])[0]['md5']]
+    assert os.path.exists(os.path.join(cachedir, 'checksums.json'))
+
+    with open(seqfile, 'a') as fh:
+        print('>extra\nACGTACGTACGTACGT', file=fh)
+    newmd5s = checksums([seqfile], cachedir)
+    assert newmd5s != md5s
+    assert newmd5s == [kevlar.count.describe_inputs([seqfile])[0]['md5']]
+
+
+def test_store_lookup_evict(cachedir):
+    assert lookup(cachedir, 'bogus') is None
+
+    masks = list()
+    for i in range(3):
+        mask = khmer.Nodetable(13, 1e4, 4)
+        mask.consume('ACGTACGTTTAGAACCGATGCAT'[i:])
+        store(mask, cachedir, 'mask{:d}'.format(i), maxsize=1e9)
+        os.utime(os.path.join(cachedir, 'mask{:d}.mmsketch'.format(i)),
+                 (time.time() - 100 + i, time.time() - 100 + i))
+        masks.append(mask)
+    loaded = lookup(cachedir, 'mask1')
+    assert loaded.get('TTAGAACCGATGC') == masks[1].get('TTAGAACCGATGC')
+
+    entrysize = os.path.getsize(os.path.join(cachedir, 'mask2.mmsketch'))
+    evicted = evict(cachedir, 2 * entrysize, keep='mask0')
+    assert evicted == ['mask2']
+    assert sorted(os.listdir(cachedir)) == ['mask0.mmsketch', 'mask1.mmsketch']
+
+
+def test_load_mask_cached(cachedir):
+    maskfiles = [kevlar.tests.data_file('bogus-genome/refr.fa')]
+    log = StringIO()
+    mask = kevlar.filter.load_mask(maskfiles, 13, 1e7, cachedir=cachedir,
+                                   logstream=log)
+    assert 'k-mers consumed; stored in cache' in log.getvalue()
+    entries = [f for f in os.listdir(cachedir) if f.endswith('.mmsketch')]
+    assert len(entries) == 1
+
+    log = StringIO()
+    cached = kevlar.filter.load_mask(maskfiles, 13, 1e7, cachedir=cachedir,
+                                     logstream=log)
+    assert 'nodetable loaded from cache' in log.getvalue()
+    assert 'k-mers consumed' not in log.getvalue()
+    for kmer in ('GGCAATACATATTTA', 'TTTTTTTTTTTTTTT'):
+        assert cached.get(kmer[:13]) == mask.get(kmer[:13])
+
+    log = StringIO()
+    kevlar.filter.load_mask(maskfiles, 13, 2e7, cachedir=cachedir,
+                            logstream=log)
+    assert 'stored in cache' in log.getvalue()
+    entries = [f for f in os.listdir(cachedir) if f.endswith('.mmsketch')]
+    assert len(entries) == 2
+
+
+def test_load_mask_cached_save(cachedir):
+    maskfiles = [kevlar.tests.data_file('bogus-genome/refr.fa')]
+    savefiles = [os.path.join(cachedir, 'mask{:d}.nt'.format(i))
+                 for i in range(2)]
+    for savefile in savefiles:
+        mask = kevlar.filter.load_mask(maskfiles, 13, 1e7, savefile=savefile,
+                                       cachedir=cachedir, logstream=StringIO())
+    assert isinstance(mask, kevlar.mmsketch.MappedSketch)
+
+    first, second = [kevlar.sketch.load(f) for f in savefiles]
+    assert second.hashsizes() == first.hashsizes()
+    for kmer in ('GGCAATACATATTTA', 'TTTTTTTTTTTTTTT'):
+        assert second.get(kmer[:13]) == first.get(kmer[:13])
+    assert kevlar.sketch.cached_fpr(second, savefiles[1]) == \
+        kevlar.sketch.cached_fpr(first, savefiles[0])
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import os
+import numpy
+import pytest
+import screed
+import kevlar
+from kevlar.mmsketch import KevlarMappedSketchError
+from kevlar.tests import data_file
+
+
+@pytest.mark.parametrize('count,graph,smallcount', [
+    (True, False, False),
+    (True, False, True),
+    (False, False, False),
+    (True, True, False),
+    (False, True, False),
+])
+def test_mmsketch_roundtrip(count, graph, smallcount, tempdir):
+    sketch = kevlar.sketch.allocate(21, 5000, 4, count=count, graph=graph,
+                                    smallcount=smallcount)
+    infile = data_file('bogus-genome/refr.fa')
+    sketch.consume_seqfile(infile)
+    sketch.consume_seqfile(infile)
+    filename = os.path.join(tempdir, 'test.mmsketch')
+    assert kevlar.sketch.save(sketch, filename) == filename
+
+    mapped = kevlar.sketch.load(filename)
+    assert isinstance(mapped, kevlar.mmsketch.MappedSketch)
+    assert kevlar.sketch.sketch_type(mapped) is type(sketch)
+    assert mapped.ksize() == sketch.ksize()
+    assert mapped.hashsizes() == sketch.hashsizes()
+    assert kevlar.sketch.estimate_fpr(mapped) == \
+        kevlar.sketch.estimate_fpr(sketch)
+    for record in screed.open(infile):
+        seq = record.sequence
+        assert mapped.get_kmer_counts(seq) == sketch.get_kmer_counts(seq)
+        assert mapped.get_kmer_hashes(seq) == sketch.get_kmer_hashes(seq)
+        kmer = seq[:21]
+        assert mapped.get(kmer) == sketch.get(kmer)
+    assert mapped.get('A' * 21) == sketch.get('A' * 21)
+
+    for observed, expected in zip(kevlar.sketch.bin_values(mapped),
+                                  kevlar.sketch.bin_values(sketch)):
+        assert numpy.array_equal(observed, expected)
+    assert not numpy.asarray(mapped.get_raw_tables()[0]).flags.writeable
+
+
+def test_mmsketch_bad_file(tempdir):
+    filename = os.path.join(tempdir, 'bogus.mmsketch')
+    with open(filename, 'wb') as fh:
+        fh.write(b'this is not a sketch')
+    with pytest.raises(KevlarMappedSketchError) as mse:
+        kevlar.sketch.load(filename)
+    assert 'not a memory-mapped sketch file' in str(mse)
+
+    sketch = kevlar.sketch.allocate(21, 5000, 4, count=True)
+    kevlar.mmsketch.save(sketch, filename)
+    with open(filename, 'r+b') as fh:
+        fh.truncate(os.path.getsize(filename) - 100)
+    with pytest.raises(KevlarMappedSketchError) as mse:
+        kevlar.sketch.load(filename)
+    assert 'truncated memory-mapped sketch file' in str(mse)
+
+
+def test_novel_mmsketch(tempdir):
+    case = data_file('trio1/case1.fq')
+    ctrls = [data_file('trio1/ctrl1.fq'), data_file('trio1/ctrl2.fq')]
+    sketchfiles = dict()
+    for ext in ('.counttable', '.mmsketch'):
+        for label, infile in [('case', case), ('ctrl1', ctrls[0]),
+                              ('ctrl2', ctrls[1])]:
+            outfile = os.path.join(tempdir, label + ext)
+            arglist = ['count', '--ksize', '13', '--memory', '1M', outfile,
+                       infile]
+            args = kevlar.cli.parser().parse_args(arglist)
+            kevlar.count.main(args)
+            sketchfiles[label + ext] = outfile
+
+    outputs = list()
+    for ext in ('.counttable', '.mmsketch'):
+        outfile = os.path.join(tempdir, 'novel' + ext + '.augfastq')
+        arglist = [
+            'novel', '--ksize', '13', '--case', case,
+            '--case-counts', sketchfiles['case' + ext],
+            '--control-counts', sketchfiles['ctrl1' + ext],
+            sketchfiles['ctrl2' + ext], '--ctrl-max', '0', '--case-min', '8',
+            '--out', outfile, '--threads', '2',
+        ]
+        args = kevlar.cli.parser().parse_args(arglist)
+        kevlar.novel.main(args)
+        with open(outfile, 'r') as fh:
+            outputs.append(fh.read())
+    assert outputs[0].strip() != ''
+    assert outputs[0] == outputs[1]
@@ -9,9 +9,13 @@
 # -----------------------------------------------------------------------------
 
 import glob
+from io import StringIO
+import numpy
+import os
 import pytest
 import re
-from tempfile import NamedTemporaryFile
+from shutil import rmtree
+from tempfile import mkdtemp, NamedTemporaryFile
 import screed
 import kevlar
 from khmer import Counttable
@@ -193,7 +197,7 @@ def test_skip_until(capsys):
     case = kevlar.tests.data_file('trio1/case1.fq')
     ctrls = kevlar.tests.data_glob('trio1/ctrl[1,2].fq')
     arglist = ['novel', '--ctrl-max', '0', '--case-min', '6',
-               '--skip-until', readname, '--upint', '50',
+               '--skip-until', readname, '--upint', '50', '--exact-kmer-count',
                '--case', case, '--control', ctrls[0], '--control', ctrls[1]]
     args = kevlar.cli.parser().parse_args(arglist)
     kevlar.novel.main(args)
@@ -203,3 +207,271 @@ def test_skip_until(capsys):
                '(skipped 1001 reads)')
     assert message in err
     assert '29 unique novel kmers in 14 reads' in err
+
+
+def test_novel_multiworker():
+    case = kevlar.tests.data_file('trio1/case1.fq')
+    ctrls = kevlar.tests.data_glob('trio1/ctrl[1,2].fq')
+    cases = kevlar.novel.load_samples(None, [[case]], ksize=31, memory=1e6)
+    controls = kevlar.novel.load_samples(
+        None, [[c] for c in ctrls], ksize=31, memory=1e6
+    )
+
+    serial = kevlar.novel.novel(
+        screed.open(case), cases, controls, casemin=6, ctrlmax=0
+    )
+    serial = list(serial)
+    parallel = kevlar.novel.novel(
+        screed.open(case), cases, controls, casemin=6, ctrlmax=0,
+        numworkers=3, batchsize=50
+    )
+    parallel = list(parallel)
+
+    assert len(serial) > 0
+    assert [r.name for r in serial] == [r.name for r in parallel]
+    assert [r.ikmers for r in serial] == [r.ikmers for r in parallel]
+
+
+def test_scan_pools_independent():
+    case = kevlar.tests.data_file('trio1/case1.fq')
+    ctrls = kevlar.tests.data_glob('trio1/ctrl[1,2].fq')
+    cases = kevlar.novel.load_samples(None, [[case]], ksize=31, memory=1e6)
+    controls = kevlar.novel.load_samples(
+        None, [[c] for c in ctrls], ksize=31, memory=1e6
+    )
+
+    expected, pools, scanners = list(), list(), list()
+    for casemin in (6, 8):
+        scanfunc, scanargs = kevlar.novel.scan_settings(
+            cases, controls, casemin=casemin, ctrlmax=0
+        )
+        expected.append([r for _, r in kevlar.novel.scan_reads(
+            screed.open(case), scanfunc, **scanargs
+        )])
+        pool = kevlar.novel.ScanPool(2, scanfunc, **scanargs)
+        pools.append(pool)
+        scanners.append(kevlar.novel.scan_reads(
+            screed.open(case), scanfunc, batchsize=50, pool=pool, **scanargs
+        ))
+    try:
+        # Interleave the two scans to make sure each pool keeps its settings.
+        observed = [list(), list()]
+        for first, second in zip(*scanners):
+            observed[0].append(first[1])
+            observed[1].append(second[1])
+    finally:
+        for pool in pools:
+            pool.close()
+    assert expected[0] != expected[1]
+    assert observed == expected
+
+
+@pytest.mark.parametrize('casemin,ctrlmax,screen', [
+    (5, 0, None),
+    (3, 1, None),
+    (5, 1, 2),
+    (2, 0, 4),
+])
+def test_scan_read_matches_kmer_is_interesting(casemin, ctrlmax, screen):
+    seq = 'GATTACACCGTGGTTACAGGATCGACTTGCATCGTACGATCGTAGCTAGCTGACTGTGC'
+    case1 = Counttable(13, 1e5, 4)
+    case2 = Counttable(13, 1e5, 4)
+    ctrl = Counttable(13, 1e5, 4)
+    for _ in range(4):
+        case1.consume(seq)
+        case2.consume(seq[:40])
+    case1.consume(seq[10:50])
+    case2.consume(seq[5:])
+    ctrl.consume(seq[20:45])
+    ctrl.consume(seq[30:45])
+
+    expected = list()
+    for i, kmer in enumerate(case1.get_kmers(seq)):
+        result = kevlar.novel.kmer_is_interesting(
+            kmer, [case1, case2], [ctrl], case_min=casemin, ctrl_max=ctrlmax,
+            screen_thresh=screen,
+        )
+        interesting, discard, caseab, ctrlab = result
+        if discard:
+            expected = list()
+            break
+        if interesting:
+            expected.append((kmer, i, caseab + ctrlab))
+
+    ikmers = kevlar.novel.scan_read(
+        seq, [case1, case2], [ctrl], casemin=casemin, ctrlmax=ctrlmax,
+        abundscreen=screen,
+    )
+    observed = [(k.sequence, k.offset, k.abund) for k in ikmers]
+    assert observed == expected
+
+
+def test_novel_compact_controls(capsys):
+    case = kevlar.tests.data_file('trio1/case1.fq')
+    ctrls = kevlar.tests.data_glob('trio1/ctrl[1,2].fq')
+    arglist = ['novel', '--ctrl-max', '0', '--case-min', '6',
+               '--compact-controls', '--case', case,
+               '--control', ctrls[0], '--control', ctrls[1]]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.novel.main(args)
+
+    out, err = capsys.readouterr()
+    assert out.strip() != ''
+    for line in out.split('\n'):
+        if not line.endswith('#'):
+            continue
+        abundmatch = re.search(r'(\d+) (\d+) (\d+)#$', line)
+        assert abundmatch, line
+        assert int(abundmatch.group(1)) >= 6
+        assert int(abundmatch.group(2)) == 0
+        assert int(abundmatch.group(3)) == 0
+
+
+def test_novel_multiband():
+    case = kevlar.tests.data_file('trio1/case1.fq')
+    ctrls = kevlar.tests.data_glob('trio1/ctrl[1,2].fq')
+    bandsketches = dict()
+    expected = dict()
+    for band in range(3):
+        cases = kevlar.novel.load_samples(
+            None, [[case]], ksize=31, memory=1e6, numbands=3, band=band
+        )
+        controls = kevlar.novel.load_samples(
+            None, [[c] for c in ctrls], ksize=31, memory=1e6, numbands=3,
+            band=band
+        )
+        bandsketches[band] = (cases, controls)
+        reads = kevlar.novel.novel(
+            screed.open(case), cases, controls, casemin=6, ctrlmax=0,
+            numbands=3, band=band
+        )
+        expected[band] = [(r.name, r.ikmers) for r in reads]
+
+    reads = kevlar.novel.novel_multiband(
+        screed.open(case), bandsketches, 3, casemin=6, ctrlmax=0,
+        numworkers=2, batchsize=50
+    )
+    reads = list(reads)
+    assert len(reads) > 0
+    for band in range(3):
+        observed = [(r.name, r.bandikmers[band]) for r in reads
+                    if band in r.bandikmers]
+        assert observed == expected[band]
+    for read in reads:
+        merged = [k for band in sorted(read.bandikmers)
+                  for k in read.bandikmers[band]]
+        assert read.ikmers == merged
+
+
+def test_band_abundances(tmpdir):
+    sequence = 'TTAACTCTAGATTAGGGGCGTGACTTAATAAGGTGTGGGCCTAAGCGTCT'
+    sketch = Counttable(19, 1e4, 4)
+    sketch.consume(sequence)
+    sketch.consume(sequence[:30])
+    mmfile = str(tmpdir.join('sketch.mmsketch'))
+    kevlar.sketch.save(sketch, mmfile)
+    mapped = kevlar.sketch.load(mmfile)
+
+    hashes = numpy.array(sketch.get_kmer_hashes(sequence), dtype=numpy.uint64)
+    indices = numpy.array([0, 3, 20, 31])
+    abunds = kevlar.novel.band_abundances(sequence, hashes, indices,
+                                          [sketch, mapped])
+    assert abunds.shape == (2, 4)
+    assert abunds.tolist() == [[2, 2, 1, 1], [2, 2, 1, 1]]
+    empty = kevlar.novel.band_abundances(sequence, hashes, indices, [])
+    assert empty.shape == (0, 4)
+
+
+def test_novel_all_bands_cli(capsys):
+    case = kevlar.tests.data_file('trio1/case1.fq')
+    ctrls = kevlar.tests.data_glob('trio1/ctrl[1,2].fq')
+    tempdir = mkdtemp()
+    outpattern = os.path.join(tempdir, 'novel.band{band}.augfastq')
+    arglist = ['novel', '--ctrl-max', '0', '--case-min', '6',
+               '--num-bands', '2', '--all-bands', '--case', case,
+               '--control', ctrls[0], '--control', ctrls[1],
+               '--out', outpattern]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.novel.main(args)
+    bandfiles = [outpattern.format(band=b) for b in (1, 2)]
+    bandreads = [list(kevlar.parse_augmented_fastx(kevlar.open(f, 'r')))
+                 for f in bandfiles]
+    rmtree(tempdir)
+
+    arglist = ['novel', '--ctrl-max', '0', '--case-min', '6',
+               '--num-bands', '2', '--band', '2', '--case', case,
+               '--control', ctrls[0], '--control', ctrls[1]]
+    args = kevlar.cli.parser().parse_args(arglist)
+    kevlar.novel.main(args)
+    out, err = capsys.readouterr()
+    assert len(bandreads[1]) > 0
+    assert out.count('#\n') == sum(len(r.ikmers) for r in bandreads[1])
+
+    arglist = ['novel', '--num-bands', '2', '--band', '1', '--bands', '2',
+               '--case', case]
+    args = kevlar.cli.parser().parse_args(arglist)
+    with pytest.raises(ValueError) as ve:
+        kevlar.novel.main(args)
+    assert 'Cannot combine --band with --bands' in str(ve)
+
+
+def test_scan_cache():
+    cache = kevlar.novel.ScanCache(maxsize=2)
+    assert cache.get('ACGT') is None
+    cache.put('ACGT', [])
+    cache.put('GATTACA', ['bogus'])
+    assert cache.get('ACGT') == []
+    cache.put('TTTT', [])
+    assert cache.get('GATTACA') is None
+    assert cache.get('TTTT') == []
+    assert cache.get('ACGT') == []
+    assert len(cache) == 2
+    assert cache.hits == 3
+    assert cache.misses == 2
+
+
+@pytest.mark.parametrize('numworkers', [1, 2])
+def test_novel_read_cache(numworkers):
+    case = kevlar.tests.data_file('trio1/case1.fq')
+    ctrls = kevlar.tests.data_glob('trio1/ctrl[1,2].fq')
+    cases = kevlar.novel.load_samples(None, [[case]], ksize=31, memory=1e6)
+    controls = kevlar.novel.load_samples(
+        None, [[c] for c in ctrls], ksize=31, memory=1e6
+    )
+
+    # Every read appears twice, so the second copy should hit the cache.
+    records = list(screed.open(case))
+    duplicated = [r for record in records for r in (record, record)]
+    log = StringIO()
+    expected = kevlar.novel.novel(
+        iter(duplicated), cases, controls, casemin=6, ctrlmax=0,
+        logstream=log
+    )
+    expected = [(r.name, r.ikmers) for r in expected]
+    assert 'read cache' not in log.getvalue()
+
+    log = StringIO()
+    observed = kevlar.novel.novel(
+        iter(duplicated), cases, controls, casemin=6, ctrlmax=0,
+        cachesize=1000, numworkers=numworkers, batchsize=1, logstream=log
+    )
+    observed = [(r.name, r.ikmers) for r in observed]
+    assert len(expected) > 0
+    assert observed == expected
+    hits = re.search(r'read cache (\d+) hits', log.getvalue())
+    assert int(hits.group(1)) > 0
+
+
+@pytest.mark.parametrize('exact', [True, False])
+def test_distinct_kmer_counter(exact):
+    counter = kevlar.novel.DistinctKmerCounter(exact=exact)
+    assert counter.count() == 0
+    seq = 'GATTACACCGTGGTTACAGGATCGACTTGCATCGTACGATCGTAGCTAGCTGACTGTGC'
+    distinct = set()
+    for i in range(len(seq) - 13 + 1):
+        kmer = seq[i:i+13]
+        counter.add(kmer)
+        counter.add(kevlar.revcom(kmer))
+        distinct.add(kevlar.revcommin(kmer))
+    count = counter.count()
+    assert abs(count - len(distinct)) <= (0 if exact else 2)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import gzip
+import os
+import pysam
+import pytest
+import screed
+import kevlar
+from kevlar.tests import data_file
+
+
+def test_read_gzip():
+    infile = data_file('simple-genome-case-reads.fa.gz')
+    with gzip.open(infile, 'rt') as instream:
+        expected = instream.read()
+    with kevlar.pipeio.open(infile, 'r') as instream:
+        observed = instream.read()
+    assert observed == expected
+
+
+def test_read_gzip_multi_member(tempdir):
+    filename = os.path.join(tempdir, 'multi.txt.gz')
+    with open(filename, 'wb') as outstream:
+        for i in range(5):
+            outstream.write(gzip.compress('member {:d}\n'.format(i).encode()))
+    with kevlar.open(filename, 'r') as instream:
+        lines = instream.read().strip().split('\n')
+    assert lines == ['member {:d}'.format(i) for i in range(5)]
+
+
+def test_read_bgzf(tempdir):
+    infile = data_file('simple-genome-case-reads.fa.gz')
+    with gzip.open(infile, 'rb') as instream:
+        data = instream.read() * 10
+    filename = os.path.join(tempdir, 'reads.fa.gz')
+    with pysam.BGZFile(filename, 'wb') as outstream:
+        outstream.write(data)
+    with kevlar.pipeio.open(filename, 'rb', threads=3) as instream:
+        assert instream.read() == data
+    with kevlar.pipeio.open(filename, 'r', threads=3) as instream:
+        assert instream.readline().startswith('>')
+
+
+def test_read_truncated(tempdir):
+    infile = data_file('simple-genome-case-reads.fa.gz')
+    with open(infile, 'rb') as instream:
+        data = instream.read()
+    filename = os.path.join(tempdir, 'truncated.fa.gz')
+    with open(filename, 'wb') as outstream:
+        outstream.write(data[:len(data) // 2])
+    with pytest.raises(EOFError):
+        with kevlar.open(filename, 'r') as instream:
+            instream.read()
+
+
+def test_read_close_early():
+    infile = data_file('simple-genome-case-reads.fa.gz')
+    instream = kevlar.open(infile, 'r')
+    assert instream.readline().startswith('>')
+    instream.close()
+    assert instream.closed
+
+
+def test_write_gzip(tempdir):
+    filename = os.path.join(tempdir, 'out.txt.gz')
+    lines = ['line {:d}'.format(i) for i in range(100000)]
+    with kevlar.open(filename, 'w') as outstream:
+        for line in lines:
+            print(line, file=outstream)
+    with gzip.open(filename, 'rt') as instream:
+        assert instream.read().strip().split('\n') == lines
+
+
+def test_multi_file_iter_screed_gzip():
+    infile = data_file('simple-genome-case-reads.fa.gz')
+    expected = [(r.name, r.sequence) for r in screed.open(infile)]
+    records = kevlar.multi_file_iter_screed([infile, infile])
+    observed = [(r.name, r.sequence) for r in records]
+    assert observed == expected * 2
+
+
+def test_open_bad_mode():
+    with pytest.raises(ValueError) as ve:
+        kevlar.pipeio.open('bogus.gz', 'a')
+    assert 'invalid mode' in str(ve)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import numpy
+import pytest
+import screed
+import khmer
+import kevlar
+from kevlar.prefilter import CandidatePrefilter
+from kevlar.union import KevlarSketchMismatchError
+from kevlar.tests import data_file, data_glob
+
+
+@pytest.mark.parametrize('casemin,ctrlmax', [(5, 0), (6, 1), (3, 0)])
+def test_prefilter_exact(casemin, ctrlmax):
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    cases = kevlar.novel.load_samples(None, [[case]], ksize=31, memory=1e6)
+    controls = kevlar.novel.load_samples(
+        None, [[c] for c in ctrls], ksize=31, memory=1e6
+    )
+    prefilter = CandidatePrefilter.build(cases, controls, casemin=casemin,
+                                         ctrlmax=ctrlmax)
+
+    ncandidates = 0
+    for record in screed.open(case):
+        caseabunds, ctrlabunds = kevlar.novel.kmer_abundances(
+            record.sequence, cases, controls
+        )
+        interesting, discard = kevlar.novel.interesting_kmer_mask(
+            caseabunds, ctrlabunds, case_min=casemin, ctrl_max=ctrlmax
+        )
+        candidates = prefilter.candidates(record.sequence)
+        assert numpy.array_equal(candidates, interesting)
+        ncandidates += candidates.sum()
+    assert ncandidates > 0
+
+
+def test_prefilter_mixed_storage():
+    # Sketches with different bin storage can be combined as long as their
+    # table sizes are identical.
+    seq = 'GATTACACCGTGGTTACAGGATCGACTTGCATCGTACGATCGTAGCTAGCTGACTGTGC'
+    case = khmer.SmallCounttable(13, 1e5, 4)
+    ctrl = khmer.Nodetable(13, 1e5, 4)
+    for _ in range(5):
+        case.consume(seq)
+    ctrl.consume(seq[:30])
+    prefilter = CandidatePrefilter.build([case], [ctrl], casemin=5, ctrlmax=0)
+    candidates = prefilter.candidates(seq)
+    assert list(numpy.flatnonzero(candidates)) == list(range(18, 47))
+
+
+def test_prefilter_compact_controls():
+    # With the sizes used by `kevlar novel --compact-controls`, the control
+    # tables have more bins than the case tables.
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    cases = kevlar.novel.load_samples(None, [[case]], ksize=31, memory=1e6)
+    controls = kevlar.novel.load_samples(
+        None, [[c] for c in ctrls], ksize=31, memory=1e6, ceiling=1
+    )
+    assert controls[0].hashsizes() != cases[0].hashsizes()
+    with pytest.raises(KevlarSketchMismatchError):
+        CandidatePrefilter.build(cases, controls, casemin=6, ctrlmax=0)
+
+
+@pytest.mark.parametrize('option', ['--compact-controls', '--auto-size'])
+def test_novel_prefilter_incompatible(option):
+    arglist = ['novel', '--prefilter', option, '--case', 'bogus.fq',
+               '--control', 'bogus.fq']
+    args = kevlar.cli.parser().parse_args(arglist)
+    with pytest.raises(ValueError) as ve:
+        kevlar.novel.main(args)
+    assert 'Cannot combine --prefilter with --compact-controls' in str(ve)
+
+
+def test_prefilter_mismatch():
+    case = khmer.Counttable(13, 1e5, 4)
+    ctrl = khmer.Counttable(13, 1e4, 4)
+    with pytest.raises(KevlarSketchMismatchError) as mme:
+        CandidatePrefilter.build([case], [ctrl])
+    assert 'different table sizes' in str(mme)
+
+
+def test_novel_prefilter(capsys):
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    outputs = list()
+    for extra in ([], ['--prefilter']):
+        arglist = ['novel', '--ctrl-max', '0', '--case-min', '6',
+                   '--case', case, '--control', ctrls[0],
+                   '--control', ctrls[1]] + extra
+        args = kevlar.cli.parser().parse_args(arglist)
+        kevlar.novel.main(args)
+        out, err = capsys.readouterr()
+        outputs.append(out)
+    assert outputs[0].strip() != ''
+    assert outputs[0] == outputs[1]
+    assert '[kevlar::prefilter] candidate prefilter built' in err
@@ -7,14 +7,17 @@
 # licensed under the MIT license: see LICENSE.
 # -----------------------------------------------------------------------------
 
+from io import StringIO
 import pytest
 import kevlar
 from kevlar import KmerOfInterest
 from kevlar.seqio import AnnotatedReadSet as ReadSet
-from kevlar.seqio import KevlarPartitionLabelError
+from kevlar.seqio import KevlarPartitionLabelError, KevlarReadIndexError
 import khmer
+import os
 import screed
 import shutil
+from tempfile import mkdtemp
 
 
 @pytest.fixture
@@ -155,3 +158,66 @@ def test_ikmer_abund_after_recalc():
     rs.validate(minabund=8)
     assert rs.valid == (1, 1)
     assert read.ikmers[0].abund[0] == 10
+
+
+def indexed_read(name, readindex, kmers):
+    sequence = 'AAGCAGGGGTCTACATTGTCCTCGGGACTCGAGATTTCTTCGCTGT'
+    ikmers = [KmerOfInterest(sequence[o:o + 17], o, [10, 0, 0])
+              for o in kmers]
+    record = screed.Record(name=name, sequence=sequence, ikmers=ikmers)
+    record.readindex = readindex
+    return record
+
+
+def write_indexed_reads(filename, records):
+    with open(filename, 'w') as outstream:
+        for record in records:
+            kevlar.print_augmented_fastx(record, outstream)
+
+
+def test_read_index_roundtrip():
+    out = StringIO()
+    kevlar.print_augmented_fastx(indexed_read('read1', 42, [3]), out)
+    assert '#readindex=42\n' in out.getvalue()
+    record = next(kevlar.parse_augmented_fastx(StringIO(out.getvalue())))
+    assert record.readindex == 42
+    assert len(record.ikmers) == 1
+
+
+def test_group_augmented_fastx():
+    tempdir = mkdtemp()
+    filenames = [os.path.join(tempdir, f) for f in ('1.txt', '2.txt')]
+    try:
+        write_indexed_reads(filenames[0], [
+            indexed_read('read1', 1, [0]), indexed_read('read4', 4, [1]),
+        ])
+        write_indexed_reads(filenames[1], [
+            indexed_read('read2', 2, [2]), indexed_read('read4', 4, [3]),
+            indexed_read('read7', 7, [4]),
+        ])
+        groups = list(kevlar.seqio.group_augmented_fastx(filenames))
+        assert [len(g) for g in groups] == [1, 1, 2, 1]
+        assert [g[0].name for g in groups] == [
+            'read1', 'read2', 'read4', 'read7'
+        ]
+
+        write_indexed_reads(filenames[1], [indexed_read('read3', 4, [3])])
+        with pytest.raises(KevlarReadIndexError) as rie:
+            list(kevlar.seqio.group_augmented_fastx(filenames))
+        assert 'have the same read index 4' in str(rie)
+
+        write_indexed_reads(filenames[1], [
+            indexed_read('read7', 7, [4]), indexed_read('read2', 2, [2]),
+        ])
+        with pytest.raises(KevlarReadIndexError) as rie:
+            list(kevlar.seqio.group_augmented_fastx(filenames))
+        assert 'not sorted by read index' in str(rie)
+
+        record = indexed_read('read2', 2, [2])
+        record.readindex = None
+        write_indexed_reads(filenames[1], [record])
+        with pytest.raises(KevlarReadIndexError) as rie:
+            list(kevlar.seqio.group_augmented_fastx(filenames))
+        assert 'has no read index' in str(rie)
+    finally:
+        shutil.rmtree(tempdir)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+from io import StringIO
+import os
+import pytest
+import threading
+import numpy
+import screed
+import kevlar
+from kevlar.serve import KevlarSketchServerError
+from kevlar.sketch import KevlarSketchMismatchError
+from kevlar.tests import data_file, data_glob
+
+
+@pytest.fixture
+def trioserver(tempdir):
+    case = data_file('trio1/case1.fq')
+    ctrls = data_glob('trio1/ctrl[1,2].fq')
+    sketchfiles = dict()
+    for name, infile in zip(('case', 'ctrl1', 'ctrl2'), [case] + ctrls):
+        outfile = os.path.join(tempdir, name + '.counttable')
+        kevlar.count.load_sample_seqfile([infile], 31, 1e6, outfile=outfile,
+                                         logfile=StringIO())
+        sketchfiles[name] = outfile
+    socketpath = os.path.join(tempdir, 'kevlar.sock')
+    server = kevlar.serve.load_server(socketpath, sketchfiles,
+                                      logstream=StringIO())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socketpath, sketchfiles
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_sketch(trioserver):
+    socketpath, sketchfiles = trioserver
+    local = kevlar.sketch.load(sketchfiles['case'])
+    remote = kevlar.sketch.load('serve:{:s}:case'.format(socketpath))
+    assert isinstance(remote, kevlar.serve.RemoteSketch)
+    assert remote.ksize() == local.ksize()
+    assert remote.hashsizes() == local.hashsizes()
+    assert remote.n_occupied() == local.n_occupied()
+    assert remote.fpr == pytest.approx(kevlar.sketch.estimate_fpr(local))
+
+    sequences = [r.sequence for r in screed.open(data_file('trio1/case1.fq'))]
+    sequences = sequences[:50]
+    expected = [local.get_kmer_counts(seq) for seq in sequences]
+    assert remote.query(sequences) == expected
+    assert remote.get_kmer_counts(sequences[0]) == expected[0]
+    hashes = remote.get_kmer_hashes(sequences[0])
+    assert remote.lookup(hashes).tolist() == expected[0]
+    kmer = sequences[0][:31]
+    assert remote.get(kmer) == local.get(kmer)
+
+
+def test_remote_novel(trioserver):
+    socketpath, sketchfiles = trioserver
+    case = data_file('trio1/case1.fq')
+    remote = ['serve:{:s}:{:s}'.format(socketpath, name)
+              for name in ('case', 'ctrl1', 'ctrl2')]
+    local = [sketchfiles[name] for name in ('case', 'ctrl1', 'ctrl2')]
+
+    results = list()
+    for sketches in (local, remote):
+        cases = kevlar.novel.load_samples(sketches[:1], logstream=StringIO())
+        controls = kevlar.novel.load_samples(sketches[1:],
+                                             logstream=StringIO())
+        reads = kevlar.novel.novel(
+            screed.open(case), cases, controls, casemin=6, ctrlmax=0,
+            numworkers=2, batchsize=50, logstream=StringIO()
+        )
+        results.append([(r.name, r.ikmers) for r in reads])
+    assert len(results[0]) > 0
+    assert results[0] == results[1]
+
+
+def test_remote_errors(trioserver):
+    socketpath, sketchfiles = trioserver
+    with pytest.raises(KevlarSketchServerError) as e:
+        kevlar.sketch.load('serve:{:s}:bogus'.format(socketpath))
+    assert 'no sketch named bogus' in str(e)
+
+    with pytest.raises(KevlarSketchServerError) as e:
+        kevlar.sketch.load('serve:nosocketname')
+    assert 'serve:SOCKET:NAME' in str(e)
+
+    remote = kevlar.sketch.load('serve:{:s}:case'.format(socketpath))
+    with pytest.raises(KevlarSketchServerError) as e:
+        remote.request({'op': 'bogus'})
+    assert 'unknown request bogus' in str(e)
+
+
+def test_remote_saturated_zsketch(tempdir):
+    sketchfile = os.path.join(tempdir, 'case.zsketch')
+    sketch = kevlar.sketch.allocate(31, 1000, count=True)
+    sketch.consume_seqfile(data_file('trio1/case1.fq'))
+    fpr = kevlar.sketch.estimate_fpr(sketch)
+    assert fpr > 0.5
+    kevlar.sketch.save(sketch, sketchfile)
+
+    socketpath = os.path.join(tempdir, 'kevlar.sock')
+    server = kevlar.serve.load_server(socketpath, {'case': sketchfile},
+                                      logstream=StringIO())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        spec = 'serve:{:s}:case'.format(socketpath)
+        remote = kevlar.sketch.load(spec)
+        assert kevlar.sketch.cached_fpr(remote, spec) == pytest.approx(fpr)
+        with pytest.raises(kevlar.sketch.KevlarUnsuitableFPRError):
+            kevlar.sketch.load_sketchfiles([spec], maxfpr=0.2,
+                                           logfile=StringIO())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_parse_sketch_args():
+    sketchfiles = kevlar.serve.parse_sketch_args(
+        ['proband=a/b/c.counttable', 'dir/father.ct']
+    )
+    assert sketchfiles == {'proband': 'a/b/c.counttable',
+                           'father': 'dir/father.ct'}
+    with pytest.raises(KevlarSketchServerError):
+        kevlar.serve.parse_sketch_args(['x=a.ct', 'x=b.ct'])
+
+
+def test_serve_main(tempdir):
+    sketchfile = os.path.join(tempdir, 'case.counttable')
+    kevlar.count.load_sample_seqfile(
+        [data_file('trio1/case1.fq')], 31, 1e6, outfile=sketchfile,
+        logfile=StringIO()
+    )
+    socketpath = os.path.join(tempdir, 'kevlar.sock')
+    args = kevlar.cli.parser().parse_args(
+        ['serve', '--socket', socketpath, sketchfile]
+    )
+    args.logfile = StringIO()
+    thread = threading.Thread(target=kevlar.serve.main, args=(args, ))
+    thread.start()
+    for _ in range(100):
+        if os.path.exists(socketpath):
+            break
+        thread.join(timeout=0.05)
+    remote = kevlar.serve.RemoteSketch(socketpath, 'case')
+    assert remote.request({'op': 'shutdown'}) == {'ok': True}
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert not os.path.exists(socketpath)
+    assert 'serving 1 sketch(es)' in args.logfile.getvalue()
+
+
+@pytest.mark.parametrize('numworkers', [1, 2])
+def test_remote_novel_batched(numworkers, trioserver, monkeypatch):
+    socketpath, sketchfiles = trioserver
+    sketches = ['serve:{:s}:{:s}'.format(socketpath, name)
+                for name in ('case', 'ctrl1', 'ctrl2')]
+    cases = kevlar.novel.load_samples(sketches[:1], logstream=StringIO())
+    controls = kevlar.novel.load_samples(sketches[1:], logstream=StringIO())
+
+    # Count the requests answered by the server, including those sent by
+    # worker processes.
+    requests = list()
+    respond = kevlar.serve.SketchServer.respond
+
+    def counting_respond(self, request):
+        requests.append(request['op'])
+        return respond(self, request)
+    monkeypatch.setattr(kevlar.serve.SketchServer, 'respond',
+                        counting_respond)
+
+    records = list(screed.open(data_file('trio1/case1.fq')))[:200]
+    numreads = len(list(kevlar.novel.candidate_reads(iter(records), 31)))
+    reads = kevlar.novel.novel(
+        iter(records), cases, controls, casemin=6, ctrlmax=0,
+        numworkers=numworkers, batchsize=50, logstream=StringIO()
+    )
+    assert len(list(reads)) > 0
+    # One request per sketch per batch of reads, rather than per read
+    numbatches = (numreads + 49) // 50
+    assert requests == ['counts'] * 3 * numbatches
+
+
+def test_remote_check_compatible(tempdir):
+    infile = data_file('trio1/case1.fq')
+    sketchfiles = dict()
+    for ksize in (25, 31):
+        outfile = os.path.join(tempdir, 'k{:d}.counttable'.format(ksize))
+        kevlar.count.load_sample_seqfile([infile], ksize, 1e5, numbands=2,
+                                         band=0, outfile=outfile,
+                                         logfile=StringIO())
+        sketchfiles['k{:d}'.format(ksize)] = outfile
+    socketpath = os.path.join(tempdir, 'kevlar.sock')
+    server = kevlar.serve.load_server(socketpath, sketchfiles,
+                                      logstream=StringIO())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        remote = 'serve:{:s}:k31'.format(socketpath)
+        kevlar.sketch.check_compatible([remote], band=0, numbands=2)
+        with pytest.raises(KevlarSketchMismatchError) as sme:
+            kevlar.sketch.check_compatible([remote], band=1, numbands=2)
+        assert 'was computed for band 1/2, expected band 2/2' in str(sme)
+        with pytest.raises(KevlarSketchMismatchError) as sme:
+            kevlar.sketch.check_compatible([sketchfiles['k25'], remote])
+        assert 'k-mer size of sketch "{:s}" (31)'.format(remote) in str(sme)
+
+        sketch = kevlar.serve.RemoteSketch.connect(remote)
+        kmerhash = sketch.get_kmer_hashes('ACGT' * 10)[0]
+        assert sketch.get(numpy.uint64(kmerhash)) == sketch.get(kmerhash)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -7,7 +7,10 @@
 # licensed under the MIT license: see LICENSE.
 # -----------------------------------------------------------------------------
 
+import os
 import pytest
+from shutil import rmtree
+from tempfile import mkdtemp
 import khmer
 import kevlar
 from kevlar.tests import data_file, data_glob
@@ -97,3 +100,119 @@ def test_load_sketches_fpr_fail():
     with pytest.raises(kevlar.sketch.KevlarUnsuitableFPRError) as e:
         sketches = kevlar.sketch.load_sketchfiles(infiles, maxfpr=0.001)
     assert 'FPR too high, bailing out!!!' in str(e)
+
+
+@pytest.mark.parametrize('ceiling,sketchtype,maxcount', [
+    (None, khmer.Counttable, 20),
+    (1, khmer.Nodetable, 1),
+    (2, khmer.SmallCounttable, 15),
+    (15, khmer.SmallCounttable, 15),
+    (16, khmer.Counttable, 20),
+])
+def test_allocate_ceiling(ceiling, sketchtype, maxcount):
+    sketch = kevlar.sketch.allocate(21, 1e4, 4, count=True, ceiling=ceiling)
+    assert type(sketch) is sketchtype
+    kmer = 'GCATAGTGTCTCTGCTGCGCA'
+    for _ in range(20):
+        sketch.add(kmer)
+    assert sketch.get(kmer) == maxcount
+
+
+def test_autoload_ceiling():
+    infile = data_file('simple-genome-case-reads.fa.gz')
+    sketch = kevlar.sketch.autoload(infile, ksize=25, table_size=1e7,
+                                    ceiling=1)
+    assert type(sketch) is khmer.Nodetable
+    assert sketch.get('AGCTCAGACACTGGCGGTCTCTCCT') == 1
+
+
+@pytest.mark.parametrize('numbands', [2, 3, 8])
+def test_hash_bands(numbands):
+    infile = data_file('bogus-genome/refr.fa')
+    ct = khmer.Counttable(21, 1e5, 4)
+    kmers = [kmer for record in kevlar.seqio.parse_fasta(open(infile, 'r'))
+             for kmer in ct.get_kmers(record[1])]
+    hashes = [ct.hash(kmer) for kmer in kmers]
+    bands = kevlar.sketch.hash_bands(hashes, numbands)
+    assert set(bands) == set(range(numbands))
+    for band in range(numbands):
+        banded = khmer.Counttable(21, 1e5, 4)
+        banded.consume_seqfile_banding(infile, numbands, band)
+        counted = [banded.get(kmer) > 0 for kmer in kmers]
+        inband = [c for c, b in zip(counted, bands) if b == band]
+        outband = [c for c, b in zip(counted, bands) if b != band]
+        assert all(inband)
+        assert sum(outband) < 0.01 * len(outband)
+
+
+def test_choose_size():
+    # Plenty of memory: smallest sketch achieving the target FPR.
+    tablesize, numtables, fpr = kevlar.sketch.choose_size(1e5, 1e8,
+                                                          targetfpr=0.05)
+    assert fpr <= 0.05
+    assert 4 <= numtables <= 5
+    assert tablesize * numtables < 1e6
+
+    # Not enough memory: entire budget is used, best effort FPR.
+    tablesize, numtables, fpr = kevlar.sketch.choose_size(1e6, 1e6,
+                                                          targetfpr=0.05)
+    assert fpr > 0.05
+    assert tablesize * numtables <= 1e6
+    assert tablesize * numtables > 0.99e6
+    assert numtables == 1
+
+    # More bins per byte, lower FPR for the same budget.
+    _, _, nibblefpr = kevlar.sketch.choose_size(1e6, 1e6, bucketsperbyte=2,
+                                                targetfpr=0.05)
+    assert nibblefpr < fpr
+
+
+@pytest.mark.parametrize('ceiling', [None, 1, 10])
+def test_running_fpr(ceiling):
+    sketch = kevlar.sketch.allocate(21, 5e5, 4, ceiling=ceiling)
+    sketch.consume_seqfile(data_file('bogus-genome/refr.fa'))
+    sketch.consume_seqfile(data_file('trio1/case1.fq'))
+    fpr = kevlar.sketch.estimate_fpr(sketch)
+    assert fpr > 0.0
+    estimate = kevlar.sketch.running_fpr(sketch, nbins=100000)
+    assert estimate == pytest.approx(fpr, rel=0.25)
+    lowerbound = kevlar.sketch.running_fpr(sketch, nbins=100000, margin=3.0)
+    assert lowerbound < estimate
+
+    # Small tables are scanned in their entirety.
+    sketch = kevlar.sketch.allocate(21, 1000, 4, ceiling=ceiling)
+    sketch.consume_seqfile(data_file('bogus-genome/refr.fa'))
+    estimate = kevlar.sketch.running_fpr(sketch, margin=3.0)
+    assert estimate == pytest.approx(kevlar.sketch.estimate_fpr(sketch))
+
+
+def test_sketch_metadata():
+    tempdir = mkdtemp()
+    sketch = kevlar.sketch.allocate(21, 5000, 4, count=True)
+    sketch.consume_seqfile(data_file('bogus-genome/refr.fa'))
+    fpr = kevlar.sketch.estimate_fpr(sketch)
+    filename = os.path.join(tempdir, 'refr')
+    filename = kevlar.sketch.save(sketch, filename)
+    assert filename.endswith('.counttable')
+
+    metadata = kevlar.sketch.load_metadata(filename)
+    assert metadata['fpr'] == pytest.approx(fpr)
+    assert metadata['ksize'] == 21
+    assert metadata['sketchtype'] == 'Counttable'
+    loaded = kevlar.sketch.load(filename)
+    assert kevlar.sketch.cached_fpr(loaded, filename) == metadata['fpr']
+
+    # Precomputed FPR is stored verbatim.
+    kevlar.sketch.save(sketch, filename, fpr=0.125)
+    assert kevlar.sketch.cached_fpr(loaded, filename) == 0.125
+    mmfile = kevlar.sketch.save(sketch, filename + '.mmsketch', fpr=0.125)
+    assert kevlar.sketch.load_metadata(mmfile)['fpr'] == 0.125
+
+    # Stale metadata are ignored.
+    sketch.consume('ACGTACGTACGTACGTACGTACGTACGT')
+    sketch.save(filename)
+    with open(filename, 'ab') as fh:
+        fh.write(b'\0')
+    assert kevlar.sketch.load_metadata(filename) is None
+    assert kevlar.sketch.load_metadata(data_file('test.counttable')) is None
+    rmtree(tempdir)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import pytest
+from shutil import copyfile
+import kevlar
+from kevlar.sketch import KevlarSketchMismatchError
+from kevlar.tests import data_file
+
+
+def count(outfile, infile, ksize=21, band=None):
+    arglist = ['count', '--ksize', str(ksize), '--memory', '1M']
+    if band:
+        arglist += ['--num-bands', '4', '--band', str(band)]
+    args = kevlar.cli.parser().parse_args(arglist + [outfile, infile])
+    kevlar.count.main(args)
+    return outfile
+
+
+@pytest.mark.parametrize('ext', ['.mmsketch', '.counttable'])
+def test_sketch_info(ext, tempdir, capsys):
+    infile = data_file('bogus-genome/refr.fa')
+    outfile = count(os.path.join(tempdir, 'refr' + ext), infile, band=2)
+    with open(infile, 'rb') as fh:
+        md5 = hashlib.md5(fh.read()).hexdigest()
+
+    info = kevlar.sketchinfo.sketch_info(outfile)
+    assert info['sketchtype'] == 'Counttable'
+    assert info['ksize'] == 21
+    assert (info['band'], info['numbands']) == (2, 4)
+    assert info['inputs'] == [
+        {'filename': infile, 'size': os.path.getsize(infile), 'md5': md5}
+    ]
+
+    args = kevlar.cli.parser().parse_args(['sketch-info', outfile])
+    kevlar.sketchinfo.main(args)
+    out, err = capsys.readouterr()
+    assert 'k-mer size: 21' in out
+    assert 'band: 2/4' in out
+    assert md5 in out
+
+    args = kevlar.cli.parser().parse_args(['sketch-info', '--json', outfile])
+    kevlar.sketchinfo.main(args)
+    out, err = capsys.readouterr()
+    assert json.loads(out)[0]['tablesizes'] == info['tablesizes']
+
+
+def test_sketch_info_no_metadata(capsys):
+    args = kevlar.cli.parser().parse_args(
+        ['sketch-info', data_file('test.nodetable')]
+    )
+    kevlar.sketchinfo.main(args)
+    out, err = capsys.readouterr()
+    assert 'sketch type: Nodetable' in out
+    assert 'no metadata available' in out
+
+
+def test_load_by_contents(tempdir):
+    infile = data_file('bogus-genome/refr.fa')
+    outfile = count(os.path.join(tempdir, 'refr.mmsketch'), infile)
+    renamed = os.path.join(tempdir, 'refr.ct')
+    copyfile(outfile, renamed)
+    sketch = kevlar.sketch.load(renamed)
+    assert isinstance(sketch, kevlar.mmsketch.MappedSketch)
+
+
+def test_check_compatible(tempdir):
+    infile = data_file('bogus-genome/refr.fa')
+    k21 = count(os.path.join(tempdir, 'k21.mmsketch'), infile)
+    k23 = count(os.path.join(tempdir, 'k23.mmsketch'), infile, ksize=23)
+    kevlar.sketch.check_compatible([k21, data_file('test.counttable')])
+    with pytest.raises(KevlarSketchMismatchError) as e:
+        kevlar.sketch.check_compatible([k21, k23])
+    assert 'does not match' in str(e)
+
+    band1 = count(os.path.join(tempdir, 'band1.mmsketch'), infile, band=1)
+    kevlar.sketch.check_compatible([band1], band=0, numbands=4)
+    with pytest.raises(KevlarSketchMismatchError) as e:
+        kevlar.sketch.check_compatible([band1], band=1, numbands=4)
+    assert 'computed for band 1/4, expected band 2/4' in str(e)
+
+    arglist = ['novel', '--case', infile, '--num-bands', '4', '--band', '3',
+               '--case-counts', band1, '--control-counts', band1]
+    args = kevlar.cli.parser().parse_args(arglist)
+    with pytest.raises(KevlarSketchMismatchError):
+        kevlar.novel.main(args)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import pytest
+from tempfile import NamedTemporaryFile
+import khmer
+import kevlar
+from kevlar.tests import data_file
+
+
+@pytest.fixture
+def controls():
+    ctrl1 = khmer.Counttable(21, 1e4, 4)
+    ctrl2 = khmer.Counttable(21, 1e4, 4)
+    seq1 = 'GATTACAGATTACAGATTACAGATTACAGATTACAGATTACAGATTACA'
+    seq2 = 'CCTGATATCCGGAATCTTAGCGGCACTTCGTGCGATGCCGTGCGTGATA'
+    for _ in range(3):
+        ctrl1.consume(seq2)
+    ctrl2.consume(seq2)
+    for _ in range(5):
+        ctrl2.consume(seq1)
+    return ctrl1, ctrl2
+
+
+@pytest.mark.parametrize('ctrlmax', [0, 1, 3, 10])
+def test_union_basic(ctrlmax, controls):
+    ctrl1, ctrl2 = controls
+    combined = kevlar.union.union([ctrl1, ctrl2], ctrlmax=ctrlmax)
+    kmers = ctrl1.get_kmers('GATTACAGATTACAGATTACAGATTACA')
+    kmers += ctrl1.get_kmers('CCTGATATCCGGAATCTTAGCGGCACTTCGTGCG')
+    kmers += ['A' * 21, 'AC' * 10 + 'G']
+    for kmer in kmers:
+        expected = min(max(ctrl1.get(kmer), ctrl2.get(kmer)), ctrlmax + 1)
+        assert combined.get(kmer) >= expected
+        assert combined.get(kmer) <= ctrlmax + 1
+        if expected <= ctrlmax:
+            assert combined.get(kmer) == expected
+
+
+def test_union_mismatch():
+    ct1 = khmer.Counttable(21, 1e4, 4)
+    ct2 = khmer.Counttable(23, 1e4, 4)
+    ct3 = khmer.Counttable(21, 1e5, 4)
+    with pytest.raises(kevlar.union.KevlarSketchMismatchError) as e:
+        kevlar.union.union([ct1, ct2])
+    assert 'different k-mer sizes' in str(e)
+    with pytest.raises(kevlar.union.KevlarSketchMismatchError) as e:
+        kevlar.union.union([ct1, ct3])
+    assert 'different table sizes' in str(e)
+
+    nt = khmer.Nodetable(21, 1e4, 4)
+    with pytest.raises(kevlar.sketch.KevlarSketchTypeError) as e:
+        kevlar.union.union([ct1, nt])
+    assert 'can only combine Counttables or Countgraphs' in str(e)
+
+    with pytest.raises(ValueError) as e:
+        kevlar.union.union([])
+    assert 'no sketches to combine' in str(e)
+
+
+def test_union_cli(controls, capsys):
+    ctrl1, ctrl2 = controls
+    with NamedTemporaryFile(suffix='.ct') as ct1, \
+            NamedTemporaryFile(suffix='.ct') as ct2, \
+            NamedTemporaryFile(suffix='.ct') as out:
+        ctrl1.save(ct1.name)
+        ctrl2.save(ct2.name)
+        arglist = ['union', '--ctrl-max', '1', out.name, ct1.name, ct2.name]
+        args = kevlar.cli.parser().parse_args(arglist)
+        kevlar.union.main(args)
+        combined = kevlar.sketch.load(out.name)
+
+    kmer = 'GATTACAGATTACAGATTACA'
+    assert ctrl1.get(kmer) == 0
+    assert combined.get(kmer) == 2
+    out, err = capsys.readouterr()
+    assert 'control union saved to' in err
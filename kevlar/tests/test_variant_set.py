@@ -10,6 +10,7 @@
 import pytest
 import kevlar
 from kevlar import VariantSet
+from kevlar.kmercode import encode
 
 
 @pytest.fixture
@@ -27,9 +28,10 @@ def basicvset():
 def test_vset_kmers(basicvset):
     assert basicvset.nkmers == 2
     assert basicvset.nreads == 4
-    assert sorted(list(basicvset.kmers.keys())) == ['AAAAA', 'TAAAA']
-    assert basicvset.kmers['AAAAA'] == set(['read1', 'read2', 'read3'])
-    assert basicvset.kmers['TAAAA'] == set(['read4'])
+    codes = sorted(basicvset.kmers.keys())
+    assert [basicvset.kmer_sequence(c) for c in codes] == ['AAAAA', 'TAAAA']
+    assert basicvset.kmers[encode('AAAAA')] == set(['read1', 'read2', 'read3'])
+    assert basicvset.kmers[encode('TAAAA')] == set(['read4'])
 
 
 def test_vset_contigs(basicvset):
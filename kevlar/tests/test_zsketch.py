@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import os
+import numpy
+import pytest
+import screed
+import kevlar
+from kevlar.zsketch import KevlarCompressedSketchError
+from kevlar.tests import data_file
+
+
+@pytest.mark.parametrize('count,graph,smallcount', [
+    (True, False, False),
+    (True, False, True),
+    (False, False, False),
+    (True, True, False),
+    (False, True, False),
+])
+def test_zsketch_roundtrip(count, graph, smallcount, tempdir):
+    sketch = kevlar.sketch.allocate(21, 500000, 4, count=count, graph=graph,
+                                    smallcount=smallcount)
+    infile = data_file('bogus-genome/refr.fa')
+    sketch.consume_seqfile(infile)
+    sketch.consume_seqfile(infile)
+    filename = os.path.join(tempdir, 'test.zsketch')
+    assert kevlar.sketch.save(sketch, filename) == filename
+    rawsize = sum(len(t) for t in sketch.get_raw_tables())
+    assert os.path.getsize(filename) < rawsize
+
+    loaded = kevlar.sketch.load(filename)
+    assert type(loaded) is type(sketch)
+    assert loaded.ksize() == sketch.ksize()
+    assert loaded.hashsizes() == sketch.hashsizes()
+    for observed, expected in zip(loaded.get_raw_tables(),
+                                  sketch.get_raw_tables()):
+        assert numpy.array_equal(numpy.asarray(observed),
+                                 numpy.asarray(expected))
+    for record in screed.open(infile):
+        seq = record.sequence
+        assert loaded.get_kmer_counts(seq) == sketch.get_kmer_counts(seq)
+    assert kevlar.sketch.cached_fpr(loaded, filename) == \
+        pytest.approx(kevlar.sketch.estimate_fpr(sketch))
+
+
+def test_zsketch_small_blocks(tempdir):
+    sketch = kevlar.sketch.allocate(21, 50000, 4)
+    sketch.consume_seqfile(data_file('bogus-genome/refr.fa'))
+    filename = os.path.join(tempdir, 'test.zsketch')
+    kevlar.zsketch.save(sketch, filename, threads=2, blocksize=1000)
+    header, _ = kevlar.zsketch.read_header(filename)
+    assert header['blocksize'] == 1000
+    loaded = kevlar.zsketch.load(filename, threads=3)
+    for observed, expected in zip(loaded.get_raw_tables(),
+                                  sketch.get_raw_tables()):
+        assert numpy.array_equal(numpy.asarray(observed),
+                                 numpy.asarray(expected))
+
+    info = kevlar.sketchinfo.sketch_info(filename)
+    assert info['format'] == 'zsketch'
+    assert 'kevlar compressed sketch' in kevlar.sketchinfo.format_info(info)
+
+
+def test_zsketch_bad_file(tempdir):
+    filename = os.path.join(tempdir, 'bogus.zsketch')
+    with open(filename, 'w') as fh:
+        fh.write('not a sketch')
+    assert kevlar.zsketch.is_zsketch(filename) is False
+    with pytest.raises(KevlarCompressedSketchError):
+        kevlar.zsketch.load(filename)
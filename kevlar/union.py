@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+import sys
+import khmer
+import numpy
+import kevlar
+from kevlar.sketch import KevlarSketchTypeError, KevlarUnsuitableFPRError
+from kevlar.sketch import KevlarSketchMismatchError
+
+
+def union(sketches, ctrlmax=1, logstream=sys.stderr):
+    """
+    Combine several control sketches into a single "control union" sketch.
+
+    Each bin of the combined sketch holds the maximum value of that bin across
+    all of the input sketches, saturating at `ctrlmax + 1`. The minimum over
+    all tables is then an upper bound on the abundance of a k-mer in every
+    control sample, so that `kevlar novel` can test all controls with a single
+    lookup: a k-mer with an abundance of <= `ctrlmax` in the union has an
+    abundance of <= `ctrlmax` in each of the controls. The union has a higher
+    false positive rate than any of its inputs, so it can only make `kevlar
+    novel` more conservative.
+
+    The input sketches must all be Counttables (or all Countgraphs) with
+    identical k-mer size and table sizes. They are processed one at a time, so
+    `sketches` can be a generator that loads each sketch from disk on demand.
+    """
+    ceiling = min(ctrlmax + 1, 255)
+    combined = None
+    for n, sketch in enumerate(sketches, 1):
+        sketchtype = kevlar.sketch.sketch_type(sketch)
+        if sketchtype not in (khmer.Counttable, khmer.Countgraph):
+            message = 'can only combine Counttables or Countgraphs, not '
+            message += sketchtype.__name__
+            raise KevlarSketchTypeError(message)
+        if combined is None:
+            sizes = sketch.hashsizes()
+            combined = sketchtype(sketch.ksize(), sizes[0] + 1, len(sizes))
+            assert combined.hashsizes() == sizes
+            tables = [numpy.asarray(t) for t in combined.get_raw_tables()]
+        if sketchtype is not type(combined):
+            message = 'cannot combine sketches of different types'
+            raise KevlarSketchTypeError(message)
+        if sketch.ksize() != combined.ksize():
+            message = 'cannot combine sketches with different k-mer sizes'
+            raise KevlarSketchMismatchError(message)
+        if sketch.hashsizes() != combined.hashsizes():
+            message = 'cannot combine sketches with different table sizes'
+            raise KevlarSketchMismatchError(message)
+
+        for table, rawtable in zip(tables, sketch.get_raw_tables()):
+            numpy.maximum(table, numpy.asarray(rawtable), out=table)
+            numpy.minimum(table, ceiling, out=table)
+        message = 'combined {:d} control sketch(es)'.format(n)
+        print('[kevlar::union]    ', message, file=logstream)
+
+    if combined is None:
+        raise ValueError('no sketches to combine')
+    return combined
+
+
+def estimate_fpr(sketch):
+    """
+    Estimate the false positive rate of a combined sketch.
+
+    khmer's occupancy counter is not updated when table bins are modified
+    directly, so `kevlar.sketch.estimate_fpr` would report the occupancy of
+    the first input sketch. Instead, occupancy is computed from the raw tables.
+    """
+    sizes = sketch.hashsizes()
+    firsttable = numpy.asarray(sketch.get_raw_tables()[0])
+    occupancy = float(numpy.count_nonzero(firsttable))
+    fp_one = occupancy / min(sizes)
+    return fp_one ** len(sizes)
+
+
+def main(args):
+    timer = kevlar.Timer()
+    timer.start()
+
+    outfile = args.outfile
+    extensions = ('.ct', '.counttable', '.cg', '.countgraph',
+                  kevlar.mmsketch.EXTENSION, kevlar.zsketch.EXTENSION)
+    if not outfile.endswith(extensions):
+        outfile += '.counttable'
+
+    sketches = (kevlar.sketch.load(f) for f in args.sketches)
+    combined = union(sketches, ctrlmax=args.ctrl_max, logstream=args.logfile)
+    fpr = estimate_fpr(combined)
+    message = 'estimated false positive rate is {:1.3f}'.format(fpr)
+    if fpr > args.max_fpr:
+        message += ' (FPR too high, bailing out!!!)'
+        raise KevlarUnsuitableFPRError('[kevlar::union]     ' + message)
+    print('[kevlar::union]    ', message, file=args.logfile)
+    kevlar.sketch.save(combined, outfile, fpr=fpr)
+    message = 'control union saved to "{:s}"'.format(outfile)
+    print('[kevlar::union]    ', message, file=args.logfile)
+
+    total = timer.stop()
+    message = 'Total time: {:.2f} seconds'.format(total)
+    print('[kevlar::union]', message, file=args.logfile)
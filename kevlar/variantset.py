@@ -13,21 +13,31 @@ import kevlar
 
 
 class VariantSet(object):
+    """
+    Interesting k-mers, the reads containing them, and the assembled contigs.
+
+    K-mers are stored by canonical 2-bit code (see `kevlar.kmercode`); use
+    `kmer_sequence` to recover the sequence of a k-mer. Iterating over the
+    variant set yields k-mer sequences.
+    """
     def __init__(self):
-        self.contigs = defaultdict(set)  # contig -> set(kmers)
-        self.kmers = defaultdict(set)  # kmer -> set(read IDs)
+        self.contigs = defaultdict(set)  # contig -> set(kmer codes)
+        self.kmers = defaultdict(set)  # kmer code -> set(read IDs)
+        self.ksize = None
         self._kmer_instances = 0
         self._reads = 0
 
+    def kmer_sequence(self, kmercode):
+        return kevlar.kmercode.decode(kmercode, self.ksize)
+
     def add_kmer(self, kmer, read_id):
-        min_kmer = kevlar.revcommin(kmer)
-        self.kmers[min_kmer].add(read_id)
+        self.ksize = len(kmer)
+        self.kmers[kevlar.kmercode.canonical(kmer)].add(read_id)
         self._kmer_instances += 1
 
     def add_contig(self, contig, kmer):
         min_contig = kevlar.revcommin(contig)
-        min_kmer = kevlar.revcommin(kmer)
-        self.contigs[min_contig].add(min_kmer)
+        self.contigs[min_contig].add(kevlar.kmercode.canonical(kmer))
 
     def collapse(self):
         unique_contigs = set()
@@ -69,10 +79,11 @@ class VariantSet(object):
     def __iter__(self):
         for mincontig in sorted(self.contigs):
             maxcontig = kevlar.revcom(mincontig)
-            kmers = self.contigs[mincontig]
+            kmercodes = self.contigs[mincontig]
             reads = set()
-            for kmer in kmers:
-                reads = reads.union(self.kmers[kmer])
+            for kmercode in kmercodes:
+                reads = reads.union(self.kmers[kmercode])
+            kmers = set(self.kmer_sequence(k) for k in kmercodes)
             yield mincontig, maxcontig, kmers, reads
 
     def write(self, outstream=stdout):
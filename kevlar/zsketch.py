@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of kevlar (http://github.com/dib-lab/kevlar) and is
+# licensed under the MIT license: see LICENSE.
+# -----------------------------------------------------------------------------
+
+"""
+Block-compressed k-mer sketches.
+
+Most bins of a sketch are empty, so sketch tables compress very well. A
+`.zsketch` file holds a JSON header describing the sketch (as in a `.mmsketch`
+file), followed by the sketch's tables split into fixed-size blocks, each
+compressed independently with zlib, and finally an index of compressed block
+sizes. Blocks are compressed and decompressed in parallel by a pool of threads
+(zlib releases the GIL), and when loading, each block is decompressed directly
+into the corresponding bins of a newly allocated khmer sketch, with no
+uncompressed copy of the entire file.
+
+khmer's occupancy counters are not updated when tables are filled directly, so
+the occupancy and false positive rate of a sketch loaded from a `.zsketch`
+file should be taken from its header (see `kevlar.sketch.cached_fpr`).
+"""
+
+import builtins
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import struct
+import zlib
+import numpy
+import kevlar
+
+
+MAGIC = b'KVLRZSKT'
+EXTENSION = '.zsketch'
+BLOCKSIZE = 1 << 22
+
+
+class KevlarCompressedSketchError(ValueError):
+    pass
+
+
+def is_zsketch(filename):
+    """Determine whether a file is a `.zsketch` file from its contents."""
+    try:
+        with builtins.open(filename, 'rb') as fh:
+            return fh.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def read_header(filename):
+    """
+    Read the header of a `.zsketch` file without reading its tables.
+
+    Returns the header and the offset at which the header ends.
+    """
+    with builtins.open(filename, 'rb') as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            message = 'not a compressed sketch file: ' + filename
+            raise KevlarCompressedSketchError(message)
+        headerlength, = struct.unpack('<Q', fh.read(8))
+        header = json.loads(fh.read(headerlength).decode('utf-8'))
+    return header, len(MAGIC) + 8 + headerlength
+
+
+def table_blocks(tablebytes, blocksize):
+    """Enumerate the (table, offset) of each block of a sketch's tables."""
+    return [
+        (i, offset) for i, nbytes in enumerate(tablebytes)
+        for offset in range(0, nbytes, blocksize)
+    ]
+
+
+def save(sketch, filename, fpr=None, metadata=None, threads=None, level=6,
+         blocksize=BLOCKSIZE):
+    """
+    Save a sketch in the `.zsketch` format.
+
+    The header is as described for `kevlar.mmsketch.save`. Up to `threads`
+    blocks of `blocksize` bytes are compressed in parallel with the specified
+    zlib compression `level`.
+    """
+    if threads is None:
+        threads = kevlar.pipeio.default_threads()
+    tables = [numpy.frombuffer(t, dtype=numpy.uint8)
+              for t in sketch.get_raw_tables()]
+    header = kevlar.sketch.describe(sketch, fpr=fpr, metadata=metadata)
+    header.update({
+        'version': 1,
+        'tablebytes': [len(table) for table in tables],
+        'blocksize': blocksize,
+    })
+    headerdata = json.dumps(header).encode('utf-8')
+
+    def compress(block):
+        i, offset = block
+        return zlib.compress(tables[i][offset:offset + blocksize], level)
+
+    index = list()
+    pending = deque()
+    with builtins.open(filename, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<Q', len(headerdata)))
+        fh.write(headerdata)
+        with ThreadPoolExecutor(threads) as executor:
+            for block in table_blocks(header['tablebytes'], blocksize):
+                pending.append(executor.submit(compress, block))
+                if len(pending) >= threads * 4:
+                    data = pending.popleft().result()
+                    fh.write(data)
+                    index.append(len(data))
+            while pending:
+                data = pending.popleft().result()
+                fh.write(data)
+                index.append(len(data))
+        indexoffset = fh.tell()
+        fh.write(json.dumps(index).encode('utf-8'))
+        fh.write(struct.pack('<Q', indexoffset))
+
+
+def inflate_block(data, table, offset, blocksize):
+    block = zlib.decompress(data)
+    if len(block) != min(blocksize, len(table) - offset):
+        raise KevlarCompressedSketchError('corrupted compressed sketch block')
+    table[offset:offset + len(block)] = numpy.frombuffer(block, numpy.uint8)
+
+
+def load(filename, threads=None):
+    """
+    Load a sketch from a `.zsketch` file.
+
+    A khmer sketch of the type and table sizes recorded in the header is
+    allocated, and up to `threads` blocks are decompressed in parallel
+    directly into its tables.
+    """
+    if threads is None:
+        threads = kevlar.pipeio.default_threads()
+    header, offset = read_header(filename)
+    if header['sketchtype'] not in kevlar.mmsketch.sketch_types:
+        message = 'unsupported sketch type ' + header['sketchtype']
+        raise KevlarCompressedSketchError(message)
+    sketchtype = kevlar.mmsketch.sketch_types[header['sketchtype']]
+    sizes = header['tablesizes']
+    sketch = sketchtype(header['ksize'], sizes[0] + 1, len(sizes))
+    tables = [numpy.asarray(t) for t in sketch.get_raw_tables()]
+    if sketch.hashsizes() != sizes or \
+            [len(t) for t in tables] != header['tablebytes']:
+        message = 'unable to allocate a sketch with the table sizes of '
+        message += filename
+        raise KevlarCompressedSketchError(message)
+
+    blocksize = header['blocksize']
+    blocks = table_blocks(header['tablebytes'], blocksize)
+    filesize = os.path.getsize(filename)
+    pending = deque()
+    with builtins.open(filename, 'rb') as fh:
+        fh.seek(filesize - 8)
+        indexoffset, = struct.unpack('<Q', fh.read(8))
+        fh.seek(indexoffset)
+        index = json.loads(fh.read(filesize - 8 - indexoffset).decode('utf-8'))
+        if len(index) != len(blocks):
+            message = 'corrupted compressed sketch file: ' + filename
+            raise KevlarCompressedSketchError(message)
+        fh.seek(offset)
+        with ThreadPoolExecutor(threads) as executor:
+            for (i, tableoffset), nbytes in zip(blocks, index):
+                data = fh.read(nbytes)
+                pending.append(executor.submit(
+                    inflate_block, data, tables[i], tableoffset, blocksize
+                ))
+                if len(pending) >= threads * 4:
+                    pending.popleft().result()
+            while pending:
+                pending.popleft().result()
+    return sketch
@@ -45,8 +45,8 @@ setup(name='biokevlar',
       },
       include_package_data=True,
       ext_modules=[ksw2, fermilite],
-      setup_requires=['pysam', 'networkx>=2.0', 'pandas'],
-      install_requires=['pysam', 'networkx>=2.0', 'pandas'],
+      setup_requires=['pysam', 'networkx>=2.0', 'pandas', 'numpy'],
+      install_requires=['pysam', 'networkx>=2.0', 'pandas', 'numpy'],
       entry_points={
           'console_scripts': ['kevlar = kevlar.__main__:main']
       },